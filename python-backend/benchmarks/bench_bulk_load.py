@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+bench_bulk_load.py
+
+Rows/sec loading synthetic item_to_row() rows into an empty (cold) and an already
+populated (warm) database:
+ - upsert: upsert_rows() in batches of --batch-size, one commit per batch (the default writer)
+ - bulk:   stage_rows() into the TEMP table + one merge_staging() transaction and ANALYZE (--bulk)
+
+Usage: python benchmarks/bench_bulk_load.py [--rows 100000] [--batch-size 500]
+"""
+
+import argparse
+import datetime as dt
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hh_pipeline_sqlite as hh  # noqa: E402
+
+KEYWORDS = ["Python", "Data Analyst", "Frontend", "Designer", "Marketing"]
+CITIES = [(160, "Алматы"), (159, "Астана"), (205, "Шымкент")]
+
+def make_rows(n, seed=11):
+    rnd = random.Random(seed)
+    start = dt.datetime(2025, 1, 1, tzinfo=dt.timezone(dt.timedelta(hours=5)))
+    rows = []
+    for i in range(n):
+        area_id, city = CITIES[i % len(CITIES)]
+        published = start + dt.timedelta(seconds=rnd.randrange(0, 365 * 86400))
+        item = {
+            "id": str(i),
+            "name": f"{'Junior ' if i % 4 == 0 else ''}Vacancy {i}",
+            "alternate_url": f"https://hh.ru/vacancy/{i}",
+            "employer": {"name": f"Employer {i % 997}"},
+            "area": {"id": str(area_id), "name": city},
+            "published_at": published.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "salary": {"from": rnd.randrange(150_000, 900_000, 10_000), "to": None, "currency": "KZT"} if i % 2 else None,
+            "snippet": {"requirement": "Знание Python, SQL. " * 3, "responsibility": "Разработка сервисов. " * 3},
+        }
+        rows.append(hh.item_to_row(item, KEYWORDS[i % len(KEYWORDS)], hh.DEFAULT_KZT_RATES, "KZ"))
+    return rows
+
+def load_upsert(path, rows, batch_size):
+    con = hh.init_db(path)
+    for i in range(0, len(rows), batch_size):
+        hh.upsert_rows(con, rows[i:i + batch_size])
+    con.close()
+
+def load_bulk(path, rows, batch_size):
+    con = hh.init_db(path)
+    hh.apply_bulk_pragmas(con)
+    for i in range(0, len(rows), batch_size):
+        hh.stage_rows(con, rows[i:i + batch_size])
+    hh.merge_staging(con)
+    con.commit()
+    hh.analyze_after_bulk(con)
+    con.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load vs per-batch upsert benchmark")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"Building {args.rows} rows...")
+    rows = make_rows(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, load in (("upsert", load_upsert), ("bulk", load_bulk)):
+            path = Path(tmp) / f"{label}.db"
+            for phase in ("cold", "warm"):
+                t = time.perf_counter()
+                load(path, rows, args.batch_size)
+                elapsed = time.perf_counter() - t
+                print(f"{label:<7} {phase:<5} {elapsed:7.2f} s  {args.rows / elapsed:10.0f} rows/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+bench_dedupe.py
+
+Near-duplicate clustering (hh_dedupe.update_clusters) on synthetic tables of growing size,
+a fraction of them reposts of another vacancy (other city, a word or two changed):
+ - full: cluster the whole table from scratch; rows/sec should stay roughly flat as the
+   table grows (LSH lookups, not pairwise comparison)
+ - incremental: add --new rows to the clustered table and cluster only those
+ - found/expected: reposts put in the same cluster as their original
+ - templated: one search as hh_api_stub.py serves it, a few title and requirement templates
+   with only the employer differing, so every row shares bands with most others; time and
+   compared pairs should grow linearly, not with the square of the table
+
+Usage: python benchmarks/bench_dedupe.py [--sizes 10000,20000,40000] [--new 1000] [--repost-share 0.2]
+                                        [--templated-sizes 1000,4000,12000]
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hh_dedupe  # noqa: E402
+import hh_pipeline_sqlite as hh  # noqa: E402
+from hh_api_stub import StubDataset  # noqa: E402
+
+WORDS = ("python sql git docker linux api rest django flask postgres redis kafka английский "
+         "аналитика отчеты excel 1с бухгалтерия продажи клиенты коммуникабельность ответственность "
+         "обучение команда проект опыт знание умение работа офис график доставка склад").split()
+# real requirement snippets draw on thousands of words; with only the ones above every pair of rows
+# would share bigrams and LSH would (correctly) report them all as candidates
+_syllables = random.Random(0)
+_SYLLABLES = "ка ло ре ми ста ни про дек тор ан".split()
+VOCABULARY = WORDS + ["".join(_syllables.choice(_SYLLABLES) for _ in range(3)) + str(i) for i in range(3000)]
+TITLES = ("Python разработчик", "Аналитик данных", "Менеджер по продажам", "Бухгалтер", "QA инженер",
+          "Оператор call-центра", "Frontend разработчик", "Специалист поддержки", "Кладовщик", "Дизайнер")
+CITIES = ("Алматы", "Астана", "Шымкент", "Караганда", "Актобе", "Павлодар")
+
+
+def make_rows(n, start, repost_share, rnd, originals):
+    rows = []
+    for i in range(start, start + n):
+        if originals and rnd.random() < repost_share:
+            src, title, employer, words = rnd.choice(originals)
+            words = list(words)
+            words[rnd.randrange(len(words))] = rnd.choice(VOCABULARY)
+        else:
+            src = i
+            title, employer = f"{rnd.choice(TITLES)} {i % 97}", f"ТОО Компания {i}"
+            words = [rnd.choice(VOCABULARY) for _ in range(30)]
+            originals.append((i, title, employer, words))
+        rows.append((f"https://hh.kz/vacancy/{i}", title, employer, rnd.choice(CITIES), " ".join(words), f"h{i}", src))
+    return rows
+
+
+def templated_rows(n):
+    """
+    The first n vacancies the stub returns for one search, as the pipeline stores them.
+    """
+    dataset = StubDataset(per_keyword=n)
+    return [hh.item_to_row(dataset.item("Python", 40, i), "Python", country="KZ") for i in range(n)]
+
+
+def exact_copies(rows):
+    """
+    Rows whose title, employer and requirements repeat an earlier row's.
+    """
+    cols = [hh.ROW_COLUMNS.index(c) for c in ('title', 'employer', 'requirements')]
+    texts = {hh_dedupe.text_hash(hh_dedupe.dedupe_words(*(r[c] for c in cols))) for r in rows}
+    return len(rows) - len(texts)
+
+
+def insert(con, rows):
+    con.executemany("INSERT INTO vacancies (url, title, employer, city, requirements, content_hash) VALUES (?, ?, ?, ?, ?, ?);",
+                    [r[:6] for r in rows])
+    con.commit()
+
+
+def accuracy(con, rows):
+    """
+    (reposts clustered with their original, reposts).
+    """
+    cluster = dict(con.execute("SELECT url, cluster_id FROM vacancies;").fetchall())
+    by_src = {r[6]: cluster[r[0]] for r in rows if r[0].endswith(f"/{r[6]}")}
+    reposts = [r for r in rows if not r[0].endswith(f"/{r[6]}")]
+    return sum(cluster[r[0]] == by_src.get(r[6]) for r in reposts), len(reposts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH near-duplicate clustering benchmark")
+    parser.add_argument('--sizes', default="10000,20000,40000")
+    parser.add_argument('--new', type=int, default=1000)
+    parser.add_argument('--repost-share', type=float, default=0.2)
+    parser.add_argument('--templated-sizes', default="1000,4000,12000")
+    args = parser.parse_args()
+
+    print(f"MinHash: {'numpy' if hh_dedupe.np is not None else 'pure Python'}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        rnd = random.Random(size)
+        originals = []
+        rows = make_rows(size, 0, args.repost_share, rnd, originals)
+        with tempfile.TemporaryDirectory() as tmp:
+            con = hh.init_db(Path(tmp) / "bench.db")
+            insert(con, rows)
+            t = time.perf_counter()
+            hh_dedupe.update_clusters(con)
+            full = time.perf_counter() - t
+            found, expected = accuracy(con, rows)
+            new = make_rows(args.new, size, args.repost_share, rnd, originals)
+            insert(con, new)
+            t = time.perf_counter()
+            hh_dedupe.update_clusters(con)
+            incremental = time.perf_counter() - t
+            con.close()
+        print(f"{size:>8} rows  full {full:7.2f} s ({size / full:8.0f} rows/sec)  "
+              f"+{args.new} incremental {incremental:6.2f} s  reposts found {found}/{expected}")
+
+    for size in (int(s) for s in args.templated_sizes.split(",")):
+        rows = templated_rows(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            con = hh.init_db(Path(tmp) / "bench.db")
+            hh.upsert_rows(con, rows)
+            t = time.perf_counter()
+            stats = hh_dedupe.update_clusters(con)
+            full = time.perf_counter() - t
+            con.close()
+        print(f"{size:>8} rows  templated {full:7.2f} s ({size / full:8.0f} rows/sec)  "
+              f"{stats['compared']} pairs compared  copies found {stats['duplicates']}/{exact_copies(rows)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+bench_item_ingest.py
+
+Rows/sec turning raw /vacancies response bytes into DB rows (decode + item_to_row for a page),
+the CPU-bound part of each fetch worker:
+ - legacy: requests-style text decode + json.loads, published_at parsed by strptime in the
+   fetch loop and again in item_to_row, raw item re-encoded with json.dumps
+ - stdlib: current page_to_rows() without orjson (single parse, compact json.dumps)
+ - orjson: current path with orjson installed (orjson.loads on the bytes, orjson.dumps per item)
+
+Usage: python benchmarks/bench_item_ingest.py [--pages 200] [--per-page 100]
+"""
+
+import argparse
+import datetime as dt
+import json
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hh_client  # noqa: E402
+import hh_pipeline_sqlite as hh  # noqa: E402
+
+def make_item(i):
+    # shaped like a real /vacancies search item, nested objects included
+    published = dt.datetime(2025, 11, 1, tzinfo=dt.timezone(dt.timedelta(hours=5))) - dt.timedelta(minutes=i)
+    return {
+        "id": str(100000000 + i), "premium": False, "name": f"Junior <highlighttext>Python</highlighttext> разработчик {i}",
+        "department": None, "has_test": False, "response_letter_required": False,
+        "area": {"id": "160", "name": "Алматы", "url": "https://api.hh.ru/areas/160"},
+        "salary": {"from": 300000 + i, "to": 450000, "currency": "KZT", "gross": False} if i % 2 else None,
+        "type": {"id": "open", "name": "Открытая"},
+        "address": {"city": "Алматы", "street": "проспект Абая", "building": str(i % 200), "lat": 43.238, "lng": 76.945,
+                    "raw": f"Алматы, проспект Абая, {i % 200}", "metro": None, "metro_stations": []},
+        "response_url": None, "sort_point_distance": None,
+        "published_at": published.strftime("%Y-%m-%dT%H:%M:%S%z"), "created_at": published.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "archived": False, "apply_alternate_url": f"https://hh.kz/applicant/vacancy_response?vacancyId={100000000 + i}",
+        "insider_interview": None, "url": f"https://api.hh.ru/vacancies/{100000000 + i}?host=hh.kz",
+        "alternate_url": f"https://hh.kz/vacancy/{100000000 + i}", "relations": [],
+        "employer": {"id": str(5000 + i % 300), "name": f"ТОО Компания {i % 300}", "url": f"https://api.hh.ru/employers/{5000 + i % 300}",
+                     "alternate_url": f"https://hh.kz/employer/{5000 + i % 300}",
+                     "logo_urls": {"90": "https://img.hhcdn.ru/employer-logo/1.png", "240": "https://img.hhcdn.ru/employer-logo/2.png",
+                                   "original": "https://img.hhcdn.ru/employer-logo-original/3.png"},
+                     "vacancies_url": f"https://api.hh.ru/vacancies?employer_id={5000 + i % 300}", "accredited_it_employer": False,
+                     "trusted": True},
+        "snippet": {"requirement": "Знание <highlighttext>Python</highlighttext>, SQL. Без опыта, рассматриваем студентов.",
+                    "responsibility": "Разработка и сопровождение внутренних сервисов, написание тестов, код-ревью."},
+        "contacts": None, "schedule": {"id": "fullDay", "name": "Полный день"},
+        "working_days": [], "working_time_intervals": [], "working_time_modes": [], "accept_temporary": False,
+        "professional_roles": [{"id": "96", "name": "Программист, разработчик"}], "accept_incomplete_resumes": True,
+        "experience": {"id": "noExperience", "name": "Нет опыта"}, "employment": {"id": "full", "name": "Полная занятость"},
+        "adv_response_url": None, "is_adv_vacancy": False, "adv_context": None,
+    }
+
+def make_page(per_page, page):
+    items = [make_item(page * per_page + i) for i in range(per_page)]
+    return json.dumps({"items": items, "found": 10 ** 5, "pages": 20, "page": page, "per_page": per_page},
+                      ensure_ascii=False).encode("utf-8")
+
+def legacy_item_to_row(item, job_keyword, rates):
+    url = item.get('alternate_url')
+    title = hh.clean_highlight_tags(item.get('name'))
+    employer = hh.clean_highlight_tags((item.get('employer') or {}).get('name'))
+    city = hh.clean_highlight_tags((item.get('area') or {}).get('name'))
+    publish_date = item.get('published_at')
+    salary = hh.format_salary(item.get('salary'))
+    requirements = hh.clean_highlight_tags((item.get('snippet') or {}).get('requirement'))
+    responsibilities = hh.clean_highlight_tags((item.get('snippet') or {}).get('responsibility'))
+    raw_zlib = zlib.compress(json.dumps(item, ensure_ascii=False).encode('utf-8'), 6)
+    inserted_at = dt.datetime.now(hh.ALMATY_TZ).isoformat()
+    digest = hh.content_hash((title, employer, city, publish_date, salary, requirements, responsibilities))
+    friendly = hh.classify_student_friendly(title, requirements, job_keyword, employer)
+    salary_from, salary_to, salary_currency, salary_kzt = hh.parse_salary(item.get('salary'), rates)
+    published = dt.datetime.strptime(publish_date, "%Y-%m-%dT%H:%M:%S%z")
+    return (url, title, employer, city, publish_date, salary, requirements, responsibilities, job_keyword,
+            inserted_at, digest, friendly, hh.STUDENT_RULES_VERSION, salary_from, salary_to, salary_currency,
+            salary_kzt, int(published.timestamp()), hh.parse_area_id(item.get('area')), 'KZ', raw_zlib)
+
+def legacy(pages, rates):
+    n = 0
+    for body in pages:
+        data = json.loads(body.decode("utf-8"))
+        for it in data["items"]:
+            dt.datetime.strptime(it["published_at"], "%Y-%m-%dT%H:%M:%S%z")
+            legacy_item_to_row(it, "Python", rates)
+            n += 1
+    return n
+
+def current(pages, rates):
+    n = 0
+    for body in pages:
+        data = hh_client.orjson.loads(body) if hh_client.orjson is not None else json.loads(body.decode("utf-8"))
+        rows, _, _, _ = hh.page_to_rows(data["items"], "Python", rates, "KZ")
+        n += len(rows)
+    return n
+
+def run(label, fn, pages, rates):
+    t = time.perf_counter()
+    n = fn(pages, rates)
+    elapsed = time.perf_counter() - t
+    print(f"{label:<7} {n:>8} rows  {elapsed:7.2f} s  {n / elapsed:10.0f} rows/sec")
+    return n / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Page decode + item_to_row benchmark")
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--per-page', type=int, default=100)
+    args = parser.parse_args()
+
+    pages = [make_page(args.per_page, p) for p in range(args.pages)]
+    rates = dict(hh.DEFAULT_KZT_RATES)
+    fast = hh_client.orjson
+    base = run("legacy", legacy, pages, rates)
+    hh_client.orjson = hh.orjson = None
+    run("stdlib", current, pages, rates)
+    hh_client.orjson = hh.orjson = fast
+    if fast is None:
+        print("orjson  not installed, skipped")
+        return
+    best = run("orjson", current, pages, rates)
+    print(f"orjson path: {best / base:.2f}x legacy")
+
+if __name__ == "__main__":
+    main()
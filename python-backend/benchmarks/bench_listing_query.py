@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+bench_listing_query.py
+
+p50/p99 latency of the /hh-jobs listing query (student_friendly = 1, newest first, 20 per page)
+for page 1 and page 500:
+ - legacy: ORDER BY datetime(publish_date) DESC LIMIT/OFFSET (sorts the whole filtered set)
+ - offset: ORDER BY published_ts DESC, id DESC LIMIT/OFFSET on idx_student_published
+ - keyset: same order, WHERE (published_ts, id) < (cursor) LIMIT
+
+Usage: python benchmarks/bench_listing_query.py [--rows 200000] [--repeat 50]
+"""
+
+import argparse
+import datetime as dt
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hh_pipeline_sqlite as hh  # noqa: E402
+
+PAGE_SIZE = 20
+COLUMNS = "id, url, title, employer, city, publish_date, salary, requirements, responsibilities, job_keyword"
+
+LEGACY_SQL = f"""
+    SELECT {COLUMNS} FROM vacancies WHERE student_friendly = 1
+    ORDER BY datetime(publish_date) DESC LIMIT ? OFFSET ?
+"""
+OFFSET_SQL = f"""
+    SELECT {COLUMNS}, published_ts FROM vacancies WHERE student_friendly = 1
+    ORDER BY published_ts DESC, id DESC LIMIT ? OFFSET ?
+"""
+KEYSET_SQL = f"""
+    SELECT {COLUMNS}, published_ts FROM vacancies WHERE student_friendly = 1 AND (published_ts, id) < (?, ?)
+    ORDER BY published_ts DESC, id DESC LIMIT ?
+"""
+
+def build_db(path: Path, n, seed=7):
+    for suffix in ('', '-wal', '-shm'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    con = hh.init_db(path)
+    rnd = random.Random(seed)
+    start = dt.datetime(2025, 1, 1, tzinfo=dt.timezone(dt.timedelta(hours=5)))
+    rows = []
+    for i in range(n):
+        published = start + dt.timedelta(seconds=rnd.randrange(0, 365 * 86400))
+        rows.append((f"https://hh.ru/vacancy/{i}", f"Vacancy {i}", f"Employer {i % 997}", "Алматы",
+                     published.strftime("%Y-%m-%dT%H:%M:%S%z"), int(published.timestamp()),
+                     "Знание Python, SQL. " * 5, "Разработка сервисов. " * 5, rnd.random() < 0.5))
+    con.executemany("""
+        INSERT INTO vacancies (url, title, employer, city, publish_date, published_ts, requirements, responsibilities, student_friendly)
+        VALUES (?,?,?,?,?,?,?,?,?);
+    """, rows)
+    # the index the legacy query had (it can't use it for ORDER BY datetime(...), which is the point)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_publish_date ON vacancies(publish_date);")
+    con.commit()
+    con.execute("ANALYZE;")
+    return con
+
+def timings(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(round(0.99 * (len(samples) - 1))))]
+    return statistics.median(samples), p99
+
+def report(label, page, p50, p99):
+    print(f"{label:<8} page {page:<4} p50 {p50:9.3f} ms   p99 {p99:9.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="/hh-jobs listing query benchmark")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--db', default=None, help='Scratch DB path (default: in a temporary directory)')
+    args = parser.parse_args()
+
+    tmp = None if args.db else tempfile.mkdtemp()
+    db_path = Path(args.db) if args.db else Path(tmp) / "bench_listing.db"
+    try:
+        run(db_path, args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            Path(str(db_path) + suffix).unlink(missing_ok=True)
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def run(db_path: Path, args):
+    con = build_db(db_path, args.rows)
+    friendly = con.execute("SELECT COUNT(*) FROM vacancies WHERE student_friendly = 1;").fetchone()[0]
+    print(f"{args.rows} rows, {friendly} student-friendly, {PAGE_SIZE} per page")
+
+    for page in (1, 500):
+        offset = (page - 1) * PAGE_SIZE
+        if offset >= friendly:
+            print(f"page {page} is past the end; use more --rows")
+            continue
+        report("legacy", page, *timings(lambda: con.execute(LEGACY_SQL, (PAGE_SIZE, offset)).fetchall(), args.repeat))
+        report("offset", page, *timings(lambda: con.execute(OFFSET_SQL, (PAGE_SIZE, offset)).fetchall(), args.repeat))
+        if page == 1:
+            cursor = (2 ** 62, 2 ** 62)
+        else:
+            # the cursor a client would hold after reading page - 1
+            prev = con.execute(OFFSET_SQL, (PAGE_SIZE, offset - PAGE_SIZE)).fetchall()[-1]
+            cursor = (prev[-1], prev[0])
+        report("keyset", page, *timings(lambda: con.execute(KEYSET_SQL, (*cursor, PAGE_SIZE)).fetchall(), args.repeat))
+        assert con.execute(KEYSET_SQL, (*cursor, PAGE_SIZE)).fetchall() == con.execute(OFFSET_SQL, (PAGE_SIZE, offset)).fetchall()
+    con.close()
+
+if __name__ == "__main__":
+    main()
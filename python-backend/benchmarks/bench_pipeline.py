@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py
+
+End-to-end throughput of hh_pipeline_sqlite.py against the offline HH stub (hh_api_stub.py):
+each scenario crawls a fresh database in a child process and reports pages/sec, rows/sec,
+the child's peak RSS and the resulting DB size.
+
+Scenarios (vacancies = keywords x per-keyword, one country):
+ - 1k:   10 keywords x 100
+ - 100k: 50 keywords x 2000
+ - 1m:   100 keywords x 10000 (past HH's 2000-result cap, so every keyword is sharded)
+
+Usage: python benchmarks/bench_pipeline.py [--scenarios 1k,100k] [--latency-ms 0] [--error-rate 0]
+                                           [--workers 8] [--bulk] [-- extra pipeline args]
+"""
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from hh_api_stub import start_stub
+
+PIPELINE = Path(__file__).resolve().parent.parent / "hh_pipeline_sqlite.py"
+SCENARIOS = {
+    "1k": (10, 100),
+    "100k": (50, 2000),
+    "1m": (100, 10000),
+}
+
+def run_scenario(name, keywords, per_keyword, args, extra):
+    server, base_url, stats = start_stub(per_keyword=per_keyword, latency_ms=args.latency_ms,
+                                         error_rate=args.error_rate)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = Path(tmp) / "hhData"
+            data_dir.mkdir()
+            (data_dir / "keywords.txt").write_text("\n".join(f"Keyword {i}" for i in range(keywords)) + "\n",
+                                                  encoding="utf-8")
+            db_path = Path(tmp) / "vacancies.db"
+            cmd = [sys.executable, str(PIPELINE), "--hhData-dir", str(data_dir), "--db-path", str(db_path),
+                   "--api-url", base_url, "--rps", str(args.rps), "--workers", str(args.workers),
+                   "--max-retries", "5"]
+            if args.bulk:
+                cmd.append("--bulk")
+            cmd.extend(extra)
+            # a file, not a pipe: wait4() (for the child's peak RSS) would deadlock once the
+            # pipeline's warnings filled the pipe buffer
+            stderr_path = Path(tmp) / "stderr.log"
+            started = time.perf_counter()
+            with open(stderr_path, "w", encoding="utf-8") as stderr_file:
+                proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr_file)
+                _, status, usage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - started
+            stderr = stderr_path.read_text(encoding="utf-8", errors="replace")
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            if proc.returncode:
+                print(f"{name}: pipeline exited with {proc.returncode}\n{stderr[-2000:]}", file=sys.stderr)
+                return
+            con = sqlite3.connect(db_path)
+            rows = con.execute("SELECT count(*) FROM vacancies;").fetchone()[0]
+            con.close()
+            db_bytes = sum(p.stat().st_size for p in Path(tmp).glob("vacancies.db*"))
+    finally:
+        server.shutdown()
+    pages = stats[200]
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    print(f"{name:<5} {rows:>8} rows  {elapsed:8.1f} s  {pages / elapsed:8.1f} pages/s  {rows / elapsed:9.0f} rows/s  "
+          f"peak RSS {rss_mb:7.1f} MB  DB {db_bytes / 1e6:8.1f} MB  errors {stats[429] + stats[503]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline throughput benchmark against the offline HH stub")
+    parser.add_argument('--scenarios', default="1k,100k", help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rps', type=float, default=0, help='Pipeline --rps (0 = unlimited)')
+    parser.add_argument('--bulk', action='store_true', help='Run the pipeline with --bulk')
+    args, extra = parser.parse_known_args()
+    extra = [a for a in extra if a != "--"]
+
+    for name in args.scenarios.split(","):
+        name = name.strip().lower()
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+        keywords, per_keyword = SCENARIOS[name]
+        run_scenario(name, keywords, per_keyword, args, extra)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+bench_recommend.py
+
+Recommendation index (hh_recommend.py):
+ - query: top_k() latency (p50/p95 over --queries profile-sized queries) on indexes of --sizes
+   rows filled with Zipf-distributed terms, the shape real vacancy vectors have
+ - update: update_index() on a synthetic DB of --db-rows student-friendly vacancies, a full
+   build and then an incremental update after --changed vacancies were edited
+
+Usage: python benchmarks/bench_recommend.py [--sizes 100000,200000] [--queries 50] [--db-rows 20000] [--changed 200]
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hh_pipeline_sqlite as hh  # noqa: E402
+import hh_recommend as rec  # noqa: E402
+from hh_recommend import np  # noqa: E402
+
+WORDS = ("python sql git docker linux api rest django flask postgres redis kafka английский аналитика "
+         "отчеты excel бухгалтерия продажи клиенты коммуникабельность ответственность обучение команда "
+         "проект опыт знание умение работа офис график доставка склад стажировка студент").split()
+
+
+def fill_index(index_dir, rows, rnd):
+    index = rec.RecommendIndex.create(index_dir, capacity=rows)
+    vocabulary = 1 << rec.TERM_BITS
+    # Zipf-like: a few terms are in many vacancies, most in very few
+    terms = np.minimum(rnd.zipf(1.3, size=(rows, rec.TERMS_PER_ROW)) * 7919 % vocabulary, vocabulary - 1)
+    weights = rnd.random((rows, rec.TERMS_PER_ROW), dtype=np.float32)
+    weights /= np.linalg.norm(weights, axis=1, keepdims=True)
+    index.terms[:] = terms
+    index.weights[:] = weights
+    index.ids[:] = np.arange(1, rows + 1)
+    index.meta.update(rows=rows, docs=rows)
+    index.save()
+    return rec.RecommendIndex.open(index_dir)
+
+
+def bench_queries(sizes, queries):
+    rnd = np.random.default_rng(1)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = fill_index(Path(tmp), size, rnd)
+            timings = []
+            for _ in range(queries):
+                # a profile query: program + courses + transcript, ~150 distinct terms
+                query = (rnd.integers(0, 1 << rec.TERM_BITS, 150).astype(np.int32),
+                         rnd.random(150, dtype=np.float32))
+                started = time.perf_counter()
+                rec.top_k(index, query, 20)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(f"query  {size:>8} rows  p50 {1000 * timings[len(timings) // 2]:6.1f} ms  "
+                  f"p95 {1000 * timings[int(len(timings) * 0.95)]:6.1f} ms")
+
+
+def bench_update(db_rows, changed):
+    rnd = random.Random(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        con = hh.init_db(Path(tmp) / "bench.db")
+        con.executemany("""
+            INSERT INTO vacancies (url, title, requirements, responsibilities, content_hash, student_friendly)
+            VALUES (?, ?, ?, ?, ?, 1);
+        """, [(f"https://hh.kz/vacancy/{i}", " ".join(rnd.choices(WORDS, k=3)), " ".join(rnd.choices(WORDS, k=25)),
+               " ".join(rnd.choices(WORDS, k=15)), f"h{i}") for i in range(db_rows)])
+        con.commit()
+        started = time.perf_counter()
+        rec.update_index(con, Path(tmp) / "index")
+        full = time.perf_counter() - started
+        con.execute("UPDATE vacancies SET content_hash = content_hash || 'x', title = title || ' senior' "
+                    "WHERE id IN (SELECT id FROM vacancies ORDER BY random() LIMIT ?);", (changed,))
+        con.commit()
+        started = time.perf_counter()
+        rec.update_index(con, Path(tmp) / "index")
+        incremental = time.perf_counter() - started
+        con.close()
+    print(f"update {db_rows:>8} rows  full {full:6.2f} s ({db_rows / full:7.0f} rows/sec)  "
+          f"{changed} changed {incremental:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation index benchmark")
+    parser.add_argument('--sizes', default="100000,200000")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--db-rows', type=int, default=20000)
+    parser.add_argument('--changed', type=int, default=200)
+    args = parser.parse_args()
+    if np is None:
+        sys.exit("numpy is not installed")
+    bench_queries([int(s) for s in args.sizes.split(",")], args.queries)
+    bench_update(args.db_rows, args.changed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+bench_student_classifier.py
+
+Compare rows/sec of the student-friendly classification:
+ - legacy: the old SQL approach (reset table, ~17 phrases x 4 columns of lower(col) LIKE, extra junior UPDATE)
+ - python: classify_student_friendly() alone (what item_to_row pays per row at ingest)
+ - python+update: reclassifying a whole table with mark_student_friendly() after a rule-version bump
+
+It checks that the classifier agrees with the legacy rules row for row once SQLite's lower()
+folds Unicode like Python's (the only intended difference), and that a vacancy found again
+under another keyword (upsert_rows and the --bulk merge) keeps the flag its merged keywords
+and enriched details give it.
+
+Usage: python benchmarks/bench_student_classifier.py [--rows 100000]
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hh_pipeline_sqlite as hh  # noqa: E402
+
+TITLES = ['Junior Python Developer', 'Senior Backend Engineer', 'Стажер-аналитик', 'Менеджер по продажам',
+          'Data Analyst', 'Intern QA', 'Middle Frontend разработчик', 'Lead DevOps', 'Дизайнер', 'Trainee SOC']
+REQS = ['Опыт работы от 3 лет. Знание SQL.', 'Без опыта, обучение за счет компании.', 'Для студентов старших курсов.',
+        'Experience with Kubernetes, Terraform and AWS.', 'Готовы рассмотреть выпускников', None,
+        'Знание Python, Django, PostgreSQL. Опыт коммерческой разработки.']
+EMPLOYERS = ['Kaspi.kz', 'Beeline', 'Startup Hub', 'Jaryq Lab', 'АКСИОМА ПЛЮС', 'Halyk Bank']
+KEYWORDS = ['Developer', 'Designer', 'Data Analyst', 'QA Engineer', 'HR Manager']
+
+def legacy_sql_mark(conn: sqlite3.Connection):
+    """
+    The pre-classifier mark_student_friendly() body, kept verbatim (minus prints) for comparison.
+    """
+    cur = conn.cursor()
+
+    def build_like_clause(column_name, phrases):
+        parts = [f"lower({column_name}) LIKE ?" for _ in phrases]
+        if not parts:
+            return "1=0", []
+        return "(" + " OR ".join(parts) + ")", [f"%{p.lower()}%" for p in phrases]
+
+    keep_clauses = []
+    keep_params = []
+    for col in ('requirements', 'title', 'job_keyword', 'employer'):
+        clause, params = build_like_clause(col, hh.KEEP_PHRASES)
+        keep_clauses.append(clause)
+        keep_params.extend(params)
+    keep_sql = "(" + " OR ".join(keep_clauses) + ")"
+    exclude_clause, exclude_params = build_like_clause('title', hh.EXCLUDE_PHRASES)
+
+    cur.execute("UPDATE vacancies SET student_friendly = 0;")
+    conn.commit()
+    cur.execute(f"UPDATE vacancies SET student_friendly = 1 WHERE {keep_sql} AND NOT {exclude_clause};",
+                tuple(keep_params + exclude_params))
+    conn.commit()
+    cur.execute("UPDATE vacancies SET student_friendly = 1 WHERE (lower(title) LIKE ? OR lower(job_keyword) LIKE ?);",
+                ('%junior%', '%junior%'))
+    conn.commit()
+
+def build_db(path: Path, n, seed=42):
+    for suffix in ('', '-wal', '-shm'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    con = hh.init_db(path)
+    rnd = random.Random(seed)
+    rows = [(f"https://hh.ru/vacancy/{i}", rnd.choice(TITLES), rnd.choice(EMPLOYERS), rnd.choice(REQS), rnd.choice(KEYWORDS))
+            for i in range(n)]
+    con.executemany("INSERT INTO vacancies (url, title, employer, requirements, job_keyword) VALUES (?,?,?,?,?);", rows)
+    con.commit()
+    return con, rows
+
+def unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+def check_legacy_agreement(path: Path, rows, legacy, flags):
+    """
+    Rerun the legacy rules with a Unicode lower() and require the classifier to agree on every
+    row; returns how many rows the ASCII-only lower() of SQLite classified differently.
+    """
+    con = sqlite3.connect(path)
+    con.create_function("lower", 1, unicode_lower, deterministic=True)
+    legacy_sql_mark(con)
+    unicode_legacy = dict(con.execute("SELECT url, student_friendly FROM vacancies;").fetchall())
+    con.close()
+    mismatches = [(url, title, req, kw, emp, unicode_legacy[url], f)
+                  for (url, title, emp, req, kw), f in zip(rows, flags) if unicode_legacy[url] != f]
+    assert not mismatches, f"{len(mismatches)} rows classified unlike the legacy rules, e.g. {mismatches[:3]}"
+    return sum(1 for url in legacy if legacy[url] != unicode_legacy[url])
+
+def report(label, n, seconds):
+    print(f"{label:<16} {n:>9} rows  {seconds:8.3f}s  {n / seconds:>12,.0f} rows/sec")
+
+def check_keyword_merge(path: Path):
+    """
+    A vacancy stored under 'Junior Developer' and found again under 'Developer' stays student-friendly,
+    and so does one HH marks noExperience once its details are stored, through both write paths.
+    """
+    item = {'alternate_url': 'https://hh.ru/vacancy/1', 'name': 'Python Developer', 'employer': {'name': 'Kaspi.kz'},
+            'area': {'id': '160', 'name': 'Алматы'}, 'published_at': '2025-11-01T10:00:00+0500',
+            'snippet': {'requirement': 'Знание Python и SQL', 'responsibility': 'Писать код'}}
+    enriched = dict(item, alternate_url='https://hh.ru/vacancy/2')
+    for bulk in (False, True):
+        for suffix in ('', '-wal', '-shm'):
+            Path(str(path) + suffix).unlink(missing_ok=True)
+        con = hh.init_db(path)
+        hh.upsert_rows(con, [hh.item_to_row(item, 'Junior Developer'), hh.item_to_row(enriched, 'Developer')])
+        con.execute("INSERT INTO vacancy_details (vacancy_id, experience_id) SELECT id, 'noExperience' "
+                    "FROM vacancies WHERE url = ?;", (enriched['alternate_url'],))
+        hh.reclassify_vacancies(con, hh.vacancy_ids(con, [enriched['alternate_url']]))
+        con.commit()
+        again = [hh.item_to_row(item, 'Developer'), hh.item_to_row(enriched, 'Backend Developer')]
+        if bulk:
+            hh.apply_bulk_pragmas(con)
+            hh.stage_rows(con, again)
+            hh.merge_staging(con)
+            con.commit()
+        else:
+            hh.upsert_rows(con, again)
+        flags = con.execute("SELECT job_keyword, student_friendly FROM vacancies ORDER BY id;").fetchall()
+        assert flags == [('Junior Developer;Developer', 1), ('Developer;Backend Developer', 1)], flags
+        con.close()
+    for suffix in ('', '-wal', '-shm'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    print("keyword merge keeps student_friendly: ok")
+
+def main():
+    parser = argparse.ArgumentParser(description="Student-friendly classifier benchmark")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--db', default=None, help='Scratch DB path (default: in a temporary directory)')
+    args = parser.parse_args()
+
+    tmp = None if args.db else tempfile.mkdtemp()
+    db_path = Path(args.db) if args.db else Path(tmp) / "bench_classifier.db"
+    try:
+        run(db_path, args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            Path(str(db_path) + suffix).unlink(missing_ok=True)
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def run(db_path: Path, args):
+    con, rows = build_db(db_path, args.rows)
+
+    t = time.perf_counter()
+    legacy_sql_mark(con)
+    report("legacy SQL", args.rows, time.perf_counter() - t)
+    legacy = dict(con.execute("SELECT url, student_friendly FROM vacancies;").fetchall())
+
+    t = time.perf_counter()
+    flags = [hh.classify_student_friendly(title, req, kw, emp) for _, title, emp, req, kw in rows]
+    report("python", args.rows, time.perf_counter() - t)
+
+    con.execute("UPDATE vacancies SET student_rules_version = NULL;")
+    con.commit()
+    t = time.perf_counter()
+    hh.mark_student_friendly(con)
+    report("python+update", args.rows, time.perf_counter() - t)
+
+    con.close()
+    # SQLite's lower() only folds ASCII, so the legacy rules miss capitalised Cyrillic phrases
+    folded = check_legacy_agreement(db_path, rows, legacy, flags)
+    print(f"agrees with the legacy rules: ok ({folded} rows differ only by Unicode lowercasing)")
+    check_keyword_merge(db_path)
+
+if __name__ == "__main__":
+    main()
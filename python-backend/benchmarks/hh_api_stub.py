@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+hh_api_stub.py
+
+Local stand-in for the parts of api.hh.ru the pipeline calls (/vacancies, /vacancies/{id},
+/areas, /areas/{id}, /dictionaries), so the pipeline can be run and benchmarked offline:
+
+    python benchmarks/hh_api_stub.py --port 8765 --per-keyword 5000 --latency-ms 40 --error-rate 0.01
+    python hh_pipeline_sqlite.py --api-url http://127.0.0.1:8765 --db-path /tmp/bench.db
+
+Every search text gets its own synthetic result set of --per-keyword vacancies, spread
+round-robin over the sub-areas of each country and published one every --spacing seconds
+going back from server start. Items are built on demand, so a 1M-vacancy scenario costs
+no memory. Like HH it honours area, date_from/date_to, page/per_page and only pages
+through the first 2000 results, so query sharding is exercised too.
+
+--items FILE replays recorded HH items (a JSON list or JSON lines, e.g. from vacancy_raw)
+as templates instead of the built-in ones; ids, urls, areas and dates are still synthetic.
+--error-rate answers that share of /vacancies requests with 503 or 429 (Retry-After: 0).
+/vacancies/{id} sends an ETag and Last-Modified and answers If-None-Match with 304.
+"""
+
+import argparse
+import datetime as dt
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_RESULTS = 2000
+TZ = dt.timezone(dt.timedelta(hours=5))
+COUNTRIES = {
+    40: ("Казахстан", [(160, "Алматы"), (159, "Астана"), (205, "Шымкент"), (177, "Караганда"),
+                      (215, "Актобе"), (213, "Павлодар"), (210, "Усть-Каменогорск"), (212, "Тараз")]),
+    97: ("Узбекистан", [(2759, "Ташкент"), (2760, "Самарканд")]),
+    48: ("Кыргызстан", [(2757, "Бишкек"), (2758, "Ош")]),
+    113: ("Россия", [(1, "Москва"), (2, "Санкт-Петербург"), (3, "Екатеринбург")]),
+}
+LEVELS = ["Junior", "Middle", "Senior", "Стажер", "Intern", "Lead"]
+REQUIREMENTS = [
+    "Без опыта, для студентов. Знание <highlighttext>Python</highlighttext> и SQL.",
+    "Опыт работы от 3 лет. Уверенное знание английского языка.",
+    "Студенты старших курсов. Готовность обучаться.",
+    "Опыт коммерческой разработки от 1 года, Git, Docker.",
+]
+CURRENCIES = [("KZT", 1.0), ("RUR", 0.0125), ("USD", 0.0019)]
+EXPERIENCE = [("noExperience", "Нет опыта"), ("between1And3", "От 1 года до 3 лет"),
+              ("between3And6", "От 3 до 6 лет"), ("moreThan6", "Более 6 лет")]
+
+
+class StubDataset:
+    """
+    Deterministic synthetic HH search results. Vacancy n of a search text (n = 0 is the
+    newest) lives in sub-area n % len(areas) and was published at start - n * spacing.
+    """
+    def __init__(self, per_keyword=1000, spacing=60, seed=7, templates=None):
+        self.per_keyword = per_keyword
+        self.spacing = max(1, spacing)
+        self.seed = seed
+        self.templates = templates or []
+        self.start = int(time.time())
+        self.area_index = {}
+        for country, (_, cities) in COUNTRIES.items():
+            for i, (city_id, city) in enumerate(cities):
+                self.area_index[city_id] = (country, i, city)
+
+    def _window(self, date_from, date_to):
+        lo_n, hi_n = 0, self.per_keyword - 1
+        if date_to is not None:
+            lo_n = max(lo_n, -(-(self.start - date_to) // self.spacing))
+        if date_from is not None:
+            hi_n = min(hi_n, (self.start - date_from) // self.spacing)
+        return lo_n, hi_n
+
+    def matches(self, area, date_from=None, date_to=None):
+        """
+        (first, step, count): the matching vacancy numbers are first + k * step, k < count.
+        """
+        lo_n, hi_n = self._window(date_from, date_to)
+        if area in COUNTRIES:
+            first, step = lo_n, 1
+        elif area in self.area_index:
+            country, i, _ = self.area_index[area]
+            step = len(COUNTRIES[country][1])
+            first = lo_n + (i - lo_n) % step
+        else:
+            return 0, 1, 0
+        count = 0 if first > hi_n else (hi_n - first) // step + 1
+        return first, step, count
+
+    def item(self, text, country, n):
+        key = zlib.crc32(f"{text}|{country}".encode("utf-8"))
+        vid = key * 10_000_000 + n
+        cities = COUNTRIES[country][1]
+        city_id, city = cities[n % len(cities)]
+        rnd = random.Random(vid ^ self.seed)
+        published = dt.datetime.fromtimestamp(self.start - n * self.spacing, TZ)
+        if self.templates:
+            item = json.loads(json.dumps(self.templates[n % len(self.templates)]))
+        else:
+            currency, per_kzt = rnd.choice(CURRENCIES)
+            salary_from = int(rnd.randrange(150_000, 900_000, 10_000) * per_kzt)
+            item = {
+                "name": f"{LEVELS[n % len(LEVELS)]} <highlighttext>{text}</highlighttext>",
+                "employer": {"name": f"Employer {n % 997}"},
+                "salary": {"from": salary_from, "to": salary_from * 2 if n % 3 else None,
+                           "currency": currency, "gross": False} if n % 2 else None,
+                "snippet": {"requirement": REQUIREMENTS[n % len(REQUIREMENTS)],
+                            "responsibility": f"Разработка и поддержка сервисов ({text})."},
+            }
+        item.update({
+            "id": str(vid),
+            "alternate_url": f"https://hh.kz/vacancy/{vid}",
+            "area": {"id": str(city_id), "name": city},
+            "published_at": published.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        })
+        return item
+
+    def details(self, vid):
+        """
+        /vacancies/{id} body for an id produced by item(), or None.
+        """
+        n = vid % 10_000_000
+        if n >= self.per_keyword:
+            return None
+        experience = EXPERIENCE[n % len(EXPERIENCE)]
+        published = dt.datetime.fromtimestamp(self.start - n * self.spacing, TZ)
+        return {
+            "id": str(vid),
+            "name": f"{LEVELS[n % len(LEVELS)]} vacancy {vid}",
+            "description": (f"<p><strong>Обязанности:</strong></p><ul><li>Разработка сервисов</li>"
+                            f"<li>Код-ревью &amp; тесты</li></ul><p>{REQUIREMENTS[n % len(REQUIREMENTS)]}</p>"),
+            "key_skills": [{"name": "Python"}, {"name": "SQL"}],
+            "experience": {"id": experience[0], "name": experience[1]},
+            "employment": {"id": "full", "name": "Полная занятость"},
+            "schedule": {"id": "fullDay", "name": "Полный день"},
+            "alternate_url": f"https://hh.kz/vacancy/{vid}",
+            "published_at": published.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+
+    def search(self, text, area, page, per_page, date_from=None, date_to=None):
+        country = area if area in COUNTRIES else self.area_index.get(area, (None,))[0]
+        first, step, found = self.matches(area, date_from, date_to)
+        reachable = min(found, MAX_RESULTS)
+        start = page * per_page
+        items = [self.item(text, country, first + k * step)
+                 for k in range(start, min(start + per_page, reachable))] if country else []
+        return {"items": items, "found": found, "pages": -(-reachable // per_page),
+                "page": page, "per_page": per_page}
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return int(dt.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z").timestamp())
+    except ValueError:
+        return int(dt.datetime.fromisoformat(value).timestamp())
+
+
+def make_handler(dataset, latency=0.0, error_rate=0.0, stats=None, stats_lock=None):
+    stats = stats if stats is not None else Counter()
+    stats_lock = stats_lock or threading.Lock()
+    rnd = random.Random(dataset.seed)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+            with stats_lock:
+                stats[status] += 1
+                stats["bytes"] += len(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if latency:
+                time.sleep(latency)
+            if url.path == "/vacancies":
+                with stats_lock:
+                    fail = rnd.random() < error_rate
+                if fail:
+                    status = 429 if rnd.random() < 0.5 else 503
+                    return self._send(status, {"errors": [{"type": "stub"}]}, {"Retry-After": "0"})
+                text = params.get("text", "").split(":", 1)[-1]
+                try:
+                    body = dataset.search(text, int(params.get("area", 40)), int(params.get("page", 0)),
+                                          int(params.get("per_page", 20)), _parse_time(params.get("date_from")),
+                                          _parse_time(params.get("date_to")))
+                except ValueError as exc:
+                    return self._send(400, {"errors": [{"type": "bad_argument", "value": str(exc)}]})
+                return self._send(200, body)
+            if url.path.startswith("/vacancies/"):
+                try:
+                    body = dataset.details(int(url.path.rsplit("/", 1)[1]))
+                except ValueError:
+                    body = None
+                if body is None:
+                    return self._send(404, {"errors": [{"type": "not_found"}]})
+                etag = f'"{zlib.crc32(json.dumps(body, sort_keys=True).encode("utf-8")):08x}"'
+                published = dt.datetime.strptime(body["published_at"], "%Y-%m-%dT%H:%M:%S%z")
+                headers = {"ETag": etag, "Last-Modified": formatdate(published.timestamp(), usegmt=True)}
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, None, headers)
+                return self._send(200, body, headers)
+            if url.path == "/areas":
+                return self._send(200, [
+                    {"id": str(cid), "name": name, "parent_id": None,
+                     "areas": [{"id": str(aid), "name": city, "parent_id": str(cid), "areas": []} for aid, city in cities]}
+                    for cid, (name, cities) in COUNTRIES.items()])
+            if url.path.startswith("/areas/"):
+                try:
+                    aid = int(url.path.rsplit("/", 1)[1])
+                except ValueError:
+                    return self._send(404, {"errors": [{"type": "not_found"}]})
+                if aid in COUNTRIES:
+                    name, cities = COUNTRIES[aid]
+                    return self._send(200, {"id": str(aid), "name": name, "areas": [
+                        {"id": str(c), "name": city, "areas": []} for c, city in cities]})
+                if aid in dataset.area_index:
+                    return self._send(200, {"id": str(aid), "name": dataset.area_index[aid][2], "areas": []})
+                return self._send(404, {"errors": [{"type": "not_found"}]})
+            if url.path == "/dictionaries":
+                return self._send(200, {"currency": [{"code": "RUR", "rate": 1.0}, {"code": "KZT", "rate": 6.4},
+                                                     {"code": "USD", "rate": 0.0123}]})
+            return self._send(404, {"errors": [{"type": "not_found"}]})
+
+    return Handler
+
+
+def load_templates(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def start_stub(port=0, per_keyword=1000, latency_ms=0.0, error_rate=0.0, spacing=60, templates=None, seed=7):
+    """
+    Serve the stub from a daemon thread. Returns (server, base_url, stats); stats counts
+    responses per status plus 'bytes'. Call server.shutdown() when done.
+    """
+    dataset = StubDataset(per_keyword=per_keyword, spacing=spacing, seed=seed, templates=templates)
+    stats = Counter()
+    handler = make_handler(dataset, latency=latency_ms / 1000.0, error_rate=error_rate, stats=stats)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="hh-api-stub", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}", stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline HH API stub")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--per-keyword', type=int, default=1000, help='Vacancies found per search text and country')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of /vacancies requests answered 429/503')
+    parser.add_argument('--spacing', type=int, default=60, help='Seconds between consecutive publications')
+    parser.add_argument('--items', default=None, help='Recorded HH items (JSON list or JSON lines) to use as templates')
+    args = parser.parse_args()
+
+    templates = load_templates(args.items) if args.items else None
+    server, base_url, stats = start_stub(args.port, args.per_keyword, args.latency_ms, args.error_rate,
+                                         args.spacing, templates)
+    print(f"HH API stub at {base_url} ({args.per_keyword} vacancies per keyword). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(", ".join(f"{k}: {v}" for k, v in sorted(stats.items(), key=lambda kv: str(kv[0]))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from hh_metrics import Metrics
+
+# optional fast JSON backend: decodes response bytes directly, without requests' text round-trip
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
+API_URL = "https://api.hh.ru"
+USER_AGENT = "UniTalentHHPipeline/1.0"
+
+# worth retrying: rate limited or the API/edge is having a moment
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all fetch workers.
+    rate: requests per second (<= 0 disables limiting)
+    burst: max tokens that can accumulate (default: max(1, rate))
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HHClient:
+    """
+    HH API client shared by all fetch workers: one keep-alive session whose
+    connection pool is sized to the worker count, a shared rate limiter, and
+    retries with exponential backoff + full jitter that honour Retry-After.
+    status_counts tracks responses per HTTP status plus 'error' (no response)
+    and 'retry' (attempts that were retried). metrics (hh_metrics.Metrics) gets
+    per-attempt latency by status, rate-limit waits, response bytes and JSON
+    decode time.
+    """
+    def __init__(self, workers=4, rps=2.0, max_retries=5, backoff_base=0.5, backoff_max=30.0,
+                 timeout=10, base_url=API_URL, limiter=None, metrics=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter if limiter is not None else TokenBucket(rps)
+        self.status_counts = Counter()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._counts_lock = threading.Lock()
+
+        self.session = requests.Session()
+        pool_size = max(1, workers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept": "application/json"})
+
+    def close(self):
+        self.session.close()
+
+    def _count(self, key):
+        with self._counts_lock:
+            self.status_counts[key] += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, path, params=None, headers=None, allow_statuses=()):
+        """
+        GET base_url + path with rate limiting and retries.
+        Returns the final Response (any status < 400, e.g. 200 or 304, or one of
+        allow_statuses such as 404) or None when every attempt failed.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            with self.metrics.timer("rate_limit_wait_seconds"):
+                self.limiter.acquire()
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                resp = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except RequestException as exc:
+                self.metrics.observe("http_request_seconds", time.perf_counter() - started, status="error")
+                self._count("error")
+                error = exc
+            else:
+                self.metrics.observe("http_request_seconds", time.perf_counter() - started, status=resp.status_code)
+                self.metrics.inc("http_response_bytes_total", len(resp.content))
+                self._count(resp.status_code)
+                if resp.status_code < 400 or resp.status_code in allow_statuses:
+                    return resp
+                error = f"HTTP {resp.status_code}"
+                if resp.status_code not in RETRY_STATUSES:
+                    print(f"[ERROR] GET {path} {params or ''} failed: {error}", file=sys.stderr)
+                    return None
+                retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+            if attempt == self.max_retries:
+                print(f"[ERROR] GET {path} {params or ''} failed after {attempt + 1} attempts: {error}", file=sys.stderr)
+                return None
+            self._count("retry")
+            self.metrics.inc("http_retries_total")
+            time.sleep(self._backoff(attempt, retry_after))
+        return None
+
+    def get_json(self, path, params=None):
+        resp = self.get(path, params=params)
+        if resp is None:
+            return None
+        return self.parse_json(resp, path)
+
+    def parse_json(self, resp, path=""):
+        """
+        Decode a response body (orjson when installed). Returns None for invalid JSON.
+        """
+        try:
+            with self.metrics.timer("json_decode_seconds"):
+                if orjson is not None:
+                    return orjson.loads(resp.content)
+                return resp.json()
+        except ValueError as exc:
+            print(f"[ERROR] GET {path} returned invalid JSON: {exc}", file=sys.stderr)
+            return None
+
+    def stats_line(self):
+        with self._counts_lock:
+            counts = dict(self.status_counts)
+        return ", ".join(f"{k}: {v}" for k, v in sorted(counts.items(), key=lambda kv: str(kv[0])))
+
+
+def _parse_retry_after(value):
+    """
+    Retry-After is either delta-seconds or an HTTP-date. Returns seconds or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
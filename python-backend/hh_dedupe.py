@@ -0,0 +1,391 @@
+"""
+hh_dedupe.py
+
+Near-duplicate vacancy detection for hh_pipeline_sqlite.py (--dedupe / `dedupe`):
+the same employer reposting one vacancy under new URLs or in other cities.
+
+ - each vacancy's title + employer + requirements become a set of word-bigram shingles
+ - a MinHash signature (NUM_PERM hash functions) is cut into BANDS bands; the band hashes
+   go to minhash_bands, an index of (band_key, vacancy_id), so finding candidates for a new
+   vacancy is BANDS index lookups instead of a comparison with every row (LSH); only the
+   MAX_CANDIDATES rows sharing the most bands (at least MIN_SHARED_BANDS) are compared, so
+   templated vacancies that share bands with each other do not make the work quadratic, and
+   exact reposts are also looked up by their text hash
+ - candidates are confirmed with the exact Jaccard similarity of the shingle sets (and of the
+   title words, grade words included, so one employer's openings with shared requirements
+   stay apart)
+ - confirmed pairs merge clusters: vacancies.cluster_id is the smallest vacancy id of the
+   cluster (a vacancy without duplicates is its own cluster), so readers collapse duplicates
+   with GROUP BY cluster_id
+ - vacancies.cluster_head marks the member a collapsed listing shows (the newest student-friendly
+   one), so the unfiltered listing reads heads off an index instead of grouping the table;
+   merges move it here, init_db()'s triggers when a member is reclassified, republished or deleted
+
+Only new vacancies and vacancies whose title, employer or requirements changed are hashed on
+each run (minhash_state remembers what was hashed), so the cost follows the new rows, not the table.
+numpy is optional: it computes the signatures of a whole chunk at once, the pure Python
+fallback gives identical signatures, only slower.
+"""
+
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import struct
+import time
+import zlib
+
+from hh_metrics import Metrics
+
+# optional: vectorised MinHash for a whole chunk of vacancies
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+NUM_PERM = 64
+# 16 bands x 4 rows: a pair with Jaccard 0.8 shares a band with probability > 0.999, one with 0.3 ~ 12%
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# exact Jaccard of the shingle sets needed to call two vacancies duplicates
+THRESHOLD = 0.8
+# and of the title words: the same requirements under "QA Middle" and "QA Senior" are two openings
+TITLE_THRESHOLD = 0.5
+# grade words have to agree too: a junior opening never hides behind the senior one
+GRADE_WORDS = frozenset((
+    "intern", "trainee", "junior", "middle", "senior", "lead", "head", "principal", "chief",
+    "стажер", "младший", "старший", "ведущий", "главный", "руководитель",
+))
+# members of one existing cluster checked against a new vacancy before giving up on that cluster
+MAX_CLUSTER_PROBES = 3
+# bands a candidate has to share with the vacancy: a pair at Jaccard 0.8 still does with
+# probability > 0.997, while one-band chance collisions are most of the candidates
+MIN_SHARED_BANDS = 2
+# candidates compared per vacancy, most shared bands first: templated vacancies (one layout,
+# only the employer or grade differs) share bands with every other copy of the template
+MAX_CANDIDATES = 20
+# members of one band looked at (newest first): a band every copy of a template hashes to would
+# otherwise join each new copy with all the old ones
+MAX_BAND_MEMBERS = 50
+# a cluster's head, the member collapsed listings show: the newest student-friendly one
+# (SQLite's GROUP BY takes a group's bare columns from its max(published_ts) row)
+HEAD_ORDER = "student_friendly DESC, published_ts DESC, id DESC"
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+# fixed seed: signatures (and band keys) must not change between runs
+_rnd = random.Random(20240611)
+_PERMS = [(_rnd.randrange(1, _MERSENNE), _rnd.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+if np is not None:
+    _PERM_A = np.array([a for a, _ in _PERMS], dtype=np.uint64)
+    _PERM_B = np.array([b for _, b in _PERMS], dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def dedupe_words(title, employer, requirements):
+    """
+    Normalised words of the title, employer and requirements, "|" between the fields.
+    """
+    words = []
+    for field in (title, employer, requirements):
+        if field:
+            words.extend(_WORD_RE.findall(field.lower().replace("ё", "е")))
+            words.append("|")
+    return words[:-1]
+
+
+def text_hash(words):
+    """
+    Signed 64-bit digest of dedupe_words(): a republished vacancy (new published_at, so a new
+    content_hash) with the same text keeps its signature and its cluster.
+    """
+    return int.from_bytes(hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=8).digest(),
+                          "little", signed=True)
+
+
+def shingles(words):
+    """
+    Word-bigram shingles (as crc32 values) of dedupe_words(). Empty when there is no text at all.
+    """
+    if len(words) < 2:
+        return {zlib.crc32(w.encode("utf-8")) for w in words}
+    return {zlib.crc32(f"{a} {b}".encode("utf-8")) for a, b in zip(words, words[1:])}
+
+
+def title_words(title):
+    return set(_WORD_RE.findall((title or "").lower().replace("ё", "е")))
+
+
+def signatures(shingle_sets):
+    """
+    MinHash signatures (NUM_PERM uint32 values each) for non-empty shingle sets.
+    h_i(x) = ((a_i * x + b_i) mod 2**64 mod (2**61 - 1)) & 0xffffffff, in numpy or plain Python alike.
+    """
+    if not shingle_sets:
+        return []
+    if np is None:
+        return [[min(((a * x + b) & _MASK64) % _MERSENNE & _MAX_HASH for x in s) for a, b in _PERMS]
+                for s in shingle_sets]
+    lengths = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=len(shingle_sets))
+    flat = np.fromiter((x for s in shingle_sets for x in s), dtype=np.uint64, count=int(lengths.sum()))
+    with np.errstate(over="ignore"):
+        hashed = (flat[:, None] * _PERM_A + _PERM_B) % np.uint64(_MERSENNE) & np.uint64(_MAX_HASH)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return [row.tolist() for row in np.minimum.reduceat(hashed, starts, axis=0)]
+
+
+def band_keys(signature):
+    """
+    One signed 64-bit key per band (the band number is part of the key).
+    """
+    raw = struct.pack(f"<{NUM_PERM}I", *signature)
+    step = ROWS * 4
+    return [int.from_bytes(hashlib.blake2b(bytes((b,)) + raw[b * step:(b + 1) * step], digest_size=8).digest(),
+                           "little", signed=True)
+            for b in range(BANDS)]
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Clusters:
+    """
+    Union-find over cluster ids for one chunk; the root is always the smallest id.
+    """
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        root = x
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while x != root:
+            self.parent[x], x = root, self.parent.get(x, x)
+        return root
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+        return x != y
+
+
+def same_title(a, b):
+    return jaccard(a, b) >= TITLE_THRESHOLD and a & GRADE_WORDS == b & GRADE_WORDS
+
+
+def _in_chunks(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _detach(conn: sqlite3.Connection, vacancy_id):
+    """
+    Take a changed vacancy out of the band index (the minhash_state delete trigger drops its
+    bands) and out of its cluster before it is rehashed. If it was the cluster's id, the
+    other members move to the next smallest id. Returns the cluster id the other members
+    keep (None when there are none).
+    """
+    conn.execute("DELETE FROM minhash_state WHERE vacancy_id = ?;", (vacancy_id,))
+    (rest,) = conn.execute("SELECT cluster_id FROM vacancies WHERE id = ?;", (vacancy_id,)).fetchone()
+    if rest is None or rest == vacancy_id:
+        (rest,) = conn.execute("SELECT min(id) FROM vacancies WHERE cluster_id = ?1 AND id != ?1;",
+                               (vacancy_id,)).fetchone()
+        conn.execute("UPDATE vacancies SET cluster_id = ?2 WHERE cluster_id = ?1 AND id != ?1;",
+                     (vacancy_id, rest))
+    conn.execute("UPDATE vacancies SET cluster_id = id WHERE id = ?;", (vacancy_id,))
+    return rest
+
+
+def refresh_cluster_heads(conn: sqlite3.Connection, cluster_ids=None):
+    """
+    Recompute vacancies.cluster_head for the given clusters (every cluster when None): 1 on the
+    member ordered first by HEAD_ORDER, 0 on the others. Does not commit.
+    """
+    heads = f"""
+        SELECT id FROM (
+            SELECT id, row_number() OVER (PARTITION BY cluster_id ORDER BY {HEAD_ORDER}) AS n
+            FROM vacancies {{where}}
+        ) WHERE n = 1
+    """
+    if cluster_ids is None:
+        conn.execute(f"""
+            UPDATE vacancies SET cluster_head = (id IN ({heads.format(where='')}));
+        """)
+        return
+    for part in _in_chunks(sorted(cluster_ids)):
+        marks = ','.join('?' for _ in part)
+        conn.execute(f"""
+            UPDATE vacancies SET cluster_head = (id IN ({heads.format(where=f'WHERE cluster_id IN ({marks})')}))
+            WHERE cluster_id IN ({marks});
+        """, (*part, *part))
+
+
+def _texts(conn: sqlite3.Connection, ids):
+    """
+    {vacancy_id: (shingles, title words, cluster_id)} for the given ids.
+    """
+    out = {}
+    for chunk in _in_chunks(ids):
+        cur = conn.execute(f"""
+            SELECT id, title, employer, requirements, cluster_id FROM vacancies
+            WHERE id IN ({",".join("?" for _ in chunk)});
+        """, chunk)
+        for vid, title, employer, requirements, cluster_id in cur:
+            out[vid] = (shingles(dedupe_words(title, employer, requirements)), title_words(title),
+                        cluster_id if cluster_id is not None else vid)
+    return out
+
+
+def _process_chunk(conn: sqlite3.Connection, chunk, threshold, stats):
+    """
+    chunk: [(id, title, employer, requirements, content_hash, text_hash when hashed before)].
+    Hashes the vacancies, indexes their bands, confirms candidates and merges clusters. Returns
+    the ids of the clusters it changed (their heads need refreshing). Does not commit.
+    """
+    # new and detached vacancies are their own cluster (cluster_id = id) until a match is confirmed
+    docs, state, same_text, touched = {}, [], [], set()
+    for vid, title, employer, requirements, digest, old_text in chunk:
+        words = dedupe_words(title, employer, requirements)
+        text = text_hash(words)
+        if old_text is not None:
+            if old_text == text:
+                same_text.append((digest, vid))
+                continue
+            touched.update((vid, _detach(conn, vid)))
+            stats['rehashed'] += 1
+        docs[vid] = (shingles(words), title_words(title), vid)
+        state.append((vid, digest, text))
+    conn.executemany("UPDATE minhash_state SET content_hash = ? WHERE vacancy_id = ?;", same_text)
+    stats['hashed'] += len(docs)
+    hashed = [vid for vid, doc in docs.items() if doc[0]]
+    keys = {vid: band_keys(sig) for vid, sig in zip(hashed, signatures([docs[vid][0] for vid in hashed]))}
+    # key order: the inserts walk the index instead of hopping around it
+    bands = sorted((k, vid) for vid, ks in keys.items() for k in ks)
+    conn.executemany("INSERT OR IGNORE INTO minhash_bands (band_key, vacancy_id) VALUES (?, ?);", bands)
+    conn.executemany("""
+        INSERT INTO minhash_state (vacancy_id, content_hash, text_hash, band_keys) VALUES (?, ?, ?, ?);
+    """, [(vid, digest, text, json.dumps(keys.get(vid, []))) for vid, digest, text in state])
+
+    # the vacancies sharing the most bands with each chunk vacancy (the chunk itself included)
+    candidates = {}
+    conn.execute("DELETE FROM temp.dedupe_chunk_bands;")
+    conn.executemany("INSERT INTO temp.dedupe_chunk_bands (band_key, vacancy_id) VALUES (?, ?);", bands)
+    cur = conn.execute("""
+        SELECT vacancy_id, other FROM (
+            SELECT c.vacancy_id, b.vacancy_id AS other,
+                   row_number() OVER (PARTITION BY c.vacancy_id ORDER BY count(*) DESC, b.vacancy_id DESC) AS n
+            FROM temp.dedupe_chunk_bands c JOIN minhash_bands b ON b.band_key = c.band_key AND b.vacancy_id IN (
+                SELECT vacancy_id FROM minhash_bands WHERE band_key = c.band_key ORDER BY vacancy_id DESC LIMIT ?
+            )
+            WHERE b.vacancy_id != c.vacancy_id
+            GROUP BY c.vacancy_id, b.vacancy_id
+            HAVING count(*) >= ?
+        ) WHERE n <= ?;
+    """, (MAX_BAND_MEMBERS, MIN_SHARED_BANDS, MAX_CANDIDATES))
+    for vid, other in cur:
+        candidates.setdefault(vid, set()).add(other)
+    # exact reposts (the same words) even where MAX_BAND_MEMBERS cut them off: the oldest copy
+    for vid, _, text in state:
+        if vid in keys:
+            row = conn.execute("""
+                SELECT vacancy_id FROM minhash_state WHERE text_hash = ? AND vacancy_id != ? ORDER BY vacancy_id LIMIT 1;
+            """, (text, vid)).fetchone()
+            if row:
+                candidates.setdefault(vid, set()).add(row[0])
+    stats['candidates'] += sum(len(c) for c in candidates.values())
+    if not candidates:
+        return touched - {None}
+
+    known = dict(docs)
+    known.update(_texts(conn, set().union(*candidates.values()) - known.keys()))
+    clusters = _Clusters()
+    for vid in sorted(candidates):
+        # one verdict per existing cluster: probe a few members, not all of them
+        by_cluster = {}
+        for other in sorted(candidates[vid]):
+            if other in known:
+                by_cluster.setdefault(known[other][2], []).append(other)
+        for label, members in by_cluster.items():
+            if clusters.find(label) == clusters.find(vid):
+                continue
+            for other in members[:MAX_CLUSTER_PROBES]:
+                stats['compared'] += 1
+                if same_title(docs[vid][1], known[other][1]) and jaccard(docs[vid][0], known[other][0]) >= threshold:
+                    clusters.union(vid, label)
+                    stats['matched'] += 1
+                    break
+
+    # merge: every cluster id in a group becomes the group's smallest (chunk vacancies included,
+    # their cluster_id is still their own id)
+    merged = {}
+    for label in list(clusters.parent):
+        root = clusters.find(label)
+        if root != label:
+            merged.setdefault(root, []).append(label)
+    for root, others in merged.items():
+        for part in _in_chunks(others):
+            conn.execute(f"UPDATE vacancies SET cluster_id = ? WHERE cluster_id IN ({','.join('?' for _ in part)});",
+                         (root, *part))
+    stats['merges'] += sum(len(o) for o in merged.values())
+    touched.update(merged)
+    return touched - {None}
+
+
+def update_clusters(conn: sqlite3.Connection, chunk_size=1000, threshold=THRESHOLD, rebuild=False, metrics=None):
+    """
+    Hash and cluster every vacancy that is new or changed since the last call (rebuild=True
+    forgets all previous work and re-clusters the whole table). Works through the table in
+    id order, chunk_size vacancies per transaction; a changed vacancy whose title, employer
+    and requirements are the same is only marked as seen. Returns counts: hashed, rehashed,
+    candidates, compared, matched, merges, clusters (with more than one vacancy), duplicates.
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    started = time.perf_counter()
+    if rebuild:
+        conn.execute("DELETE FROM minhash_bands;")
+        conn.execute("DELETE FROM minhash_state;")
+        conn.execute("UPDATE vacancies SET cluster_id = id WHERE cluster_id IS NOT id;")
+        conn.execute("UPDATE vacancies SET cluster_head = 1 WHERE cluster_head IS NOT 1;")
+        conn.commit()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS dedupe_chunk_bands (band_key INTEGER, vacancy_id INTEGER);")
+    stats = dict.fromkeys(('hashed', 'rehashed', 'candidates', 'compared', 'matched', 'merges'), 0)
+    last_id = 0
+    while True:
+        chunk = conn.execute("""
+            SELECT v.id, v.title, v.employer, v.requirements, v.content_hash, s.text_hash
+            FROM vacancies v LEFT JOIN minhash_state s ON s.vacancy_id = v.id
+            WHERE v.id > ? AND (s.vacancy_id IS NULL OR s.content_hash IS NOT v.content_hash)
+            ORDER BY v.id LIMIT ?;
+        """, (last_id, chunk_size)).fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        try:
+            with metrics.timer('dedupe_chunk_seconds'):
+                refresh_cluster_heads(conn, _process_chunk(conn, chunk, threshold, stats))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    conn.execute("DROP TABLE IF EXISTS temp.dedupe_chunk_bands;")
+    clusters, duplicates = conn.execute("""
+        SELECT count(*), coalesce(sum(n) - count(*), 0) FROM (
+            SELECT count(*) AS n FROM vacancies GROUP BY cluster_id HAVING count(*) > 1
+        );
+    """).fetchone()
+    stats['clusters'], stats['duplicates'] = clusters, duplicates
+    for key in ('hashed', 'compared', 'matched'):
+        metrics.inc(f'dedupe_{key}_total', stats[key])
+    print(f"[DEDUPE] Hashed {stats['hashed']} vacancies ({stats['rehashed']} changed), compared "
+          f"{stats['compared']} candidate pairs in {time.perf_counter() - started:.1f}s; "
+          f"{duplicates} duplicates in {clusters} clusters"
+          + ("" if np is not None else " (numpy not installed: pure Python MinHash)"))
+    return stats
@@ -4,21 +4,48 @@ hh_pipeline_sqlite.py
 
 Single-script pipeline:
  - read keywords (hhData/keywords.txt OR filenames in hhData/)
- - fetch vacancies from HH for each keyword
+ - fetch vacancies from HH for each keyword and country (bounded worker pool, shared token-bucket
+   rate limit, pooled keep-alive session with retry/backoff — see hh_client.py); queries that find
+   more than HH pages through are split by publication window (sub-areas only as a last resort)
+   and crawled in parallel
  - clean highlight tags and insert/upsert into SQLite DB at hhData/vacancies.db
  - dedupe by 'url' using UNIQUE constraint and UPSERT
+   (--bulk: stage everything in a TEMP table and merge it set-based in one transaction)
+ - OPTIONAL: fetch full vacancy details (description, experience, employment, schedule) for new and
+   changed vacancies with conditional requests, so unchanged ones cost a 304 (--enrich)
+ - `import-csv`: seed the DB from the older scraper's hhData/*.csv exports without API calls
  - OPTIONAL: mark & prune vacancies to keep only student-friendly ones (--student-only)
+ - OPTIONAL: group reposted near-duplicate vacancies into clusters (vacancies.cluster_id, MinHash/LSH
+   in hh_dedupe.py) so the API can collapse them (--dedupe, or the `dedupe` command)
+ - OPTIONAL: update the student -> vacancy recommendation index (hashed TF-IDF vectors in memory-mapped
+   files, see hh_recommend.py) with new and changed vacancies (--recommend, or the `recommend` command)
+ - OPTIONAL: expire vacancies HH no longer returns (--retain-days / --retain-runs), freeing
+   their pages with incremental vacuum
+ - OPTIONAL: publish a compacted, read-only snapshot for the Node API and swap it in atomically
+   (--publish, or the `publish` command); the API never reads the DB the pipeline writes
 """
 
 import argparse
 import csv
 import datetime as dt
+import hashlib
+import html
 import json
+import os
+import queue
+import re
+import threading
 import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 import sys
 import sqlite3
-import requests
+
+from hh_client import API_URL, HHClient, orjson
+from hh_dedupe import HEAD_ORDER, refresh_cluster_heads, update_clusters
+from hh_recommend import INDEX_DIR, update_index
+from hh_metrics import Metrics
 
 # Try to import ZoneInfo (Python 3.9+), fallback to backports or fixed offset
 try:
@@ -47,13 +74,65 @@ COUNTRY_CODES = {
     "KG": 48, "UZ": 97, "RU": 113, "Other": 1001
 }
 
+def parse_countries(value):
+    """
+    --country value -> list of COUNTRY_CODES keys: one code, a comma/space separated
+    list (or a list of codes), or 'all'. Case-insensitive; raises ValueError on unknown codes.
+    """
+    by_upper = {code.upper(): code for code in COUNTRY_CODES}
+    if isinstance(value, (list, tuple)):
+        value = ",".join(value)
+    tokens = [t for t in re.split(r'[,\s]+', str(value or '')) if t]
+    if any(t.lower() == 'all' for t in tokens):
+        return list(COUNTRY_CODES)
+    countries = []
+    for t in tokens:
+        code = by_upper.get(t.upper())
+        if code is None:
+            raise ValueError(f"Unknown country code {t}")
+        if code not in countries:
+            countries.append(code)
+    if not countries:
+        raise ValueError("No country given")
+    return countries
+
 SCRIPT_DIR = Path(__file__).parent.resolve()
 DB_PATH = SCRIPT_DIR / "hhData" / "vacancies.db"
 
+# Order of the values in a row tuple built by item_to_row() and consumed by upsert_rows().
+# raw_zlib is always last: it goes to vacancy_raw, everything before it to vacancies.
+ROW_COLUMNS = (
+    'url', 'title', 'employer', 'city', 'publish_date', 'salary', 'requirements', 'responsibilities',
+    'job_keyword', 'inserted_at', 'content_hash', 'student_friendly', 'student_rules_version',
+    'salary_from', 'salary_to', 'salary_currency', 'salary_kzt', 'published_ts', 'area_id', 'country',
+    'raw_zlib',
+)
+VACANCY_COLUMNS = ROW_COLUMNS[:-1]
+# Fields covered by content_hash: what we show/filter on, not volatile parts of the raw item.
+# The requirements/responsibilities snippets are cut around whatever the search matched, so the same
+# vacancy found under two keywords has two snippets: they are kept out of the hash, and a vacancy keeps
+# the snippets it was first stored with until a hashed field changes (the full text is in vacancy_details).
+HASHED_COLUMNS = ('title', 'employer', 'city', 'publish_date', 'salary')
+SNIPPET_COLUMNS = ('requirements', 'responsibilities')
+# PRAGMA user_version once stored content_hash values are computed over the current HASHED_COLUMNS
+CONTENT_HASH_VERSION = 2
+
+# KZT per unit of currency, used until --refresh-rates pulls HH's current rates
+DEFAULT_KZT_RATES = {
+    'KZT': 1.0, 'RUR': 6.4, 'USD': 520.0, 'EUR': 600.0, 'UZS': 0.043, 'KGS': 5.95,
+    'BYR': 165.0, 'AZN': 306.0, 'GEL': 192.0, 'UAH': 12.5,
+}
+
 def init_db(db_path: Path):
     db_path.parent.mkdir(parents=True, exist_ok=True)
     con = sqlite3.connect(db_path)
     cur = con.cursor()
+    # connection settings first: some pragmas are no-ops/errors once a transaction is open
+    # only takes effect on a new file; existing DBs are converted once by ensure_incremental_vacuum()
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    cur.execute("PRAGMA journal_mode=WAL;")
+    cur.execute("PRAGMA synchronous=NORMAL;")
+    cur.execute("PRAGMA foreign_keys=ON;")
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS vacancies (
@@ -67,150 +146,1150 @@ def init_db(db_path: Path):
         requirements TEXT,
         responsibilities TEXT,
         job_keyword TEXT,
-        raw_json TEXT,
-        inserted_at TEXT
+        inserted_at TEXT,
+        content_hash TEXT,
+        student_friendly INTEGER DEFAULT 0,
+        student_rules_version INTEGER,
+        salary_from INTEGER,
+        salary_to INTEGER,
+        salary_currency TEXT,
+        salary_kzt INTEGER,
+        published_ts INTEGER,
+        area_id INTEGER,
+        country TEXT,
+        cluster_id INTEGER,
+        cluster_head INTEGER DEFAULT 1
     );
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_keyword ON vacancies(job_keyword);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_date ON vacancies(publish_date);")
-    cur.execute("PRAGMA journal_mode=WAL;")
-    cur.execute("PRAGMA synchronous=NORMAL;")
+    ensure_column(con, 'vacancies', 'content_hash', 'TEXT')
+    ensure_column(con, 'vacancies', 'student_friendly', 'INTEGER DEFAULT 0')
+    # rows classified by an older rule set are picked up by mark_student_friendly()
+    ensure_column(con, 'vacancies', 'student_rules_version', 'INTEGER')
+    # job_keyword is only a display string now; keyword filters go through vacancy_keywords
+    cur.execute("DROP INDEX IF EXISTS idx_job_keyword;")
+    # publish_date is ISO text with mixed offsets; listings sort on the epoch instead
+    if ensure_column(con, 'vacancies', 'published_ts', 'INTEGER'):
+        backfill_published_ts(con)
+    cur.execute("DROP INDEX IF EXISTS idx_publish_date;")
+    # the /hh-jobs listing: WHERE student_friendly = 1 ORDER BY published_ts DESC, id DESC (offset or keyset)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_published ON vacancies(student_friendly, published_ts DESC, id DESC);")
+    # the full HH item, zlib-compressed, kept out of the hot table the API scans
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS vacancy_raw (
+        vacancy_id INTEGER PRIMARY KEY REFERENCES vacancies(id) ON DELETE CASCADE,
+        raw_zlib BLOB
+    );
+    """)
+    migrate_raw_json(con)
+    # full /vacancies/{id} fields (--enrich) plus the validators for conditional refetches
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS vacancy_details (
+        vacancy_id INTEGER PRIMARY KEY REFERENCES vacancies(id) ON DELETE CASCADE,
+        hh_id TEXT,
+        description TEXT,
+        key_skills TEXT,
+        experience_id TEXT,
+        experience TEXT,
+        employment_id TEXT,
+        employment TEXT,
+        schedule_id TEXT,
+        schedule TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT,
+        fetched_at TEXT,
+        checked_ts INTEGER,
+        http_status INTEGER
+    );
+    """)
+    # --enrich-max-age revalidates the longest-unchecked details first
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_details_checked ON vacancy_details(checked_ts);")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS currency_rates (
+        code TEXT PRIMARY KEY,
+        kzt_per_unit REAL NOT NULL,
+        updated_at TEXT
+    );
+    """)
+    cur.executemany("INSERT OR IGNORE INTO currency_rates (code, kzt_per_unit) VALUES (?, ?);",
+                    DEFAULT_KZT_RATES.items())
+    added = [ensure_column(con, 'vacancies', c, decl) for c, decl in
+             (('salary_from', 'INTEGER'), ('salary_to', 'INTEGER'), ('salary_currency', 'TEXT'), ('salary_kzt', 'INTEGER'))]
+    if any(added):
+        backfill_salary_columns(con)
+    # "min pay >= X, best paid first" on the student listing is an index range scan
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_salary_kzt ON vacancies(student_friendly, salary_kzt);")
+    # sightings live outside the wide vacancies row so re-seeing an unchanged vacancy doesn't rewrite it
+    if not table_exists(con, 'vacancy_seen'):
+        cur.execute("""
+        CREATE TABLE vacancy_seen (
+            vacancy_id INTEGER PRIMARY KEY REFERENCES vacancies(id) ON DELETE CASCADE,
+            first_seen_at TEXT,
+            last_seen_at TEXT,
+            last_seen_run INTEGER
+        );
+        """)
+        cur.execute("""
+            INSERT INTO vacancy_seen (vacancy_id, first_seen_at, last_seen_at)
+            SELECT id, inserted_at, inserted_at FROM vacancies;
+        """)
+    # normalized vacancy <-> search keyword mapping
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS keywords (
+        id INTEGER PRIMARY KEY,
+        keyword TEXT NOT NULL UNIQUE
+    );
+    """)
+    if not table_exists(con, 'vacancy_keywords'):
+        cur.execute("""
+        CREATE TABLE vacancy_keywords (
+            vacancy_id INTEGER NOT NULL REFERENCES vacancies(id) ON DELETE CASCADE,
+            keyword_id INTEGER NOT NULL REFERENCES keywords(id) ON DELETE CASCADE,
+            PRIMARY KEY (vacancy_id, keyword_id)
+        ) WITHOUT ROWID;
+        """)
+        cur.execute("CREATE INDEX idx_vacancy_keywords_keyword ON vacancy_keywords(keyword_id, vacancy_id);")
+        migrate_job_keywords(con)
+    # canonical HH areas (area.id) and the spellings people search them by
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS areas (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        parent_id INTEGER
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS area_aliases (
+        alias TEXT NOT NULL,
+        area_id INTEGER NOT NULL REFERENCES areas(id) ON DELETE CASCADE,
+        PRIMARY KEY (alias, area_id)
+    ) WITHOUT ROWID;
+    """)
+    if ensure_column(con, 'vacancies', 'area_id', 'INTEGER'):
+        backfill_area_ids(con)
+    # city filter on the student listing: area_id equality, still newest first
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_area ON vacancies(student_friendly, area_id, published_ts DESC, id DESC);")
+    # COUNTRY_CODES key the vacancy was crawled under
+    if ensure_column(con, 'vacancies', 'country', 'TEXT'):
+        backfill_countries(con)
+    # near-duplicate cluster (hh_dedupe.py): the smallest vacancy id in it, a vacancy's own id until
+    # --dedupe finds a duplicate, so GROUP BY cluster_id collapses reposts and never merges unrelated rows
+    if ensure_column(con, 'vacancies', 'cluster_id', 'INTEGER'):
+        cur.execute("UPDATE vacancies SET cluster_id = id;")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS vacancies_cluster_ai AFTER INSERT ON vacancies WHEN new.cluster_id IS NULL BEGIN
+        UPDATE vacancies SET cluster_id = new.id WHERE id = new.id;
+    END;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cluster ON vacancies(cluster_id);")
+    # the collapsed listing: WHERE student_friendly = 1 GROUP BY cluster_id, newest member per cluster
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_cluster ON vacancies(student_friendly, cluster_id, published_ts);")
+    # 1 on the member of its cluster the collapsed listing shows (hh_dedupe.HEAD_ORDER): a new
+    # vacancy heads its own cluster, --dedupe moves heads when it merges clusters and these
+    # triggers when a member is reclassified, republished or deleted
+    if ensure_column(con, 'vacancies', 'cluster_head', 'INTEGER DEFAULT 1'):
+        refresh_cluster_heads(con)
+    head_sql = f"""
+        UPDATE vacancies SET cluster_head = (id IS (
+            SELECT id FROM vacancies WHERE cluster_id = {{row}}.cluster_id ORDER BY {HEAD_ORDER} LIMIT 1
+        )) WHERE cluster_id = {{row}}.cluster_id;
+    """
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS vacancies_head_au AFTER UPDATE OF student_friendly, published_ts ON vacancies
+    WHEN old.student_friendly IS NOT new.student_friendly OR old.published_ts IS NOT new.published_ts BEGIN
+        {head_sql.format(row='new')}
+    END;
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS vacancies_head_ad AFTER DELETE ON vacancies WHEN old.cluster_head = 1 BEGIN
+        {head_sql.format(row='old')}
+    END;
+    """)
+    # the default collapsed listing: one row per cluster straight off the index, newest first
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_head ON vacancies(student_friendly, published_ts DESC, id DESC) WHERE cluster_head = 1;")
+    # MinHash LSH index of --dedupe: the band keys each vacancy was hashed to, and the reverse lookup;
+    # deleting a vacancy (or rehashing it) deletes its state row, whose trigger drops its bands
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS minhash_state (
+        vacancy_id INTEGER PRIMARY KEY REFERENCES vacancies(id) ON DELETE CASCADE,
+        content_hash TEXT,
+        text_hash INTEGER,
+        band_keys TEXT
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS minhash_bands (
+        band_key INTEGER NOT NULL,
+        vacancy_id INTEGER NOT NULL,
+        PRIMARY KEY (band_key, vacancy_id)
+    ) WITHOUT ROWID;
+    """)
+    # exact reposts are looked up by their text, not through the (capped) band buckets
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_minhash_text ON minhash_state(text_hash);")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS minhash_state_ad AFTER DELETE ON minhash_state BEGIN
+        DELETE FROM minhash_bands
+        WHERE band_key IN (SELECT value FROM json_each(old.band_keys)) AND vacancy_id = old.vacancy_id;
+    END;
+    """)
+    ensure_fts(con)
+    cur.execute("PRAGMA user_version;")
+    if cur.fetchone()[0] < CONTENT_HASH_VERSION:
+        rehash_vacancies(con)
+    # newest publication seen per (keyword, country): the high-water mark for --incremental
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS crawl_state (
+        keyword TEXT NOT NULL,
+        country TEXT NOT NULL,
+        newest_published_at TEXT,
+        newest_published_ts INTEGER,
+        updated_at TEXT,
+        PRIMARY KEY (keyword, country)
+    );
+    """)
+    # one row per pipeline invocation; crawl_progress checkpoints each (keyword, country, shard) within a run
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        run_id INTEGER PRIMARY KEY,
+        started_at TEXT,
+        finished_at TEXT,
+        status TEXT,
+        options_json TEXT,
+        metrics_json TEXT
+    );
+    """)
+    # per-stage timings and counters of the run (hh_metrics summary), e.g. json_extract(metrics_json, '$.rates')
+    ensure_column(con, 'pipeline_runs', 'metrics_json', 'TEXT')
+    # run that last saw each vacancy: --retain-runs expires what recent full crawls no longer return
+    if ensure_column(con, 'vacancy_seen', 'last_seen_run', 'INTEGER'):
+        # rows seen before runs were tracked count as seen by the latest run, so nothing expires early
+        cur.execute("UPDATE vacancy_seen SET last_seen_run = (SELECT max(run_id) FROM pipeline_runs);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_seen_run ON vacancy_seen(last_seen_run);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_seen_at ON vacancy_seen(last_seen_at);")
+    # shard ('' = the whole keyword query, see Shard) is part of the key, so an old table is rebuilt
+    cur.execute("PRAGMA table_info(crawl_progress);")
+    old_cols = [row[1] for row in cur.fetchall()]
+    if old_cols and 'shard' not in old_cols:
+        cur.execute("ALTER TABLE crawl_progress RENAME TO crawl_progress_old;")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS crawl_progress (
+        run_id INTEGER NOT NULL REFERENCES pipeline_runs(run_id) ON DELETE CASCADE,
+        keyword TEXT NOT NULL,
+        country TEXT NOT NULL,
+        shard TEXT NOT NULL DEFAULT '',
+        next_page INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT,
+        PRIMARY KEY (run_id, keyword, country, shard)
+    );
+    """)
+    if old_cols and 'shard' not in old_cols:
+        cur.execute("""
+            INSERT INTO crawl_progress (run_id, keyword, country, shard, next_page, done, updated_at)
+            SELECT run_id, keyword, country, '', next_page, done, updated_at FROM crawl_progress_old;
+        """)
+        cur.execute("DROP TABLE crawl_progress_old;")
     con.commit()
+    con.create_function('raw_json', 1, decompress_raw_json, deterministic=True)
     return con
 
-def upsert_rows(conn: sqlite3.Connection, rows):
+def dump_json_bytes(obj):
+    """
+    Compact UTF-8 JSON. Uses orjson when it is installed (several times faster than json.dumps).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def compress_raw_json(item):
+    return zlib.compress(dump_json_bytes(item), 6)
+
+def decompress_raw_json(blob):
+    """
+    Inverse of compress_raw_json(); returns the JSON text. Also registered as the
+    SQL function raw_json(blob) on connections opened by init_db().
+    """
+    if blob is None:
+        return None
+    return zlib.decompress(blob).decode('utf-8')
+
+def load_raw_json(conn: sqlite3.Connection, vacancy_id):
+    """
+    Return the stored HH item for a vacancy as a dict, or None.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT raw_zlib FROM vacancy_raw WHERE vacancy_id = ?;", (vacancy_id,))
+    row = cur.fetchone()
+    if not row or row[0] is None:
+        return None
+    return json.loads(decompress_raw_json(row[0]))
+
+def migrate_raw_json(conn: sqlite3.Connection, chunk_size=1000):
+    """
+    Move the old inline vacancies.raw_json text into compressed vacancy_raw rows
+    and drop the column. Run VACUUM afterwards to give the space back to the OS.
+    """
+    cur = conn.cursor()
+    cur.execute("PRAGMA table_info(vacancies);")
+    if 'raw_json' not in [row[1] for row in cur.fetchall()]:
+        return
+    cur.execute("SELECT 1 FROM vacancies WHERE raw_json IS NOT NULL LIMIT 1;")
+    if cur.fetchone() is None:
+        return
+    print("[DB] Moving vacancies.raw_json into compressed vacancy_raw...")
+    moved = 0
+    last_id = 0
+    while True:
+        cur.execute("SELECT id, raw_json FROM vacancies WHERE id > ? ORDER BY id LIMIT ?;", (last_id, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        conn.executemany("INSERT OR REPLACE INTO vacancy_raw (vacancy_id, raw_zlib) VALUES (?, ?);",
+                         [(vid, zlib.compress(raw.encode('utf-8'), 6)) for vid, raw in chunk if raw is not None])
+        moved += len(chunk)
+    try:
+        cur.execute("ALTER TABLE vacancies DROP COLUMN raw_json;")
+    except sqlite3.OperationalError:
+        # SQLite < 3.35 can't drop columns: at least free the text
+        cur.execute("UPDATE vacancies SET raw_json = NULL;")
+    conn.commit()
+    print(f"[DB] Moved raw_json for {moved} rows. Run VACUUM to reclaim the freed pages.")
+
+def split_keywords(job_keyword):
+    """
+    'Developer;Designer;Developer' -> ['Developer', 'Designer'] (order kept, duplicates dropped).
+    """
+    seen = []
+    for k in (job_keyword or '').split(';'):
+        k = k.strip()
+        if k and k not in seen:
+            seen.append(k)
+    return seen
+
+def migrate_job_keywords(conn: sqlite3.Connection, chunk_size=1000):
+    """
+    Fill vacancy_keywords from the old ';'-joined job_keyword strings and
+    collapse the repeated entries earlier upserts appended. Does not commit.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM vacancies WHERE job_keyword IS NOT NULL AND job_keyword != '';")
+    if cur.fetchone()[0] == 0:
+        return
+    print("[DB] Building vacancy_keywords from job_keyword strings...")
+    last_id = 0
+    linked = 0
+    while True:
+        cur.execute("SELECT id, job_keyword FROM vacancies WHERE id > ? ORDER BY id LIMIT ?;", (last_id, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        pairs = []
+        fixed = []
+        for vid, job_keyword in chunk:
+            kws = split_keywords(job_keyword)
+            pairs.extend((vid, k) for k in kws)
+            joined = ';'.join(kws) or None
+            if joined != job_keyword:
+                fixed.append((joined, vid))
+        conn.executemany("INSERT OR IGNORE INTO keywords (keyword) VALUES (?);", {(k,) for _, k in pairs})
+        conn.executemany("""
+            INSERT OR IGNORE INTO vacancy_keywords (vacancy_id, keyword_id)
+            SELECT ?, id FROM keywords WHERE keyword = ?;
+        """, pairs)
+        # job_keyword is content-hash neutral, so this doesn't trigger rewrites later
+        conn.executemany("UPDATE vacancies SET job_keyword = ? WHERE id = ?;", fixed)
+        linked += len(pairs)
+    print(f"[DB] Linked {linked} vacancy/keyword pairs.")
+
+def backfill_published_ts(conn: sqlite3.Connection, chunk_size=5000):
+    """
+    Fill published_ts (epoch seconds) from publish_date for existing rows. Does not commit.
+    """
+    cur = conn.cursor()
+    last_id = 0
+    filled = 0
+    while True:
+        cur.execute("SELECT id, publish_date FROM vacancies WHERE id > ? ORDER BY id LIMIT ?;", (last_id, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        updates = []
+        for vid, publish_date in chunk:
+            published = parse_hh_datetime(publish_date)
+            if published is not None:
+                updates.append((int(published.timestamp()), vid))
+        conn.executemany("UPDATE vacancies SET published_ts = ? WHERE id = ?;", updates)
+        filled += len(updates)
+    if filled:
+        print(f"[DB] Backfilled published_ts for {filled} rows.")
+
+# -------- Areas --------
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya',
+    # Kazakh
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h', 'і': 'i',
+}
+
+# Spellings transliteration alone doesn't produce (old names, common typos, Kazakh romanisation)
+EXTRA_AREA_ALIASES = {
+    'алматы': ['almaata', 'alma-ata', 'алма-ата'],
+    'астана': ['nursultan', 'nur-sultan', 'нур-султан', 'akmola'],
+    'караганда': ['karagandy', 'qaragandy'],
+    'костанай': ['kostanai', 'qostanai'],
+    'кызылорда': ['qyzylorda'],
+    'туркестан': ['turkistan'],
+    'экибастуз': ['ekibastus'],
+    'кокшетау': ['kokshetav'],
+    'семей': ['semei', 'semipalatinsk'],
+    'жезказган': ['zhezqazgan'],
+    'актобе': ['aqtobe'],
+    'актау': ['aqtau'],
+    'усть-каменогорск': ['oskemen', 'өскемен'],
+}
+
+def rehash_vacancies(conn: sqlite3.Connection, chunk_size=5000):
+    """
+    Recompute every stored content_hash over the current HASHED_COLUMNS, and carry the new
+    value over to the vacancy_details and minhash_state rows that were up to date with the old
+    one, so the change doesn't make --enrich and --dedupe redo every vacancy. Commits; records
+    CONTENT_HASH_VERSION in PRAGMA user_version.
+    """
+    cur = conn.cursor()
+    last_id = 0
+    total = 0
+    while True:
+        cur.execute(f"""
+            SELECT id, content_hash, {", ".join(HASHED_COLUMNS)} FROM vacancies
+            WHERE id > ? ORDER BY id LIMIT ?;
+        """, (last_id, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        changed = [(content_hash(values), vid, old) for vid, old, *values in chunk]
+        changed = [c for c in changed if c[0] != c[2]]
+        conn.executemany("UPDATE vacancies SET content_hash = ? WHERE id = ?;", [c[:2] for c in changed])
+        for table in ('vacancy_details', 'minhash_state'):
+            conn.executemany(f"UPDATE {table} SET content_hash = ? WHERE vacancy_id = ? AND content_hash = ?;",
+                             changed)
+        total += len(changed)
+    cur.execute(f"PRAGMA user_version = {CONTENT_HASH_VERSION};")
+    conn.commit()
+    if total:
+        print(f"[DB] Recomputed content_hash of {total} rows (snippets no longer hashed).")
+
+def normalize_alias(text):
+    """
+    Lookup form of a place name: trimmed, lower-case, ё -> е, single spaces.
+    hh.routes.js normalises the user's city input the same way.
+    """
+    return " ".join((text or '').lower().replace('ё', 'е').split())
+
+def transliterate(text):
+    return "".join(_TRANSLIT.get(ch, ch) for ch in normalize_alias(text))
+
+def area_aliases(name):
+    """
+    All lookup spellings for an HH area name: the name itself, its Latin
+    transliteration, hyphen/space-free variants and EXTRA_AREA_ALIASES.
+    """
+    base = normalize_alias(name)
+    if not base:
+        return set()
+    aliases = {base, transliterate(base)}
+    for extra in EXTRA_AREA_ALIASES.get(base, []):
+        aliases.add(normalize_alias(extra))
+    for a in list(aliases):
+        aliases.add(a.replace('-', ' '))
+        aliases.add(a.replace('-', '').replace(' ', ''))
+    return aliases
+
+def store_areas(conn: sqlite3.Connection, areas):
+    """
+    Upsert (area_id, name, parent_id) triples and their aliases. Does not commit.
+    """
+    areas = [(aid, name, parent) for aid, name, parent in areas if aid is not None and name]
+    if not areas:
+        return
+    conn.executemany("""
+        INSERT INTO areas (id, name, parent_id) VALUES (?,?,?)
+        ON CONFLICT(id) DO UPDATE SET name = excluded.name, parent_id = coalesce(excluded.parent_id, areas.parent_id)
+    """, areas)
+    conn.executemany("INSERT OR IGNORE INTO area_aliases (alias, area_id) VALUES (?, ?);",
+                     [(alias, aid) for aid, name, _ in areas for alias in area_aliases(name)])
+
+def store_row_areas(conn: sqlite3.Connection, rows):
+    """
+    Register the areas referenced by a batch of rows that aren't known yet. Does not commit.
+    """
+    seen = {r[_AREA_IDX]: r[_CITY_IDX] for r in rows if r[_AREA_IDX] is not None}
+    if not seen:
+        return
+    cur = conn.cursor()
+    ids = list(seen)
+    cur.execute(f"SELECT id FROM areas WHERE id IN ({','.join('?' for _ in ids)});", ids)
+    known = {row[0] for row in cur.fetchall()}
+    store_areas(conn, [(aid, name, None) for aid, name in seen.items() if aid not in known])
+
+def refresh_areas(conn: sqlite3.Connection, client: HHClient):
+    """
+    Load HH's full /areas tree (countries -> regions -> cities) with parent links.
+    """
+    tree = client.get_json('/areas')
+    if not tree:
+        print("[WARN] Could not fetch HH areas; keeping stored ones.", file=sys.stderr)
+        return False
+    flat = []
+    stack = [(node, None) for node in tree]
+    while stack:
+        node, parent = stack.pop()
+        try:
+            aid = int(node.get('id'))
+        except (TypeError, ValueError):
+            continue
+        flat.append((aid, node.get('name'), parent))
+        stack.extend((child, aid) for child in node.get('areas') or [])
+    store_areas(conn, flat)
+    # parent links are known now, so rows crawled before the country column can be placed
+    backfill_countries(conn)
+    conn.commit()
+    print(f"[DB] Stored {len(flat)} HH areas.")
+    return True
+
+def backfill_countries(conn: sqlite3.Connection):
+    """
+    Set country for rows that have none by walking their area up the areas tree to
+    a COUNTRY_CODES root. Rows whose area has no known parent chain stay NULL until
+    they are crawled again (or --refresh-areas loads the tree). Does not commit.
+    """
+    roots = ",".join(f"({area_id}, '{code}')" for code, area_id in COUNTRY_CODES.items())
+    before = conn.total_changes
+    conn.execute(f"""
+        WITH RECURSIVE roots(area_id, code) AS (VALUES {roots}),
+        chain(area_id, top_id) AS (
+            SELECT id, id FROM areas
+            UNION ALL
+            SELECT chain.area_id, areas.parent_id FROM chain JOIN areas ON areas.id = chain.top_id
+            WHERE areas.parent_id IS NOT NULL
+        )
+        UPDATE vacancies SET country = (
+            SELECT roots.code FROM chain JOIN roots ON roots.area_id = chain.top_id
+            WHERE chain.area_id = vacancies.area_id
+        )
+        WHERE country IS NULL AND area_id IS NOT NULL
+          AND area_id IN (SELECT chain.area_id FROM chain JOIN roots ON roots.area_id = chain.top_id);
+    """)
+    # cursor.rowcount isn't reported for statements starting with WITH
+    filled = conn.total_changes - before
+    if filled:
+        print(f"[DB] Backfilled country for {filled} rows.")
+
+def backfill_area_ids(conn: sqlite3.Connection, chunk_size=1000):
+    """
+    Fill area_id (and the areas table) for rows stored before the column existed,
+    from the raw HH item. Does not commit.
+    """
+    cur = conn.cursor()
+    last_id = 0
+    filled = 0
+    while True:
+        cur.execute("""
+            SELECT v.id, r.raw_zlib FROM vacancies v JOIN vacancy_raw r ON r.vacancy_id = v.id
+            WHERE v.id > ? ORDER BY v.id LIMIT ?;
+        """, (last_id, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        updates = []
+        areas = {}
+        for vid, blob in chunk:
+            area = (json.loads(decompress_raw_json(blob)) or {}).get('area') if blob else None
+            aid = parse_area_id(area)
+            if aid is not None:
+                updates.append((aid, vid))
+                areas[aid] = clean_highlight_tags(area.get('name'))
+        store_areas(conn, [(aid, name, None) for aid, name in areas.items()])
+        conn.executemany("UPDATE vacancies SET area_id = ? WHERE id = ?;", updates)
+        filled += len(updates)
+    if filled:
+        print(f"[DB] Backfilled area_id for {filled} rows.")
+
+def load_currency_rates(conn: sqlite3.Connection):
+    """
+    Return {currency code: KZT per unit}.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT code, kzt_per_unit FROM currency_rates;")
+    return dict(cur.fetchall())
+
+def refresh_currency_rates(conn: sqlite3.Connection, client: HHClient):
+    """
+    Pull current rates from HH's /dictionaries (quoted per RUR), store them as
+    KZT per unit and re-normalise salary_kzt for every row. Returns False if HH
+    could not be reached; the existing rates are kept.
+    """
+    data = client.get_json('/dictionaries')
+    currencies = (data or {}).get('currency') or []
+    per_rur = {c.get('code'): c.get('rate') for c in currencies if c.get('code') and c.get('rate')}
+    if 'KZT' not in per_rur:
+        print("[WARN] Could not refresh currency rates; keeping stored ones.", file=sys.stderr)
+        return False
+    now = dt.datetime.now(ALMATY_TZ).isoformat()
+    conn.executemany("""
+        INSERT INTO currency_rates (code, kzt_per_unit, updated_at) VALUES (?,?,?)
+        ON CONFLICT(code) DO UPDATE SET kzt_per_unit = excluded.kzt_per_unit, updated_at = excluded.updated_at
+    """, [(code, per_rur['KZT'] / rate, now) for code, rate in per_rur.items()])
+    renormalize_salaries(conn)
+    conn.commit()
+    print(f"[DB] Refreshed {len(per_rur)} currency rates.")
+    return True
+
+def renormalize_salaries(conn: sqlite3.Connection):
+    """
+    Recompute salary_kzt from salary_from/salary_to with the stored rates. Does not commit.
+    """
+    conn.execute("""
+        UPDATE vacancies SET salary_kzt = (
+            SELECT CAST(round(coalesce(vacancies.salary_from, vacancies.salary_to) * r.kzt_per_unit) AS INTEGER)
+            FROM currency_rates r WHERE r.code = vacancies.salary_currency
+        )
+        WHERE salary_currency IS NOT NULL;
+    """)
+
+def backfill_salary_columns(conn: sqlite3.Connection, chunk_size=1000):
+    """
+    Fill the typed salary columns for rows stored before they existed, from the
+    raw HH item. Does not commit.
+    """
+    rates = load_currency_rates(conn)
+    cur = conn.cursor()
+    last_id = 0
+    filled = 0
+    while True:
+        cur.execute("""
+            SELECT v.id, r.raw_zlib FROM vacancies v JOIN vacancy_raw r ON r.vacancy_id = v.id
+            WHERE v.id > ? AND v.salary IS NOT NULL ORDER BY v.id LIMIT ?;
+        """, (last_id, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        updates = []
+        for vid, blob in chunk:
+            salary = (json.loads(decompress_raw_json(blob)) or {}).get('salary') if blob else None
+            updates.append((*parse_salary(salary, rates), vid))
+        conn.executemany("UPDATE vacancies SET salary_from = ?, salary_to = ?, salary_currency = ?, salary_kzt = ? WHERE id = ?;",
+                         updates)
+        filled += len(updates)
+    if filled:
+        print(f"[DB] Backfilled typed salary columns for {filled} rows.")
+
+def table_exists(conn: sqlite3.Connection, name):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (name,))
+    return cur.fetchone() is not None
+
+# Column weights for bm25 ranking, in FTS column order: a title hit beats a requirements hit, etc.
+FTS_COLUMNS = ('title', 'requirements', 'responsibilities', 'employer')
+FTS_RANK = 'bm25(10.0, 4.0, 2.0, 1.0)'
+
+def _fts_norm(expr):
+    # unicode61 folds case for Cyrillic but has no ё/е folding, so index (and query) with е
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+def ensure_fts(conn: sqlite3.Connection):
+    """
+    Create the vacancies_fts full-text index (contentless FTS5 keyed by vacancies.id)
+    and the triggers that keep it in sync with every INSERT/UPDATE/DELETE.
+    unicode61 folds case for Cyrillic (Russian and Kazakh letters) as well as Latin;
+    text is indexed with ё -> е, so queries must do the same. Prefix indexes keep
+    'разраб*' style queries fast. Returns False when this SQLite build has no FTS5.
+    """
+    cols = ", ".join(FTS_COLUMNS)
+    new_cols = ", ".join(_fts_norm(f"new.{c}") for c in FTS_COLUMNS)
+    old_cols = ", ".join(_fts_norm(f"old.{c}") for c in FTS_COLUMNS)
+    # an upsert that only merges a keyword rewrites the same text: leave the index alone then
+    update_trigger = f"""
+    CREATE TRIGGER vacancies_fts_au AFTER UPDATE OF {cols} ON vacancies
+    WHEN {" OR ".join(f"old.{c} IS NOT new.{c}" for c in FTS_COLUMNS)} BEGIN
+        INSERT INTO vacancies_fts(vacancies_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+        INSERT INTO vacancies_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+    END;
+    """
+    cur = conn.cursor()
+    if table_exists(conn, 'vacancies_fts'):
+        cur.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'vacancies_fts_au';")
+        row = cur.fetchone()
+        if row and ' WHEN ' not in row[0]:
+            cur.execute("DROP TRIGGER vacancies_fts_au;")
+            cur.execute(update_trigger)
+        return True
+    try:
+        cur.execute(f"""
+        CREATE VIRTUAL TABLE vacancies_fts USING fts5(
+            {cols},
+            content='',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        );
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"[WARN] FTS5 not available, full-text index disabled: {e}", file=sys.stderr)
+        return False
+    cur.execute(f"""
+    CREATE TRIGGER vacancies_fts_ai AFTER INSERT ON vacancies BEGIN
+        INSERT INTO vacancies_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+    END;
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER vacancies_fts_ad AFTER DELETE ON vacancies BEGIN
+        INSERT INTO vacancies_fts(vacancies_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+    END;
+    """)
+    cur.execute(update_trigger)
+    cur.execute(f"INSERT INTO vacancies_fts(vacancies_fts, rank) VALUES ('rank', '{FTS_RANK}');")
+    cur.execute(f"""
+        INSERT INTO vacancies_fts(rowid, {cols})
+        SELECT id, {", ".join(_fts_norm(c) for c in FTS_COLUMNS)} FROM vacancies;
+    """)
+    print("[DB] Created vacancies_fts full-text index.")
+    return True
+
+def ensure_column(conn: sqlite3.Connection, table, column, decl):
     """
-    rows: iterable of tuples matching the insert columns:
-    (url,title,employer,city,publish_date,salary,requirements,responsibilities,job_keyword,raw_json,inserted_at)
+    ALTER TABLE ... ADD COLUMN for DBs created before the column existed. Returns True if added.
+    """
+    cur = conn.cursor()
+    cur.execute(f"PRAGMA table_info({table});")
+    if column in [row[1] for row in cur.fetchall()]:
+        return False
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+    print(f"[DB] Added {table}.{column} column.")
+    return True
+
+_INSERT_COLS = ",".join(VACANCY_COLUMNS)
+_INSERT_PARAMS = ",".join("?" for _ in VACANCY_COLUMNS)
+# student_friendly depends on every keyword a vacancy was found under and on its details, not just the
+# row being written: a conflicting row is reclassified after the upsert instead (reclassify_vacancies)
+_UPDATE_COLS = [c for c in VACANCY_COLUMNS
+                if c not in ('url', 'job_keyword', 'student_friendly', 'student_rules_version')]
+# a conflicting row keeps its stored snippets unless its hashed content changed (see HASHED_COLUMNS);
+# SET expressions see the old row, so vacancies.content_hash is still the stored hash here
+_UPDATE_SET = ", ".join(
+    f"{c} = CASE WHEN vacancies.content_hash IS excluded.content_hash THEN coalesce(vacancies.{c}, excluded.{c}) "
+    f"ELSE excluded.{c} END" if c in SNIPPET_COLUMNS else f"{c}=excluded.{c}"
+    for c in _UPDATE_COLS)
+_URL_IDX = ROW_COLUMNS.index('url')
+_KEYWORD_IDX = ROW_COLUMNS.index('job_keyword')
+_HASH_IDX = ROW_COLUMNS.index('content_hash')
+_SEEN_IDX = ROW_COLUMNS.index('inserted_at')
+_RAW_IDX = ROW_COLUMNS.index('raw_zlib')
+_AREA_IDX = ROW_COLUMNS.index('area_id')
+_CITY_IDX = ROW_COLUMNS.index('city')
+_COUNTRY_IDX = ROW_COLUMNS.index('country')
+_PUBLISH_DATE_IDX = ROW_COLUMNS.index('publish_date')
+_PUBLISHED_TS_IDX = ROW_COLUMNS.index('published_ts')
+
+# A conflicting row is only rewritten when its content changed or it was found under a new keyword.
+# job_keyword is a bounded display string (each keyword at most once); vacancy_keywords is the index.
+_UPSERT_SQL = f"""
+    INSERT INTO vacancies ({_INSERT_COLS})
+    VALUES ({_INSERT_PARAMS})
+    ON CONFLICT(url) DO UPDATE SET
+        {_UPDATE_SET},
+        job_keyword = CASE
+            WHEN vacancies.job_keyword IS NULL OR vacancies.job_keyword = '' THEN excluded.job_keyword
+            WHEN excluded.job_keyword IS NULL OR excluded.job_keyword = '' THEN vacancies.job_keyword
+            WHEN ';' || vacancies.job_keyword || ';' LIKE '%;' || excluded.job_keyword || ';%' THEN vacancies.job_keyword
+            ELSE vacancies.job_keyword || ';' || excluded.job_keyword
+        END
+    WHERE vacancies.content_hash IS NOT excluded.content_hash
+       OR vacancies.country IS NOT excluded.country
+       OR ';' || coalesce(vacancies.job_keyword, '') || ';' NOT LIKE '%;' || coalesce(excluded.job_keyword, '') || ';%'
+"""
+
+def _has_keyword(job_keyword, keyword):
+    if not keyword:
+        return True
+    return keyword in (job_keyword or '').split(';')
+
+def classify_rows(conn: sqlite3.Connection, rows, chunk_size=500):
+    """
+    Split rows by what the DB already holds for their url.
+    Returns (new_rows, changed_rows, unchanged_rows). A row is unchanged when the
+    stored content_hash and country match and its keyword is already recorded.
+    """
+    cur = conn.cursor()
+    existing = {}
+    urls = list({r[_URL_IDX] for r in rows})
+    for i in range(0, len(urls), chunk_size):
+        chunk = urls[i:i + chunk_size]
+        cur.execute(f"SELECT url, content_hash, job_keyword, country FROM vacancies WHERE url IN ({','.join('?' for _ in chunk)});",
+                    chunk)
+        for url, content_hash, job_keyword, country in cur.fetchall():
+            existing[url] = (content_hash, job_keyword, country)
+    new_rows, changed_rows, unchanged_rows = [], [], []
+    for r in rows:
+        prev = existing.get(r[_URL_IDX])
+        if prev is None:
+            new_rows.append(r)
+        elif prev[0] == r[_HASH_IDX] and prev[2] == r[_COUNTRY_IDX] and _has_keyword(prev[1], r[_KEYWORD_IDX]):
+            unchanged_rows.append(r)
+        else:
+            changed_rows.append(r)
+    return new_rows, changed_rows, unchanged_rows
+
+def link_keywords(conn: sqlite3.Connection, rows):
+    """
+    Map every row's vacancy to the keyword it was found under. Idempotent; does not commit.
+    """
+    pairs = {(r[_URL_IDX], r[_KEYWORD_IDX]) for r in rows if r[_KEYWORD_IDX]}
+    if not pairs:
+        return
+    conn.executemany("INSERT OR IGNORE INTO keywords (keyword) VALUES (?);", {(k,) for _, k in pairs})
+    conn.executemany("""
+        INSERT OR IGNORE INTO vacancy_keywords (vacancy_id, keyword_id)
+        SELECT v.id, k.id FROM vacancies v JOIN keywords k ON k.keyword = ?2 WHERE v.url = ?1
+    """, pairs)
+
+def store_raw(conn: sqlite3.Connection, rows):
+    """
+    Write each row's compressed HH item to vacancy_raw. Does not commit.
+    """
+    conn.executemany("""
+        INSERT INTO vacancy_raw (vacancy_id, raw_zlib)
+        SELECT id, ?1 FROM vacancies WHERE url = ?2
+        ON CONFLICT(vacancy_id) DO UPDATE SET raw_zlib = excluded.raw_zlib
+    """, [(r[_RAW_IDX], r[_URL_IDX]) for r in rows if r[_RAW_IDX] is not None])
+
+def record_sightings(conn: sqlite3.Connection, rows, run_id=None):
+    """
+    Set first_seen_at (once), last_seen_at and (given a run_id) last_seen_run for every
+    row's vacancy. Does not commit.
+    """
+    conn.executemany("""
+        INSERT INTO vacancy_seen (vacancy_id, first_seen_at, last_seen_at, last_seen_run)
+        SELECT id, ?1, ?1, ?3 FROM vacancies WHERE url = ?2
+        ON CONFLICT(vacancy_id) DO UPDATE SET
+            last_seen_at = excluded.last_seen_at,
+            last_seen_run = coalesce(excluded.last_seen_run, vacancy_seen.last_seen_run)
+    """, [(r[_SEEN_IDX], r[_URL_IDX], run_id) for r in rows])
+
+def vacancy_ids(conn: sqlite3.Connection, urls, chunk_size=500):
+    """
+    Ids of the vacancies with the given urls.
+    """
+    urls = list(urls)
+    ids = []
+    for i in range(0, len(urls), chunk_size):
+        chunk = urls[i:i + chunk_size]
+        ids.extend(vid for (vid,) in conn.execute(
+            f"SELECT id FROM vacancies WHERE url IN ({','.join('?' for _ in chunk)});", chunk))
+    return ids
+
+def upsert_rows(conn: sqlite3.Connection, rows, commit=True, run_id=None):
+    """
+    rows: iterable of tuples in ROW_COLUMNS order (see item_to_row).
+    Only new rows and rows whose content_hash changed are written (raw_zlib to vacancy_raw); unchanged
+    vacancies just get their last_seen_at bumped in vacancy_seen. A written row that was already
+    stored (or is in rows twice) keeps its student_friendly flag from the upsert and is reclassified
+    with its merged job_keyword and vacancy_details.
     Uses UPSERT (ON CONFLICT DO UPDATE). This requires SQLite >= 3.24.
+    commit=False leaves the transaction open so callers can add bookkeeping to it.
+    run_id is recorded as every row's last_seen_run.
+    Returns (inserted, updated, unchanged) counts.
     """
+    rows = list(rows)
+    new_rows, changed_rows, unchanged_rows = classify_rows(conn, rows)
+    to_write = new_rows + changed_rows
     cur = conn.cursor()
     try:
-        cur.executemany("""
-        INSERT INTO vacancies (url,title,employer,city,publish_date,salary,requirements,responsibilities,job_keyword,raw_json,inserted_at)
-        VALUES (?,?,?,?,?,?,?,?,?,?,?)
-        ON CONFLICT(url) DO UPDATE SET
-            title=excluded.title,
-            employer=excluded.employer,
-            city=excluded.city,
-            publish_date=excluded.publish_date,
-            salary=excluded.salary,
-            requirements=excluded.requirements,
-            responsibilities=excluded.responsibilities,
-            job_keyword = CASE
-                WHEN vacancies.job_keyword IS NULL OR vacancies.job_keyword = '' THEN excluded.job_keyword
-                WHEN excluded.job_keyword IS NULL OR excluded.job_keyword = '' THEN vacancies.job_keyword
-                ELSE vacancies.job_keyword || ';' || excluded.job_keyword
-            END,
-            raw_json=excluded.raw_json,
-            inserted_at=excluded.inserted_at
-        """, rows)
+        cur.executemany(_UPSERT_SQL, [r[:-1] for r in to_write])
     except sqlite3.OperationalError as e:
         conn.rollback()
-        for r in rows:
+        update_sql = f"""
+            UPDATE vacancies SET
+                {_UPDATE_SET.replace("vacancies.", "").replace("excluded.", ":")},
+                job_keyword = CASE
+                    WHEN job_keyword IS NULL OR job_keyword = '' THEN :job_keyword
+                    WHEN :job_keyword IS NULL OR :job_keyword = '' THEN job_keyword
+                    WHEN ';' || job_keyword || ';' LIKE '%;' || :job_keyword || ';%' THEN job_keyword
+                    ELSE job_keyword || ';' || :job_keyword
+                END
+            WHERE url = :url
+        """
+        for r in to_write:
             try:
-                cur.execute("""
-                    INSERT OR IGNORE INTO vacancies (url,title,employer,city,publish_date,salary,requirements,responsibilities,job_keyword,raw_json,inserted_at)
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?)
-                """, r)
-                cur.execute("""
-                    UPDATE vacancies SET
-                        title = ?,
-                        employer = ?,
-                        city = ?,
-                        publish_date = ?,
-                        salary = ?,
-                        requirements = ?,
-                        responsibilities = ?,
-                        job_keyword = CASE
-                            WHEN job_keyword IS NULL OR job_keyword = '' THEN ?
-                            WHEN ? IS NULL OR ? = '' THEN job_keyword
-                            ELSE job_keyword || ';' || ?
-                        END,
-                        raw_json = ?,
-                        inserted_at = ?
-                    WHERE url = ?
-                """, (r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8], r[8], r[8], r[9], r[10], r[0]))
+                cur.execute(f"INSERT OR IGNORE INTO vacancies ({_INSERT_COLS}) VALUES ({_INSERT_PARAMS})", r[:-1])
+                if cur.rowcount == 0:
+                    cur.execute(update_sql, dict(zip(VACANCY_COLUMNS, r)))
             except Exception as ex:
-                print(f"[WARN] fallback upsert failed for {r[0]}: {ex}", file=sys.stderr)
-    conn.commit()
+                print(f"[WARN] fallback upsert failed for {r[_URL_IDX]}: {ex}", file=sys.stderr)
+    merged = {r[_URL_IDX] for r in changed_rows}
+    first = set()
+    for r in new_rows:
+        if r[_URL_IDX] in first:
+            merged.add(r[_URL_IDX])
+        first.add(r[_URL_IDX])
+    if merged:
+        reclassify_vacancies(conn, vacancy_ids(conn, merged))
+    store_raw(conn, to_write)
+    store_row_areas(conn, to_write)
+    link_keywords(conn, rows)
+    record_sightings(conn, rows, run_id)
+    if commit:
+        conn.commit()
+    return len(new_rows), len(changed_rows), len(unchanged_rows)
 
-def ensure_student_column(conn: sqlite3.Connection):
+# -------- Bulk load (--bulk) --------
+# Staging mirrors ROW_COLUMNS with no constraints or indexes: appending to it is as cheap as SQLite gets.
+_STAGING_SQL = f"CREATE TEMP TABLE IF NOT EXISTS vacancy_staging ({', '.join(ROW_COLUMNS)});"
+_STAGE_INSERT_SQL = f"INSERT INTO temp.vacancy_staging VALUES ({','.join('?' for _ in ROW_COLUMNS)});"
+
+def apply_bulk_pragmas(conn: sqlite3.Connection, cache_mb=256, mmap_mb=1024):
     """
-    Add student_friendly INTEGER column if it doesn't exist (0/1).
+    Connection settings for a full reload: a big page cache, memory-mapped reads and
+    in-memory temp tables (the staging table and the sorter used by index rebuilds).
     """
     cur = conn.cursor()
-    cur.execute("PRAGMA table_info(vacancies);")
-    cols = [row[1] for row in cur.fetchall()]
-    if 'student_friendly' not in cols:
-        cur.execute("ALTER TABLE vacancies ADD COLUMN student_friendly INTEGER DEFAULT 0;")
-        conn.commit()
-        print("[DB] Added student_friendly column.")
-    else:
-        print("[DB] student_friendly column already exists.")
+    cur.execute(f"PRAGMA cache_size=-{cache_mb * 1024};")
+    cur.execute(f"PRAGMA mmap_size={mmap_mb * 1024 * 1024};")
+    cur.execute("PRAGMA temp_store=MEMORY;")
+    cur.execute(_STAGING_SQL)
 
-def mark_student_friendly(conn: sqlite3.Connection):
+def stage_rows(conn: sqlite3.Connection, rows):
     """
-    Mark student_friendly = 1 for rows that match student-friendly rules,
-    otherwise mark 0. This uses several heuristics:
-      - keep if requirements/title/job_keyword/employer mention: no experience, for students, internship, intern, trainee, junior, startup
-      - exclude if title contains senior/middle/lead/principal/manager/sr
+    Append rows (ROW_COLUMNS order) to temp.vacancy_staging. Does not commit.
+    """
+    conn.executemany(_STAGE_INSERT_SQL, rows)
+
+def merge_staging(conn: sqlite3.Connection, rebuild_indexes=True, rebuild_fraction=0.2, run_id=None):
+    """
+    Move everything in temp.vacancy_staging into the real tables with set-based
+    statements: one INSERT ... SELECT ... ON CONFLICT for vacancies (same rules as
+    _UPSERT_SQL), then vacancy_raw, areas, vacancy_keywords and vacancy_seen.
+    With rebuild_indexes, and when the rows to write are more than rebuild_fraction
+    of the table (always on a cold load), the secondary indexes on vacancies are
+    dropped first and recreated afterwards; on a mostly-unchanged reload keeping
+    them is cheaper. Runs in the caller's transaction
+    and does not commit (ANALYZE runs after the caller commits, see analyze_after_bulk).
+    run_id is recorded as last_seen_run, as in upsert_rows().
+    Returns (inserted, updated, unchanged) counted per staged row, like upsert_rows().
     """
-    ensure_student_column(conn)
     cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM temp.vacancy_staging;")
+    total = cur.fetchone()[0]
+    if not total:
+        return 0, 0, 0
+    # urls whose vacancy is missing, differs or lacks the keyword: the only ones worth (re)writing
+    cur.execute("DROP TABLE IF EXISTS temp.bulk_stale;")
+    cur.execute("CREATE TEMP TABLE bulk_stale (url TEXT PRIMARY KEY, merged INTEGER) WITHOUT ROWID;")
+    cur.execute("""
+        INSERT OR IGNORE INTO temp.bulk_stale (url)
+        SELECT s.url FROM temp.vacancy_staging s LEFT JOIN vacancies v ON v.url = s.url
+        WHERE s.url IS NOT NULL
+          AND (v.id IS NULL OR v.content_hash IS NOT s.content_hash OR v.country IS NOT s.country
+               OR ';' || coalesce(v.job_keyword, '') || ';' NOT LIKE '%;' || coalesce(s.job_keyword, '') || ';%');
+    """)
+    cur.execute("""
+        SELECT
+            sum(v.id IS NULL),
+            sum(v.id IS NOT NULL AND v.content_hash IS s.content_hash AND v.country IS s.country
+                AND ';' || coalesce(v.job_keyword, '') || ';' LIKE '%;' || coalesce(s.job_keyword, '') || ';%')
+        FROM temp.vacancy_staging s LEFT JOIN vacancies v ON v.url = s.url;
+    """)
+    inserted, unchanged = (n or 0 for n in cur.fetchone())
+    # rows the upsert will merge into a stored (or earlier staged) one: reclassified afterwards, see upsert_rows()
+    cur.execute("""
+        UPDATE temp.bulk_stale SET merged = 1
+        WHERE url IN (SELECT url FROM vacancies)
+           OR url IN (SELECT url FROM temp.vacancy_staging GROUP BY url HAVING count(*) > 1);
+    """)
 
-    keep_phrases = [
-        'no experience', 'no experience required', 'no experience needed',
-        'for students', 'для студентов', 'intern', 'internship', 'trainee',
-        'junior', 'junior developer', 'junior engineer', 'студент', 'стажировка',
-        'стажер', 'без опыта',         'стартап', 'startup', 'startups'
-    ]
+    indexes = []
+    cur.execute("SELECT (SELECT count(*) FROM temp.bulk_stale), (SELECT count(*) FROM vacancies);")
+    stale, existing = cur.fetchone()
+    if rebuild_indexes and stale > existing * rebuild_fraction:
+        # idx_cluster stays: the cluster head triggers look members up by it
+        cur.execute("""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND tbl_name = 'vacancies' AND sql IS NOT NULL AND name != 'idx_cluster';
+        """)
+        indexes = cur.fetchall()
+        for name, _ in indexes:
+            cur.execute(f"DROP INDEX {name};")
 
-    exclude_phrases = [
-        'senior', 'sr ', ' sr.', 'middle', 'mid-level', 'lead', 'principal',
-        'manager', 'head of', 'experienced', 'senior-level',         'сеньор', 'мидл'
-    ]
+    # url order keeps the UNIQUE(url) index appends sequential
+    upsert_tail = _UPSERT_SQL.split("ON CONFLICT", 1)[1]
+    cur.execute(f"""
+        INSERT INTO vacancies ({_INSERT_COLS})
+        SELECT {_INSERT_COLS} FROM temp.vacancy_staging WHERE url IN (SELECT url FROM temp.bulk_stale) ORDER BY url
+        ON CONFLICT{upsert_tail}
+    """)
+    cur.execute("SELECT v.id FROM temp.bulk_stale b JOIN vacancies v ON v.url = b.url WHERE b.merged;")
+    reclassify_vacancies(conn, [vid for (vid,) in cur.fetchall()])
+    cur.execute("""
+        INSERT INTO vacancy_raw (vacancy_id, raw_zlib)
+        SELECT v.id, s.raw_zlib FROM temp.vacancy_staging s
+        JOIN temp.bulk_stale b ON b.url = s.url
+        JOIN vacancies v ON v.url = s.url
+        WHERE s.raw_zlib IS NOT NULL
+        ON CONFLICT(vacancy_id) DO UPDATE SET raw_zlib = excluded.raw_zlib
+    """)
+    cur.execute("""
+        SELECT s.area_id, max(s.city) FROM temp.vacancy_staging s
+        WHERE s.area_id IS NOT NULL AND s.area_id NOT IN (SELECT id FROM areas)
+        GROUP BY s.area_id;
+    """)
+    store_areas(conn, [(aid, name, None) for aid, name in cur.fetchall()])
+    cur.execute("""
+        INSERT OR IGNORE INTO keywords (keyword)
+        SELECT DISTINCT job_keyword FROM temp.vacancy_staging WHERE job_keyword IS NOT NULL AND job_keyword != '';
+    """)
+    cur.execute("""
+        INSERT OR IGNORE INTO vacancy_keywords (vacancy_id, keyword_id)
+        SELECT DISTINCT v.id, k.id FROM temp.vacancy_staging s
+        JOIN temp.bulk_stale b ON b.url = s.url
+        JOIN vacancies v ON v.url = s.url
+        JOIN keywords k ON k.keyword = s.job_keyword;
+    """)
+    cur.execute("""
+        INSERT INTO vacancy_seen (vacancy_id, first_seen_at, last_seen_at, last_seen_run)
+        SELECT v.id, min(s.inserted_at), max(s.inserted_at), ? FROM temp.vacancy_staging s
+        JOIN vacancies v ON v.url = s.url
+        GROUP BY v.id
+        ON CONFLICT(vacancy_id) DO UPDATE SET
+            last_seen_at = excluded.last_seen_at,
+            last_seen_run = coalesce(excluded.last_seen_run, vacancy_seen.last_seen_run)
+    """, (run_id,))
 
-    def build_like_clause(column_name, phrases):
-        parts = []
-        for _ in phrases:
-            parts.append(f"lower({column_name}) LIKE ?")
-        if not parts:
-            return "1=0", []
-        clause = "(" + " OR ".join(parts) + ")"
-        params = [f"%{p.lower()}%" for p in phrases]
-        return clause, params
-
-    keep_clauses = []
-    keep_params = []
-    for col in ('requirements','title','job_keyword','employer'):
-        clause, params = build_like_clause(col, keep_phrases)
-        keep_clauses.append(clause)
-        keep_params.extend(params)
-    keep_sql = "(" + " OR ".join(keep_clauses) + ")"
-
-    exclude_clause, exclude_params = build_like_clause('title', exclude_phrases)
-
-    cur.execute("UPDATE vacancies SET student_friendly = 0;")
-    conn.commit()
+    for _, sql in indexes:
+        cur.execute(sql)
+    cur.execute("DELETE FROM temp.vacancy_staging;")
+    cur.execute("DROP TABLE temp.bulk_stale;")
+    return inserted, total - inserted - unchanged, unchanged
 
-    update_sql = f"""
-        UPDATE vacancies
-        SET student_friendly = 1
-        WHERE {keep_sql} AND NOT {exclude_clause};
+def analyze_after_bulk(conn: sqlite3.Connection):
     """
-    params = tuple(keep_params + exclude_params)
-    cur.execute(update_sql, params)
+    Refresh planner statistics after a bulk merge changed table sizes wholesale.
+    """
+    conn.execute("ANALYZE;")
     conn.commit()
 
-    cur.execute("UPDATE vacancies SET student_friendly = 1 WHERE (lower(title) LIKE ? OR lower(job_keyword) LIKE ?) ;", ('%junior%','%junior%'))
-    conn.commit()
+def ensure_student_column(conn: sqlite3.Connection):
+    """
+    Add student_friendly INTEGER column if it doesn't exist (0/1).
+    """
+    if ensure_column(conn, 'vacancies', 'student_friendly', 'INTEGER DEFAULT 0'):
+        conn.commit()
+
+# -------- Student-friendly classifier --------
+# Bump STUDENT_RULES_VERSION whenever the phrases or the logic below change:
+# mark_student_friendly() then reclassifies every row stored under an older version.
+STUDENT_RULES_VERSION = 2
+
+KEEP_PHRASES = [
+    'no experience', 'no experience required', 'no experience needed',
+    'for students', 'для студентов', 'intern', 'internship', 'trainee',
+    'junior', 'junior developer', 'junior engineer', 'студент', 'стажировка',
+    'стажер', 'без опыта', 'стартап', 'startup', 'startups'
+]
+
+EXCLUDE_PHRASES = [
+    'senior', 'sr ', ' sr.', 'middle', 'mid-level', 'lead', 'principal',
+    'manager', 'head of', 'experienced', 'senior-level', 'сеньор', 'мидл'
+]
+
+def _phrase_regex(phrases):
+    # plain substring semantics (like the old LIKE '%phrase%'), longest first, one pass per text
+    return re.compile("|".join(re.escape(p) for p in sorted(set(phrases), key=len, reverse=True)))
+
+_KEEP_RE = _phrase_regex(p.lower() for p in KEEP_PHRASES)
+_EXCLUDE_RE = _phrase_regex(p.lower() for p in EXCLUDE_PHRASES)
+
+def classify_student_friendly(title, requirements, job_keyword, employer, description=None, experience_id=None):
+    """
+    Return 1 if a vacancy looks student-friendly, else 0:
+      - keep if requirements/title/job_keyword/employer (or the full description, once enriched) mention:
+        no experience, for students, internship, intern, trainee, junior, startup
+      - keep if HH's experience is 'noExperience' (from vacancy details)
+      - exclude if title contains senior/middle/lead/principal/manager/sr
+      - 'junior' in title or job_keyword always keeps it
+    """
+    title_l = (title or '').lower()
+    keyword_l = (job_keyword or '').lower()
+    if 'junior' in title_l or 'junior' in keyword_l:
+        return 1
+    if _EXCLUDE_RE.search(title_l):
+        return 0
+    if experience_id == 'noExperience':
+        return 1
+    # \x00 can't occur in a phrase, so no match spans two fields
+    text = "\x00".join((title_l, (requirements or '').lower(), keyword_l, (employer or '').lower(),
+                        (description or '').lower()))
+    return 1 if _KEEP_RE.search(text) else 0
+
+def mark_student_friendly(conn: sqlite3.Connection, chunk_size=1000):
+    """
+    Classify rows whose student_friendly flag was computed by an older rule set
+    (or never), using vacancy_details where the row has been enriched. New and
+    changed rows are classified by item_to_row() at ingest (and again by
+    enrich_details()), so on a normal run this touches nothing. Each row goes straight to its final
+    value, so readers never see a reset table. Returns the number reclassified.
+    """
+    ensure_student_column(conn)
+    cur = conn.cursor()
+    reclassified = 0
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT v.id, v.title, v.requirements, v.job_keyword, v.employer, d.description, d.experience_id
+            FROM vacancies v LEFT JOIN vacancy_details d ON d.vacancy_id = v.id
+            WHERE v.id > ? AND v.student_rules_version IS NOT ?
+            ORDER BY v.id LIMIT ?;
+        """, (last_id, STUDENT_RULES_VERSION, chunk_size))
+        chunk = cur.fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        conn.executemany("UPDATE vacancies SET student_friendly = ?, student_rules_version = ? WHERE id = ?;",
+                         [(classify_student_friendly(*fields), STUDENT_RULES_VERSION, vid) for vid, *fields in chunk])
+        conn.commit()
+        reclassified += len(chunk)
+    if reclassified:
+        print(f"[DB] Reclassified {reclassified} rows with student rules v{STUDENT_RULES_VERSION}.")
 
     cur.execute("SELECT COUNT(*) FROM vacancies;")
     total = cur.fetchone()[0]
     cur.execute("SELECT COUNT(*) FROM vacancies WHERE student_friendly = 1;")
     friendly = cur.fetchone()[0]
     print(f"[DB] Marked student_friendly: {friendly}/{total} rows.")
+    return reclassified
+
+def reclassify_vacancies(conn: sqlite3.Connection, ids, chunk_size=500):
+    """
+    Recompute student_friendly for the given vacancy ids with their details. Does not commit.
+    """
+    ids = list(ids)
+    cur = conn.cursor()
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        cur.execute(f"""
+            SELECT v.id, v.title, v.requirements, v.job_keyword, v.employer, d.description, d.experience_id
+            FROM vacancies v LEFT JOIN vacancy_details d ON d.vacancy_id = v.id
+            WHERE v.id IN ({",".join("?" for _ in chunk)});
+        """, chunk)
+        conn.executemany("""
+            UPDATE vacancies SET student_friendly = ?1, student_rules_version = ?2
+            WHERE id = ?3 AND (student_friendly IS NOT ?1 OR student_rules_version IS NOT ?2);
+        """, [(classify_student_friendly(*fields), STUDENT_RULES_VERSION, vid) for vid, *fields in cur.fetchall()])
 
 def prune_non_student_vacancies(conn: sqlite3.Connection):
     """
@@ -226,25 +1305,208 @@ def prune_non_student_vacancies(conn: sqlite3.Connection):
     print(f"[DB] Deleting {to_delete} non-student vacancies... (this operation is irreversible)")
     cur.execute("DELETE FROM vacancies WHERE student_friendly = 0;")
     conn.commit()
+    # no-op unless the DB is in auto_vacuum=INCREMENTAL mode (see ensure_incremental_vacuum)
+    conn.executescript("PRAGMA incremental_vacuum;")
     cur.execute("SELECT COUNT(*) FROM vacancies;")
     remaining = cur.fetchone()[0]
     print(f"[DB] Deleted. Remaining rows: {remaining}")
 
+# -------- Retention (--retain-days / --retain-runs) --------
+def ensure_incremental_vacuum(conn: sqlite3.Connection):
+    """
+    Switch a DB created before auto_vacuum=INCREMENTAL to it. That takes one full VACUUM,
+    so it only happens the first time retention is used; after it, freed pages go back
+    to the OS with PRAGMA incremental_vacuum, which needs no long exclusive lock.
+    """
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:
+        return
+    print("[DB] Converting to auto_vacuum=INCREMENTAL (one-time full VACUUM)...")
+    conn.commit()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    conn.execute("VACUUM;")
+
+def run_countries(options_json):
+    """
+    Countries a pipeline_runs row crawled, from its options_json ('countries', or the single
+    'country' of runs from before multi-country crawls); [] when unknown.
+    """
+    try:
+        options = json.loads(options_json or '{}')
+        return parse_countries(options.get('countries') or options.get('country'))
+    except (TypeError, ValueError):
+        return []
+
+def retention_cutoff_runs(conn: sqlite3.Connection, retain_runs, current_run=None):
+    """
+    {country: run_id of the retain_runs-th most recent full (non-incremental) crawl of that
+    country that finished}, counting current_run as finished. Only the runs that crawled a
+    country count for it, so a KZ-only run never ages out RU vacancies; incremental runs don't
+    re-see unchanged vacancies, so they don't count either. Countries with fewer full crawls
+    than that are left out.
+    """
+    crawls, cutoffs = {}, {}
+    for run_id, options_json in conn.execute("""
+        SELECT run_id, options_json FROM pipeline_runs
+        WHERE (status = 'finished' OR run_id = ?)
+          AND NOT coalesce(json_extract(options_json, '$.incremental'), 0)
+        ORDER BY run_id DESC;
+    """, (current_run,)):
+        for country in run_countries(options_json):
+            crawls[country] = crawls.get(country, 0) + 1
+            if crawls[country] == max(1, retain_runs):
+                cutoffs[country] = run_id
+    return cutoffs
+
+def expire_vacancies(conn: sqlite3.Connection, retain_days=None, retain_runs=None, current_run=None,
+                     chunk_size=1000):
+    """
+    Delete vacancies that were not seen in the last retain_runs full crawls of their country
+    (see retention_cutoff_runs) and/or within retain_days (with both, a vacancy is kept if
+    either window still covers it). Rows without a last_seen_run or a country, or of a
+    country with fewer full crawls so far, are only judged by retain_days. A run re-sees
+    only the keywords it crawls: dropping a keyword from hhData expires the vacancies that
+    no remaining keyword finds. Deletes run in chunks of chunk_size, each its own short
+    transaction that cascades to the side tables and the FTS index and is followed by an
+    incremental vacuum. Returns the number deleted.
+    """
+    cutoffs = {}
+    if retain_runs:
+        cutoffs = retention_cutoff_runs(conn, retain_runs, current_run)
+        if cutoffs:
+            print("[DB] Retention: expiring vacancies last seen before run " +
+                  ", ".join(f"{run_id} ({country})" for country, run_id in sorted(cutoffs.items())))
+        else:
+            print(f"[DB] Retention: fewer than {retain_runs} full crawls of any country so far, nothing expires by run.")
+            if not retain_days:
+                return 0
+    if not retain_days and not retain_runs:
+        return 0
+    # the countries' cutoffs as a table; a single row that matches nothing when there are none
+    cutoff_sql = " UNION ALL ".join("SELECT ?, ?" for _ in cutoffs) or "SELECT NULL, NULL WHERE 0"
+    params = [v for item in cutoffs.items() for v in item]
+    by_run = "s.last_seen_run < c.run_id"
+    if retain_days:
+        by_days = "s.last_seen_at < ?"
+        params.append((dt.datetime.now(ALMATY_TZ) - dt.timedelta(days=retain_days)).isoformat())
+        where = f"{by_days} AND (c.run_id IS NULL OR s.last_seen_run IS NULL OR {by_run})" if retain_runs else by_days
+    else:
+        where = by_run
+    ids = [row[0] for row in conn.execute(f"""
+        WITH cutoff(country, run_id) AS ({cutoff_sql})
+        SELECT s.vacancy_id FROM vacancy_seen s
+        JOIN vacancies v ON v.id = s.vacancy_id
+        LEFT JOIN cutoff c ON c.country = v.country
+        WHERE {where};
+    """, params)]
+    if not ids:
+        return 0
+    ensure_incremental_vacuum(conn)
+    cur = conn.cursor()
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        cur.execute(f"DELETE FROM vacancies WHERE id IN ({','.join('?' for _ in chunk)});", chunk)
+        # vacancy_seen rows go with their vacancy (ON DELETE CASCADE); an orphan would linger
+        cur.execute(f"DELETE FROM vacancy_seen WHERE vacancy_id IN ({','.join('?' for _ in chunk)});", chunk)
+        conn.commit()
+        # frees one page per step and returns no rows: execute() would step it once, executescript() runs it out
+        conn.executescript("PRAGMA incremental_vacuum;")
+    print(f"[DB] Retention: deleted {len(ids)} vacancies not seen within the window.")
+    return len(ids)
+
+def get_crawl_state(conn: sqlite3.Connection, keyword, country):
+    """
+    Return (newest_published_at, newest_published_ts) for keyword/country, or (None, None).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT newest_published_at, newest_published_ts FROM crawl_state WHERE keyword = ? AND country = ?;",
+                (keyword, country))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+def save_crawl_state(conn: sqlite3.Connection, keyword, country, published_at, published_ts):
+    """
+    Advance the high-water mark for keyword/country. Never moves it backwards.
+    Does not commit.
+    """
+    conn.execute("""
+        INSERT INTO crawl_state (keyword, country, newest_published_at, newest_published_ts, updated_at)
+        VALUES (?,?,?,?,?)
+        ON CONFLICT(keyword, country) DO UPDATE SET
+            newest_published_at = excluded.newest_published_at,
+            newest_published_ts = excluded.newest_published_ts,
+            updated_at = excluded.updated_at
+        WHERE crawl_state.newest_published_ts IS NULL
+           OR excluded.newest_published_ts > crawl_state.newest_published_ts
+    """, (keyword, country, published_at, published_ts, dt.datetime.now(ALMATY_TZ).isoformat()))
+
+def start_run(conn: sqlite3.Connection, options: dict):
+    """
+    Register a new pipeline run and return its run_id.
+    """
+    cur = conn.cursor()
+    cur.execute("INSERT INTO pipeline_runs (started_at, status, options_json) VALUES (?, 'running', ?);",
+                (dt.datetime.now(ALMATY_TZ).isoformat(), json.dumps(options, ensure_ascii=False)))
+    conn.commit()
+    return cur.lastrowid
+
+def finish_run(conn: sqlite3.Connection, run_id, status, metrics=None):
+    """
+    Close a run; metrics is its JSON-able summary (stored in metrics_json).
+    """
+    conn.execute("UPDATE pipeline_runs SET finished_at = ?, status = ?, metrics_json = ? WHERE run_id = ?;",
+                 (dt.datetime.now(ALMATY_TZ).isoformat(), status,
+                  json.dumps(metrics, ensure_ascii=False) if metrics is not None else None, run_id))
+    conn.commit()
+
+def find_unfinished_run(conn: sqlite3.Connection):
+    """
+    Return (run_id, options) of the most recent run that did not finish, or (None, None).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT run_id, options_json FROM pipeline_runs WHERE status != 'finished' ORDER BY run_id DESC LIMIT 1;")
+    row = cur.fetchone()
+    if not row:
+        return None, None
+    return row[0], json.loads(row[1] or '{}')
+
+def load_progress(conn: sqlite3.Connection, run_id):
+    """
+    Return {(keyword, country, shard): (next_page, done)} checkpointed for run_id.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT keyword, country, shard, next_page, done FROM crawl_progress WHERE run_id = ?;", (run_id,))
+    return {(kw, country, shard): (next_page, bool(done)) for kw, country, shard, next_page, done in cur.fetchall()}
+
+def save_progress(conn: sqlite3.Connection, run_id, keyword, country, next_page, done=False, shard=''):
+    """
+    Checkpoint a keyword (or one shard of it): pages before next_page are committed. Does not commit.
+    """
+    conn.execute("""
+        INSERT INTO crawl_progress (run_id, keyword, country, shard, next_page, done, updated_at)
+        VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT(run_id, keyword, country, shard) DO UPDATE SET
+            next_page = max(crawl_progress.next_page, excluded.next_page),
+            done = max(crawl_progress.done, excluded.done),
+            updated_at = excluded.updated_at
+    """, (run_id, keyword, country, shard, next_page, int(done), dt.datetime.now(ALMATY_TZ).isoformat()))
+
 # -------- HH API helpers --------
-def get_page_json(keyword, page, country_code, per_page=100, timeout=10):
+def get_page_json(client: HHClient, keyword, page, country_code, per_page=100, date_from=None, date_to=None):
     params = {
         'text': f'NAME:{keyword}',
         'area': country_code,
         'page': page,
         'per_page': per_page
     }
-    try:
-        r = requests.get('https://api.hh.ru/vacancies', params=params, timeout=timeout)
-        r.raise_for_status()
-        return r.json()
-    except requests.RequestException as e:
-        print(f"[ERROR] Request failed for '{keyword}' page {page}: {e}", file=sys.stderr)
-        return None
+    if date_from or date_to:
+        # newest first within the window (starting at the high-water mark for --incremental)
+        params['order_by'] = 'publication_time'
+    if date_from:
+        params['date_from'] = date_from
+    if date_to:
+        params['date_to'] = date_to
+    # the client retries 429/5xx with backoff; None means it gave up
+    return client.get_json('/vacancies', params=params)
 
 def format_salary(salary):
     if not salary:
@@ -260,16 +1522,69 @@ def format_salary(salary):
         return str(salary)
     return None
 
+def parse_salary(salary, rates=None):
+    """
+    HH salary object -> (salary_from, salary_to, currency, salary_kzt).
+    salary_kzt is the lower bound (or the only bound) converted with rates
+    ({code: KZT per unit}); None when the currency has no known rate.
+    """
+    if not salary:
+        return (None, None, None, None)
+    def as_int(v):
+        try:
+            return int(v) if v is not None else None
+        except (TypeError, ValueError):
+            return None
+    low, high = as_int(salary.get('from')), as_int(salary.get('to'))
+    currency = salary.get('currency') or None
+    rate = (rates or DEFAULT_KZT_RATES).get(currency)
+    base = low if low is not None else high
+    kzt = int(round(base * rate)) if base is not None and rate is not None else None
+    return (low, high, currency, kzt)
+
+def parse_area_id(area):
+    try:
+        return int((area or {}).get('id'))
+    except (TypeError, ValueError):
+        return None
+
+def parse_hh_datetime(value):
+    """
+    Parse HH timestamps like '2025-11-20T07:20:47+0300' into an aware datetime.
+    Returns None for empty or unparseable values.
+    """
+    if not value:
+        return None
+    # fromisoformat is far cheaper and reads '+0300' offsets on Python 3.11+; strptime covers older versions
+    try:
+        return dt.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        try:
+            return dt.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+        except (TypeError, ValueError):
+            return None
+
 def clean_highlight_tags(text):
     if text is None:
         return None
     # remove <highlighttext> and </highlighttext>
     return text.replace('<highlighttext>', '').replace('</highlighttext>', '')
 
-def item_to_row(item, job_keyword):
+def content_hash(values):
+    """
+    Stable digest of the HASHED_COLUMNS values (in that order).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for v in values:
+        h.update(b'\x1f' if v is None else str(v).encode('utf-8') + b'\x1e')
+    return h.hexdigest()
+
+def item_to_row(item, job_keyword, rates=None, country=None):
     """
     Build DB row tuple from HH vacancy item.
-    Returns: (url,title,employer,city,publish_date,salary,requirements,responsibilities,job_keyword,raw_json,inserted_at)
+    Returns a tuple in ROW_COLUMNS order, already classified for student_friendly.
+    rates: {currency: KZT per unit} for salary_kzt (default DEFAULT_KZT_RATES).
+    country: COUNTRY_CODES key the item was crawled under.
     """
     url = item.get('alternate_url')
     title = clean_highlight_tags(item.get('name'))
@@ -279,9 +1594,43 @@ def item_to_row(item, job_keyword):
     salary = format_salary(item.get('salary'))
     requirements = clean_highlight_tags((item.get('snippet') or {}).get('requirement'))
     responsibilities = clean_highlight_tags((item.get('snippet') or {}).get('responsibility'))
-    raw_json = json.dumps(item, ensure_ascii=False)
+    # compressed here, in the fetch worker, so the writer thread only does I/O
+    raw_zlib = compress_raw_json(item)
     inserted_at = dt.datetime.now(ALMATY_TZ).isoformat()
-    return (url, title, employer, city, publish_date, salary, requirements, responsibilities, job_keyword, raw_json, inserted_at)
+    digest = content_hash((title, employer, city, publish_date, salary))
+    friendly = classify_student_friendly(title, requirements, job_keyword, employer)
+    salary_from, salary_to, salary_currency, salary_kzt = parse_salary(item.get('salary'), rates)
+    published = parse_hh_datetime(publish_date)
+    published_ts = int(published.timestamp()) if published else None
+    area_id = parse_area_id(item.get('area'))
+    return (url, title, employer, city, publish_date, salary, requirements, responsibilities, job_keyword,
+            inserted_at, digest, friendly, STUDENT_RULES_VERSION,
+            salary_from, salary_to, salary_currency, salary_kzt, published_ts, area_id, country, raw_zlib)
+
+def page_to_rows(items, job_keyword, rates=None, country=None, since_ts=None):
+    """
+    Convert one search page's items with item_to_row(), which parses each item's
+    published_at once for everyone. Items published before since_ts are dropped.
+    Returns (rows, newest_published_at, newest_published_ts, reached_since).
+    """
+    rows = []
+    newest_at, newest_ts = None, None
+    reached_since = False
+    for it in items:
+        try:
+            row = item_to_row(it, job_keyword, rates, country)
+        except Exception as e:
+            print(f"[WARN] Failed to process item for '{job_keyword}': {e}", file=sys.stderr)
+            continue
+        ts = row[_PUBLISHED_TS_IDX]
+        if ts is not None and since_ts is not None and ts < since_ts:
+            reached_since = True
+            continue
+        if ts is not None and (newest_ts is None or ts > newest_ts):
+            newest_at, newest_ts = row[_PUBLISH_DATE_IDX], ts
+        if row[_URL_IDX]:
+            rows.append(row)
+    return rows, newest_at, newest_ts, reached_since
 
 # -------- Keywords discovery --------
 def keywords_from_data_dir(data_dir: Path):
@@ -310,70 +1659,1169 @@ def keywords_from_data_dir(data_dir: Path):
                 kws.append(f.stem)
     return sorted(set(kws))
 
-def fetch_and_store_all(data_dir: Path, country, per_page=100, sleep_sec=0.5, student_only=False):
-    if country not in COUNTRY_CODES:
-        raise ValueError(f"Unknown country code {country}")
-    country_code = COUNTRY_CODES[country]
+# -------- CSV import (import-csv) --------
+# The older scraper's exports in hhData/*.csv, one file per keyword:
+#   title,salary,city,job,publish_date,requirements,responsibilities,schedule,experience,employment,url
+# job is the employer, publish_date is HH's published_at wall time (Moscow, +0300) as dd-mm-YYYY HH:MM:SS,
+# salary is format_salary() output and schedule is the repr() of HH's {'id', 'name'} dict.
+CSV_PUBLISH_TZ = dt.timezone(dt.timedelta(hours=3))
+CSV_SALARY_RE = re.compile(r'^\s*(\d+)(?:\s*-\s*(\d+))?\s+([A-Z]{3})\s*$')
+CSV_SCHEDULE_RE = re.compile(r"'id':\s*'([^']*)'.*?'name':\s*'([^']*)'")
+# HH /dictionaries ids for the display names the exports kept
+CSV_EXPERIENCE_IDS = {
+    'нет опыта': 'noExperience', 'от 1 года до 3 лет': 'between1And3',
+    'от 3 до 6 лет': 'between3And6', 'более 6 лет': 'moreThan6',
+}
+CSV_EMPLOYMENT_IDS = {
+    'полная занятость': 'full', 'частичная занятость': 'part', 'проектная работа': 'project',
+    'волонтерство': 'volunteer', 'стажировка': 'probation',
+}
 
-    con = init_db(DB_PATH)
+def csv_files(data_dir: Path):
+    """
+    The keyword CSV exports in data_dir (same selection as keywords_from_data_dir).
+    """
+    return sorted(f for f in data_dir.iterdir()
+                  if f.is_file() and f.suffix.lower() == '.csv' and not f.stem.lower().startswith("results_"))
 
-    keywords = keywords_from_data_dir(data_dir)
-    if not keywords:
-        print("[ERROR] No keywords found. Put filenames like 'Data Analyst.csv' in hhData/ or create hhData/keywords.txt", file=sys.stderr)
+def parse_csv_salary(text):
+    """
+    '400000 - 600000 KZT' / '500000 KZT' -> an HH-style salary dict (a single amount is taken as 'from').
+    """
+    m = CSV_SALARY_RE.match(text or '')
+    if not m:
+        return None
+    return {'from': int(m.group(1)), 'to': int(m.group(2)) if m.group(2) else None, 'currency': m.group(3)}
+
+def parse_csv_datetime(text):
+    """
+    '20-11-2025 07:20:47' -> aware datetime in CSV_PUBLISH_TZ, or None.
+    """
+    try:
+        return dt.datetime.strptime((text or '').strip(), "%d-%m-%Y %H:%M:%S").replace(tzinfo=CSV_PUBLISH_TZ)
+    except ValueError:
+        return None
+
+def csv_record_to_row(rec, job_keyword, rates=None, area_ids=None):
+    """
+    One CSV record -> (row in ROW_COLUMNS order, vacancy_details values in _DETAILS_COLUMNS order).
+    publish_date is written in HH's own format, so the content_hash matches what a crawl
+    of the same vacancy computes and the next crawl leaves it alone.
+    area_ids: {normalize_alias(city): area_id} for cities with exactly one known area.
+    """
+    url = (rec.get('url') or '').strip() or None
+    title = clean_highlight_tags(rec.get('title')) or None
+    employer = clean_highlight_tags(rec.get('job')) or None
+    city = (rec.get('city') or '').strip() or None
+    published = parse_csv_datetime(rec.get('publish_date'))
+    publish_date = published.strftime("%Y-%m-%dT%H:%M:%S%z") if published else None
+    salary = (rec.get('salary') or '').strip() or None
+    requirements = clean_highlight_tags(rec.get('requirements')) or None
+    responsibilities = clean_highlight_tags(rec.get('responsibilities')) or None
+    schedule = CSV_SCHEDULE_RE.search(rec.get('schedule') or '')
+    schedule_id, schedule_name = schedule.groups() if schedule else (None, (rec.get('schedule') or '').strip() or None)
+    experience = (rec.get('experience') or '').strip() or None
+    experience_id = CSV_EXPERIENCE_IDS.get(normalize_alias(experience))
+    employment = (rec.get('employment') or '').strip() or None
+    employment_id = CSV_EMPLOYMENT_IDS.get(normalize_alias(employment))
+
+    digest = content_hash((title, employer, city, publish_date, salary))
+    friendly = classify_student_friendly(title, requirements, job_keyword, employer, experience_id=experience_id)
+    salary_from, salary_to, salary_currency, salary_kzt = parse_salary(parse_csv_salary(salary), rates)
+    row = (url, title, employer, city, publish_date, salary, requirements, responsibilities, job_keyword,
+           dt.datetime.now(ALMATY_TZ).isoformat(), digest, friendly, STUDENT_RULES_VERSION,
+           salary_from, salary_to, salary_currency, salary_kzt,
+           int(published.timestamp()) if published else None,
+           (area_ids or {}).get(normalize_alias(city)), None, None)
+    details = (None, None, experience_id, experience, employment_id, employment, schedule_id, schedule_name)
+    return row, details
+
+def iter_csv_rows(path: Path, rates=None, area_ids=None):
+    """
+    Stream (row, details) pairs from one export; the keyword is the file name. Records
+    without a url are skipped.
+    """
+    keyword = path.stem
+    with path.open(encoding='utf-8-sig', newline='') as f:
+        for line, rec in enumerate(csv.DictReader(f), start=2):
+            try:
+                row, details = csv_record_to_row(rec, keyword, rates, area_ids)
+            except Exception as e:
+                print(f"[WARN] {path.name}:{line}: {e}", file=sys.stderr)
+                continue
+            if row[_URL_IDX]:
+                yield row, details
+
+def load_unique_area_ids(conn: sqlite3.Connection):
+    """
+    {alias: area_id} for aliases that name exactly one known area.
+    """
+    ids = {}
+    for alias, area_id in conn.execute("SELECT alias, area_id FROM area_aliases;"):
+        ids[alias] = area_id if alias not in ids else None
+    return {alias: area_id for alias, area_id in ids.items() if area_id is not None}
+
+def import_csv(paths, db_path=None, batch_size=5000):
+    """
+    Upsert the vacancies in the given CSV exports into db_path (default DB_PATH) in
+    transactions of batch_size rows, through the same upsert_rows() as the crawler.
+    Schedule/experience/employment go to vacancy_details without validators, so a
+    later --enrich still fetches the full details. No API calls.
+    Meant for seeding: a record that differs from the stored vacancy replaces it, like a crawl would.
+    Returns (inserted, updated, unchanged).
+    """
+    db_path = Path(db_path) if db_path else DB_PATH
+    con = init_db(db_path)
+    rates = load_currency_rates(con)
+    area_ids = load_unique_area_ids(con)
+    started = time.perf_counter()
+    totals = [0, 0, 0]
+
+    def flush(batch):
+        counts = upsert_rows(con, [row for row, _ in batch], commit=False)
+        # details from a crawl or --enrich are newer than the export's
+        con.executemany(f"""
+            INSERT INTO vacancy_details (vacancy_id, {", ".join(_DETAILS_COLUMNS)})
+            SELECT id, {",".join("?" for _ in _DETAILS_COLUMNS)} FROM vacancies WHERE url = ?
+            ON CONFLICT(vacancy_id) DO NOTHING
+        """, [(*details, row[_URL_IDX]) for row, details in batch])
+        # the upsert reclassified merged rows before their export details were stored
+        reclassify_vacancies(con, vacancy_ids(con, {row[_URL_IDX] for row, _ in batch}))
+        con.commit()
+        for i, n in enumerate(counts):
+            totals[i] += n
+
+    try:
+        for path in paths:
+            path = Path(path)
+            batch = []
+            for pair in iter_csv_rows(path, rates, area_ids):
+                batch.append(pair)
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+            print(f"[CSV] {path.name}: {sum(totals)} rows so far")
+        backfill_countries(con)
+        con.commit()
+    finally:
+        con.close()
+    inserted, updated, unchanged = totals
+    print(f"[CSV] Imported {sum(totals)} rows in {time.perf_counter() - started:.1f}s: "
+          f"{inserted} new, {updated} changed, {unchanged} unchanged")
+    return inserted, updated, unchanged
+
+# -------- Query sharding --------
+# HH never returns more than this many results for one query (pages * per_page), whatever `found` says
+HH_MAX_RESULTS = 2000
+# an overflowing window with no lower bound is split this far back from its upper bound
+SHARD_OPEN_WINDOW = 30 * 86400
+# date windows this narrow are not split further; whatever paging reaches is taken
+SHARD_MIN_WINDOW = 60
+
+# A shard is (area_id, date_from_ts, date_to_ts): an HH area (None = the crawl country) and an
+# inclusive publication window in epoch seconds (None = open). ROOT_SHARD is the unsplit query.
+ROOT_SHARD = (None, None, None)
+
+def shard_key(shard):
+    """
+    crawl_progress key of a shard: '' for ROOT_SHARD, else 'area:from:to'.
+    """
+    if shard == ROOT_SHARD:
+        return ''
+    return ":".join('' if v is None else str(v) for v in shard)
+
+def _hh_time(ts):
+    return dt.datetime.fromtimestamp(ts, ALMATY_TZ).isoformat(timespec='seconds')
+
+def overflows(data, per_page):
+    """
+    True when a search response found more vacancies than its pages can return.
+    """
+    found = data.get('found') or 0
+    pages = data.get('pages')
+    return found > HH_MAX_RESULTS or (pages is not None and found > pages * per_page)
+
+def load_area_children(conn: sqlite3.Connection):
+    """
+    {parent area id: [child area ids]} from the stored areas tree (see refresh_areas).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT parent_id, id FROM areas WHERE parent_id IS NOT NULL ORDER BY parent_id, id;")
+    children = {}
+    for parent, aid in cur.fetchall():
+        children.setdefault(parent, []).append(aid)
+    return children
+
+def area_children(client: HHClient, area_id, cache):
+    """
+    Child area ids of area_id: from cache (preloaded by load_area_children), else
+    from GET /areas/{id}, remembered in cache. Safe to call from worker threads.
+    """
+    children = cache.get(area_id)
+    if children is None:
+        data = client.get_json(f'/areas/{area_id}') or {}
+        children = []
+        for child in data.get('areas') or []:
+            try:
+                children.append(int(child.get('id')))
+            except (TypeError, ValueError):
+                continue
+        cache[area_id] = sorted(children)
+    return cache[area_id]
+
+def split_shard(client: HHClient, shard, country_code, children_cache, until, floor_ts=None, newest_ts=None):
+    """
+    Sub-shards covering an overflowing shard. The publication window is halved, with
+    until (the run start) closing open windows and floor_ts (the --incremental mark)
+    opening them: two windows that share an area return exactly what the parent did.
+    newest_ts (the newest publication on the shard's first, newest-first page) lets
+    an open-ended window skip straight past the empty span above it.
+    Only a window already SHARD_MIN_WINDOW or narrower is split into the area's
+    sub-areas, as a last resort: vacancies filed directly on the area rather than one
+    of its sub-areas are not returned by any of them, so that split can miss a few.
+    Returns [] when neither split is possible.
+    """
+    area_id, lo, hi = shard
+    area = area_id if area_id is not None else country_code
+    hi = hi if hi is not None else until
+    lo = lo if lo is not None else floor_ts
+    if lo is None:
+        mid = min(hi, newest_ts if newest_ts is not None else hi) - SHARD_OPEN_WINDOW
+        return [(area, None, mid), (area, mid, hi)]
+    if hi - lo > SHARD_MIN_WINDOW:
+        # both halves include mid; the odd duplicate is deduped by url on upsert
+        mid = lo + (hi - lo) // 2
+        return [(area, lo, mid), (area, mid, hi)]
+    return [(child, lo, hi) for child in area_children(client, area, children_cache)]
+
+# -------- Streaming ingest --------
+_WRITER_STOP = object()
+# how long a producer waits on a full queue before checking that the writer is still alive
+QUEUE_PUT_TIMEOUT = 1.0
+
+class WriterFailed(RuntimeError):
+    """
+    The writer thread died, so nothing will drain the row queue any more.
+    """
+
+def queue_put(row_queue: queue.Queue, msg, writer=None):
+    """
+    row_queue.put(msg), blocking while the queue is full, but raising WriterFailed instead
+    of waiting forever once writer (a VacancyWriter) is no longer running.
+    """
+    if writer is None:
+        row_queue.put(msg)
         return
+    while True:
+        try:
+            row_queue.put(msg, timeout=QUEUE_PUT_TIMEOUT)
+            return
+        except queue.Full:
+            if not writer.is_alive():
+                raise WriterFailed(f"the DB writer stopped: {writer.error!r}") from None
+
+class VacancyWriter(threading.Thread):
+    """
+    The only thread that writes to SQLite. Drains messages from a bounded
+    queue and upserts rows in transactions of roughly batch_size rows, so HTTP
+    and disk work overlap and memory stays bounded by the queue size.
+    Messages:
+      ('rows', [row, ...], keyword, country, shard_key, page)
+      ('shard_done', keyword, country, shard_key)
+      ('done', keyword, country, newest_published_at, newest_published_ts)
+    Each transaction also checkpoints crawl_progress for the pages it contains,
+    and a shard's or keyword's 'done' (and high-water mark) is only recorded
+    after all of its rows are committed.
+    bulk=True appends to a TEMP staging table instead and merges it once at the
+    end (merge_staging); checkpoints are then recorded with that merge, so an
+    interrupted bulk run resumes from where the last merge left off.
+    A batch that fails to commit is dropped and its keyword/country recorded in failed: no
+    later checkpoint of that crawl is written, so --resume fetches the lost pages again.
+    A failure outside a batch (e.g. opening the DB, the bulk merge) ends the thread with the
+    exception in error; producers find out through queue_put().
+    """
+    def __init__(self, db_path: Path, row_queue: queue.Queue, run_id, batch_size=500, flush_interval=1.0,
+                 bulk=False, metrics=None):
+        super().__init__(name="sqlite-writer", daemon=True)
+        self.db_path = db_path
+        self.row_queue = row_queue
+        self.run_id = run_id
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.bulk = bulk
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._pending_pages = {}
+        self._pending_finished = []
+        self.rows_written = 0
+        self.batches = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = set()
+        self.error = None
+
+    def run(self):
+        con = None
+        batch = []
+        pages = {}
+        finished = []
+        try:
+            con = init_db(self.db_path)
+            if self.bulk:
+                apply_bulk_pragmas(con)
+            while True:
+                try:
+                    msg = self.row_queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    # producers are slow (network bound): don't sit on a partial batch
+                    if batch or pages or finished:
+                        self._flush(con, batch, pages, finished)
+                        batch, pages, finished = [], {}, []
+                    continue
+                if msg is _WRITER_STOP:
+                    break
+                if msg[0] == 'rows':
+                    _, rows, kw, country, key, page = msg
+                    batch.extend(rows)
+                    pages[(kw, country, key)] = page + 1
+                elif msg[0] == 'shard_done':
+                    _, kw, country, key = msg
+                    finished.append((kw, country, key, None, None))
+                elif msg[0] == 'done':
+                    _, kw, country, published_at, published_ts = msg
+                    finished.append((kw, country, '', published_at, published_ts))
+                if len(batch) >= self.batch_size:
+                    self._flush(con, batch, pages, finished)
+                    batch, pages, finished = [], {}, []
+            if batch or pages or finished:
+                self._flush(con, batch, pages, finished)
+            if self.bulk:
+                self._merge(con)
+        except Exception as e:
+            self.error = e
+            print(f"[ERROR] DB writer stopped: {e}", file=sys.stderr)
+        finally:
+            if con is not None:
+                con.close()
+
+    def _flush(self, con, batch, pages, finished):
+        if self.bulk:
+            self._stage(con, batch, pages, finished)
+            return
+        started = time.perf_counter()
+        try:
+            counts = (0, 0, 0)
+            if batch:
+                counts = upsert_rows(con, batch, commit=False, run_id=self.run_id)
+            self._checkpoint(con, pages, finished)
+            con.commit()
+        except Exception as e:
+            self.metrics.inc('batch_failures_total')
+            con.rollback()
+            # nothing was checkpointed, so --resume will fetch these pages again
+            self._fail(pages, finished)
+            print(f"[ERROR] DB write failed for batch of {len(batch)} rows: {e}", file=sys.stderr)
+            return
+        self.metrics.observe('batch_commit_seconds', time.perf_counter() - started)
+        self._count_rows(counts)
+        self.rows_written += len(batch)
+        self.inserted += counts[0]
+        self.updated += counts[1]
+        self.unchanged += counts[2]
+        if batch:
+            self.batches += 1
+
+    def _count_rows(self, counts):
+        for result, n in zip(('inserted', 'updated', 'unchanged'), counts):
+            self.metrics.inc('rows_total', n, result=result)
+
+    def _fail(self, pages, finished):
+        self.failed.update(key[:2] for key in pages)
+        self.failed.update(item[:2] for item in finished)
+
+    def _checkpoint(self, con, pages, finished):
+        # a crawl that lost a batch keeps its last checkpoint before the loss
+        pages = {key: page for key, page in pages.items() if key[:2] not in self.failed}
+        finished = [item for item in finished if item[:2] not in self.failed]
+        for (kw, country, key), next_page in pages.items():
+            save_progress(con, self.run_id, kw, country, next_page, shard=key)
+        for kw, country, key, published_at, published_ts in finished:
+            save_progress(con, self.run_id, kw, country, 0, done=True, shard=key)
+            if published_ts is not None:
+                save_crawl_state(con, kw, country, published_at, published_ts)
+
+    def _stage(self, con, batch, pages, finished):
+        try:
+            with self.metrics.timer('stage_batch_seconds'):
+                stage_rows(con, batch)
+        except Exception as e:
+            self.metrics.inc('batch_failures_total')
+            self._fail(pages, finished)
+            print(f"[ERROR] Staging failed for batch of {len(batch)} rows: {e}", file=sys.stderr)
+            return
+        self._pending_pages.update(pages)
+        self._pending_finished.extend(finished)
+        self.rows_written += len(batch)
+        if batch:
+            self.batches += 1
+
+    def _merge(self, con):
+        started = time.perf_counter()
+        try:
+            counts = merge_staging(con, run_id=self.run_id)
+            self._checkpoint(con, self._pending_pages, self._pending_finished)
+            con.commit()
+        except Exception as e:
+            con.rollback()
+            # nothing of the run was stored or checkpointed: fetch_and_store_all() marks it incomplete
+            self.error = e
+            print(f"[ERROR] Bulk merge of {self.rows_written} staged rows failed: {e}", file=sys.stderr)
+            self.rows_written = 0
+            return
+        self.inserted, self.updated, self.unchanged = counts
+        self._count_rows(counts)
+        self.metrics.observe('bulk_merge_seconds', time.perf_counter() - started)
+        with self.metrics.timer('analyze_seconds'):
+            analyze_after_bulk(con)
+        print(f"[DB] Bulk merge took {time.perf_counter() - started:.1f}s")
+
+def fetch_shard(client: HHClient, kw, country, shard, row_queue: queue.Queue, per_page=100, since=None, start_page=0,
+                rates=None, children_cache=None, until=None, metrics=None, writer=None):
+    """
+    Page through HH results for one shard of a keyword query (ROOT_SHARD = the whole
+    query), pushing each page's converted rows onto row_queue (blocks when the writer
+    falls behind). Runs inside a worker thread, so it must not touch the DB connection.
+    Returns (rows_queued, complete, newest_published_at, newest_published_ts, sub_shards).
+
+    When the first page shows more vacancies than paging can return (overflows), nothing
+    is queued and the shard comes back split (split_shard) for the caller to crawl
+    instead. A finished non-root shard is marked done with a 'shard_done' message; the
+    caller sends the keyword's 'done' once all of its shards are complete.
+
+    since: (published_at, published_ts) high-water mark. When given, results are
+    requested newest-first from that point and paging stops at the first vacancy
+    older than the mark.
+    start_page: first page to request (resuming a checkpointed shard).
+    rates: currency rates passed on to item_to_row().
+    metrics: Metrics for page/item counts, conversion time and queue back-pressure.
+    writer: the VacancyWriter draining row_queue; WriterFailed is raised if it dies.
+    complete is False when a page request failed.
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    country_code = COUNTRY_CODES[country]
+    key = shard_key(shard)
+    area_id, lo, hi = shard
+    since_at, since_ts = since if since else (None, None)
+    date_from = since_at
+    if lo is not None and (since_ts is None or lo > since_ts):
+        date_from = _hh_time(lo)
+    date_to = _hh_time(hi) if hi is not None else None
+    newest_at, newest_ts = None, None
+    queued = 0
+    page = start_page
+    complete = False
+    while True:
+        data = get_page_json(client, kw, page, area_id if area_id is not None else country_code,
+                             per_page=per_page, date_from=date_from, date_to=date_to)
+        if data is None:
+            # failed to get page after retries — stop here; the checkpoint lets --resume continue
+            print(f"[WARN] '{kw}' [{country}] stopped at page {page}; rerun with --resume to continue", file=sys.stderr)
+            break
+        if page == 0 and overflows(data, per_page):
+            # only a date-bounded page is sorted newest first
+            page_newest = None
+            if hi is not None:
+                stamps = [parse_hh_datetime(it.get('published_at')) for it in data.get('items', [])]
+                page_newest = max((int(p.timestamp()) for p in stamps if p), default=None)
+            sub_shards = split_shard(client, shard, country_code, children_cache if children_cache is not None else {},
+                                     until if until is not None else int(time.time()), since_ts, page_newest)
+            if sub_shards:
+                metrics.inc('shards_split_total')
+                return 0, True, None, None, sub_shards
+            print(f"[WARN] '{kw}' [{country}] still finds {data.get('found')} vacancies in shard {key}; "
+                  f"only the first {HH_MAX_RESULTS} are reachable", file=sys.stderr)
+        items = data.get('items', [])
+        if not items:
+            complete = True
+            break
+        metrics.inc('pages_total')
+        metrics.inc('items_total', len(items))
+        convert_started = time.perf_counter()
+        rows, page_at, page_ts, reached_seen = page_to_rows(items, kw, rates, country, since_ts)
+        if page_ts is not None and (newest_ts is None or page_ts > newest_ts):
+            newest_at, newest_ts = page_at, page_ts
+        metrics.observe('item_to_row_seconds', time.perf_counter() - convert_started)
+        # always queued, even when empty, so the page is checkpointed; a long wait means the writer is the bottleneck
+        with metrics.timer('queue_put_wait_seconds'):
+            queue_put(row_queue, ('rows', rows, kw, country, key, page), writer)
+        queued += len(rows)
+        total_pages = data.get('pages')
+        page += 1
+        if reached_seen:
+            complete = True
+            break
+        if total_pages is not None and page >= total_pages:
+            complete = True
+            break
+        if len(items) < per_page:
+            complete = True
+            break
+    if complete and key:
+        queue_put(row_queue, ('shard_done', kw, country, key), writer)
+    return queued, complete, newest_at, newest_ts, []
+
+# -------- Vacancy details (--enrich) --------
+# Search items only carry snippets ("..."-truncated requirements); /vacancies/{id} has the full
+# description and the experience/employment/schedule dictionaries. A vacancy is (re)fetched when it
+# has no details yet, its search content_hash changed, or its details are older than max_age_days,
+# always as a conditional GET with the stored ETag/Last-Modified, so an unchanged one costs a 304.
+# A run makes at most ENRICH_LIMIT requests, vacancies without details first, so the first --enrich
+# over an existing table spreads its backlog over several runs instead of spending the rate budget.
+ENRICH_LIMIT = 1000
+_HH_VACANCY_ID_RE = re.compile(r'/vacancy/(\d+)')
+_HTML_BREAK_RE = re.compile(r'<\s*(?:br|/p|/li|/ul|/ol|/div|/h[1-6])\s*/?>', re.I)
+_HTML_LI_RE = re.compile(r'<\s*li\b[^>]*>', re.I)
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+_DETAILS_COLUMNS = ('description', 'key_skills', 'experience_id', 'experience', 'employment_id', 'employment',
+                    'schedule_id', 'schedule')
+_DETAILS_UPSERT_SQL = f"""
+    INSERT INTO vacancy_details (vacancy_id, hh_id, {", ".join(_DETAILS_COLUMNS)},
+                                 etag, last_modified, content_hash, fetched_at, checked_ts, http_status)
+    VALUES ({",".join("?" for _ in range(len(_DETAILS_COLUMNS) + 8))})
+    ON CONFLICT(vacancy_id) DO UPDATE SET
+        {", ".join(f"{c}=excluded.{c}" for c in ('hh_id',) + _DETAILS_COLUMNS)},
+        etag=excluded.etag, last_modified=excluded.last_modified, content_hash=excluded.content_hash,
+        fetched_at=excluded.fetched_at, checked_ts=excluded.checked_ts, http_status=excluded.http_status
+"""
+# 304 (details as stored) or 404 (gone from HH): only the bookkeeping moves
+_DETAILS_CHECKED_SQL = """
+    INSERT INTO vacancy_details (vacancy_id, hh_id, content_hash, checked_ts, http_status)
+    VALUES (?,?,?,?,?)
+    ON CONFLICT(vacancy_id) DO UPDATE SET
+        content_hash=excluded.content_hash, checked_ts=excluded.checked_ts, http_status=excluded.http_status
+"""
+
+def hh_vacancy_id(url):
+    """
+    'https://hh.kz/vacancy/123456' -> '123456' (None if the url has no vacancy id).
+    """
+    m = _HH_VACANCY_ID_RE.search(url or '')
+    return m.group(1) if m else None
 
-    print(f"[INFO] Found {len(keywords)} keywords. Inserting into DB at {DB_PATH}")
-    for kw in keywords:
-        print(f"[INFO] Fetching for keyword: '{kw}'")
-        all_rows = []
-        page = 0
+def html_to_text(value):
+    """
+    HH description HTML -> plain text: list items as '- ' lines, one line per block, entities decoded.
+    """
+    if not value:
+        return None
+    text = _HTML_LI_RE.sub('\n- ', value)
+    text = _HTML_BREAK_RE.sub('\n', text)
+    text = html.unescape(_HTML_TAG_RE.sub('', text))
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line) or None
+
+def details_fields(data):
+    """
+    Values in _DETAILS_COLUMNS order from a /vacancies/{id} response.
+    """
+    def ref(key):
+        d = data.get(key) or {}
+        return d.get('id'), d.get('name')
+    skills = [s.get('name') for s in data.get('key_skills') or [] if s.get('name')]
+    return (html_to_text(data.get('description')), "; ".join(skills) or None,
+            *ref('experience'), *ref('employment'), *ref('schedule'))
+
+def fetch_details(client: HHClient, hh_id, etag=None, last_modified=None):
+    """
+    Conditional GET /vacancies/{hh_id}. Returns (status, fields, etag, last_modified):
+    (200, details_fields(...), new validators), (304, None, ...) when unchanged, (404, None, ...)
+    when HH no longer has it, or None when the request failed.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    path = f"/vacancies/{hh_id}"
+    resp = client.get(path, headers=headers or None, allow_statuses=(404,))
+    if resp is None:
+        return None
+    if resp.status_code != 200:
+        return resp.status_code, None, etag, last_modified
+    data = client.parse_json(resp, path)
+    if not isinstance(data, dict):
+        return None
+    return 200, details_fields(data), resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+
+def details_candidates(conn: sqlite3.Connection, stale_before=None, chunk_size=500):
+    """
+    Yield (vacancy_id, hh_id, content_hash, etag, last_modified) for vacancies whose details are
+    missing (by id), then those fetched for an older content_hash (by id), then those last checked
+    before stale_before (longest unchecked first), so a capped run enriches new rows first.
+    Keyset-paged, so the caller may write between chunks.
+    """
+    passes = [
+        ("LEFT JOIN", "d.vacancy_id IS NULL", ("v.id",), ()),
+        ("JOIN", "d.content_hash IS NOT v.content_hash", ("v.id",), ()),
+    ]
+    if stale_before is not None:
+        passes.append(("JOIN", "d.content_hash IS v.content_hash AND d.checked_ts < ?", ("d.checked_ts", "v.id"),
+                       (stale_before,)))
+    cur = conn.cursor()
+    for join, where, keys, params in passes:
+        last = None
         while True:
-            data = get_page_json(kw, page, country_code, per_page=per_page)
-            if data is None:
-                # failed to get page after retries — break this keyword
+            after = f"({', '.join(keys)}) > ({', '.join('?' for _ in keys)}) AND " if last else ""
+            cur.execute(f"""
+                SELECT v.id, v.url, v.content_hash, d.etag, d.last_modified, {', '.join(keys)}
+                FROM vacancies v {join} vacancy_details d ON d.vacancy_id = v.id
+                WHERE {after}{where}
+                ORDER BY {', '.join(keys)} LIMIT ?;
+            """, (*(last or ()), *params, chunk_size))
+            chunk = cur.fetchall()
+            if not chunk:
                 break
-            items = data.get('items', [])
-            if not items:
+            last = chunk[-1][5:]
+            for vid, url, digest, etag, last_modified, *_ in chunk:
+                hh_id = hh_vacancy_id(url)
+                if hh_id:
+                    yield vid, hh_id, digest, etag, last_modified
+
+def enrich_details(conn: sqlite3.Connection, client: HHClient, workers=4, batch_size=200, limit=ENRICH_LIMIT,
+                   max_age_days=None, metrics=None):
+    """
+    Fetch /vacancies/{id} details for new or changed vacancies (see details_candidates) with a
+    pool of workers sharing client's rate limit, and store them in vacancy_details in
+    transactions of batch_size results, reclassifying student_friendly with the full text.
+    limit caps the requests of this call (None: no cap); the rest are picked up next time.
+    Returns counts per outcome: fetched (200), not_modified (304), gone (404), failed.
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    stale_before = int(time.time() - max_age_days * 86400) if max_age_days is not None else None
+    counts = dict.fromkeys(('fetched', 'not_modified', 'gone', 'failed'), 0)
+    results = []
+
+    def flush():
+        if not results:
+            return
+        fetched_at = dt.datetime.now(ALMATY_TZ).isoformat()
+        now = int(time.time())
+        with metrics.timer('details_commit_seconds'):
+            conn.executemany(_DETAILS_UPSERT_SQL, [
+                (vid, hh_id, *fields, etag, last_modified, digest, fetched_at, now, status)
+                for vid, hh_id, digest, (status, fields, etag, last_modified) in results if status == 200])
+            conn.executemany(_DETAILS_CHECKED_SQL, [
+                (vid, hh_id, digest, now, status)
+                for vid, hh_id, digest, (status, _, _, _) in results if status != 200])
+            # a 304 can follow a search-side change, which item_to_row classified without the description
+            reclassify_vacancies(conn, [vid for vid, _, _, (status, _, _, _) in results if status != 404])
+            conn.commit()
+        results.clear()
+
+    candidates = details_candidates(conn, stale_before)
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {}
+        while True:
+            # a few requests per worker in flight; candidates are read lazily so memory stays flat
+            while len(futures) < workers * 4 and (limit is None or submitted < limit):
+                candidate = next(candidates, None)
+                if candidate is None:
+                    break
+                vid, hh_id, digest, etag, last_modified = candidate
+                futures[pool.submit(fetch_details, client, hh_id, etag, last_modified)] = (vid, hh_id, digest)
+                submitted += 1
+            if not futures:
                 break
-            for it in items:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                vid, hh_id, digest = futures.pop(fut)
                 try:
-                    row = item_to_row(it, kw)
-                    if row[0]:
-                        all_rows.append(row)
+                    outcome = fut.result()
                 except Exception as e:
-                    print(f"[WARN] Failed to process item for '{kw}': {e}", file=sys.stderr)
-            total_pages = data.get('pages')
-            page += 1
-            time.sleep(sleep_sec)
-            if total_pages is not None and page >= total_pages:
-                break
-            if len(items) < per_page:
-                break
+                    print(f"[WARN] Details for vacancy {hh_id} failed: {e}", file=sys.stderr)
+                    outcome = None
+                if outcome is None:
+                    counts['failed'] += 1
+                    metrics.inc('details_total', status='failed')
+                    continue
+                status = outcome[0]
+                counts[{200: 'fetched', 304: 'not_modified', 404: 'gone'}.get(status, 'failed')] += 1
+                metrics.inc('details_total', status=status)
+                if status in (200, 304, 404):
+                    results.append((vid, hh_id, digest, outcome))
+            if len(results) >= batch_size:
+                flush()
+    flush()
+    print(f"[DETAILS] {counts['fetched']} fetched, {counts['not_modified']} not modified, "
+          f"{counts['gone']} gone, {counts['failed']} failed")
+    if limit is not None and submitted >= limit and next(candidates, None) is not None:
+        print(f"[INFO] Stopped at {limit} detail requests (--enrich-limit); the rest follow on the next runs")
+    return counts
 
-        if all_rows:
-            try:
-                upsert_rows(con, all_rows)
-                print(f"[OK] Inserted/updated {len(all_rows)} rows for '{kw}'")
-            except Exception as e:
-                print(f"[ERROR] DB upsert failed for '{kw}': {e}", file=sys.stderr)
+# -------- Snapshot publishing (--publish) --------
+# The API reads a published snapshot instead of the working DB: a compacted, ANALYZEd copy in
+# rollback-journal mode that no writer ever opens. Each snapshot gets a new versioned file name;
+# the CURRENT pointer file (and the current.db symlink where the OS allows one) is then swapped
+# with an atomic rename, so readers see either the old snapshot or the new one, never a partial file.
+PUBLISH_DIR = SCRIPT_DIR / "hhData" / "published"
+SNAPSHOT_POINTER = "CURRENT"
+SNAPSHOT_LINK = "current.db"
+# pipeline bookkeeping and raw HH payloads: the API never reads them
+SNAPSHOT_DROP_TABLES = ('vacancy_raw', 'crawl_progress', 'crawl_state', 'pipeline_runs', 'minhash_state', 'minhash_bands')
 
+def build_snapshot(conn: sqlite3.Connection, path: Path, prune=False):
+    """
+    Write a compacted read-only copy of conn's DB to path: pipeline-only tables dropped,
+    with prune=True only student-friendly vacancies kept (the API shows nothing else),
+    FTS index merged, ANALYZEd, VACUUMed and quick_check'ed.
+    """
+    try:
+        # a consistent read snapshot of a WAL DB, already defragmented
+        conn.execute("VACUUM INTO ?;", (str(path),))
+    except sqlite3.OperationalError:
+        # SQLite < 3.27
+        dst = sqlite3.connect(path)
+        conn.backup(dst)
+        dst.close()
+    snap = sqlite3.connect(path)
     try:
-        mark_student_friendly(con)
+        # rollback journal: a read-only reader needs no -wal/-shm files next to it
+        snap.execute("PRAGMA journal_mode=DELETE;")
+        snap.execute("PRAGMA foreign_keys=ON;")
+        for table in SNAPSHOT_DROP_TABLES:
+            snap.execute(f"DROP TABLE IF EXISTS {table};")
+        has_fts = table_exists(snap, 'vacancies_fts')
+        if prune:
+            # rebuilding the index from the survivors beats one FTS delete per pruned row
+            if has_fts:
+                for trigger in ('vacancies_fts_ai', 'vacancies_fts_ad', 'vacancies_fts_au'):
+                    snap.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+                snap.execute("DROP TABLE vacancies_fts;")
+            cur = snap.execute("DELETE FROM vacancies WHERE student_friendly IS NOT 1;")
+            print(f"[PUBLISH] Pruned {cur.rowcount} non-student vacancies from the snapshot.")
+            if has_fts:
+                ensure_fts(snap)
+        elif has_fts:
+            snap.execute("INSERT INTO vacancies_fts(vacancies_fts) VALUES ('optimize');")
+        snap.commit()
+        snap.execute("ANALYZE;")
+        snap.commit()
+        snap.execute("VACUUM;")
+        check = snap.execute("PRAGMA quick_check;").fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"snapshot failed quick_check: {check}")
+    finally:
+        snap.close()
+
+def current_snapshot(publish_dir: Path):
+    """
+    File name of the published snapshot the CURRENT pointer names, or None.
+    """
+    try:
+        return (Path(publish_dir) / SNAPSHOT_POINTER).read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
+
+def point_current(publish_dir: Path, name):
+    """
+    Atomically point CURRENT (and the current.db symlink, where supported) at a snapshot file name.
+    """
+    pointer_tmp = publish_dir / f".{SNAPSHOT_POINTER}.tmp"
+    pointer_tmp.write_text(name + "\n", encoding='utf-8')
+    os.replace(pointer_tmp, publish_dir / SNAPSHOT_POINTER)
+    link_tmp = publish_dir / f".{SNAPSHOT_LINK}.tmp"
+    try:
+        if link_tmp.is_symlink() or link_tmp.exists():
+            link_tmp.unlink()
+        os.symlink(name, link_tmp)
+        os.replace(link_tmp, publish_dir / SNAPSHOT_LINK)
+    except (OSError, NotImplementedError):
+        # e.g. Windows without symlink rights: readers follow CURRENT
+        pass
+
+def remove_old_snapshots(publish_dir: Path, keep=3):
+    """
+    Delete all but the newest keep snapshots (never the current one). A reader may still
+    have an old one open for a moment, so keep >= 2; failures are left for next time.
+    """
+    current = current_snapshot(publish_dir)
+    snapshots = sorted(publish_dir.glob("vacancies-*.db"), key=lambda p: (p.stat().st_mtime, p.name), reverse=True)
+    for path in snapshots[max(1, keep):]:
+        if path.name == current:
+            continue
+        try:
+            path.unlink()
+        except OSError as e:
+            print(f"[WARN] Could not remove old snapshot {path.name}: {e}", file=sys.stderr)
+
+def publish_snapshot(conn: sqlite3.Connection, publish_dir=None, prune=False, keep=3, run_id=None):
+    """
+    Build a snapshot of conn's DB as publish_dir/vacancies-<timestamp>[-r<run_id>].db,
+    switch CURRENT to it and drop old snapshots. Returns the snapshot path.
+    """
+    publish_dir = Path(publish_dir) if publish_dir else PUBLISH_DIR
+    publish_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    stamp = dt.datetime.now(ALMATY_TZ).strftime("%Y%m%dT%H%M%S")
+    base = f"vacancies-{stamp}{f'-r{run_id}' if run_id is not None else ''}"
+    name, n = f"{base}.db", 1
+    # a name is never reused: readers reopen when CURRENT names a different file
+    while (publish_dir / name).exists():
+        n += 1
+        name = f"{base}-{n}.db"
+    path = publish_dir / name
+    tmp = publish_dir / f".{name}.tmp"
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        build_snapshot(conn, tmp, prune=prune)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    # complete and closed before anything points at it
+    os.replace(tmp, path)
+    point_current(publish_dir, name)
+    remove_old_snapshots(publish_dir, keep)
+    size_mb = path.stat().st_size / 1e6
+    print(f"[PUBLISH] {path} ({size_mb:.1f} MB) is now current ({time.perf_counter() - started:.1f}s)")
+    return path
+
+def fetch_and_store_all(data_dir: Path, countries, per_page=100, rps=2.0, workers=4, batch_size=500,
+                        incremental=False, resume=False, max_retries=5, refresh_rates=False, refresh_areas_tree=False,
+                        student_only=False, bulk=False, db_path=None, api_url=API_URL, metrics_dir=None,
+                        enrich=False, enrich_limit=ENRICH_LIMIT, enrich_max_age=None,
+                        publish=False, publish_dir=None, publish_prune=False, publish_keep=3,
+                        retain_days=None, retain_runs=None, dedupe=False, recommend=False, recommend_dir=None):
+    """
+    Crawl every keyword in data_dir for each country into db_path (default DB_PATH)
+    from api_url (default the real HH API; see benchmarks/hh_api_stub.py).
+    enrich=True then fetches /vacancies/{id} details for new and changed vacancies
+    (at most enrich_limit requests; details older than enrich_max_age days are revalidated).
+    retain_days/retain_runs expire vacancies no longer returned by HH (see expire_vacancies);
+    only after a run that finished, so an interrupted crawl never deletes anything.
+    dedupe=True clusters new and changed vacancies with their near-duplicates (see hh_dedupe.py).
+    recommend=True updates the recommendation index in recommend_dir (see hh_recommend.py).
+    publish=True finally swaps in a fresh read-only snapshot for the API (see publish_snapshot).
+    Per-stage metrics are stored in pipeline_runs.metrics_json and written to
+    metrics_dir (default: metrics/ next to the DB) as run_<id>.json and hh_pipeline.prom.
+    Returns a summary dict: run_id, status, rows, inserted, updated, unchanged, seconds
+    (None when there was nothing to crawl).
+    """
+    db_path = Path(db_path) if db_path else DB_PATH
+    metrics_dir = Path(metrics_dir) if metrics_dir else db_path.parent / "metrics"
+    metrics = Metrics()
+    started = time.perf_counter()
+    con = init_db(db_path)
+
+    run_id, progress, until = None, {}, None
+    if resume:
+        run_id, options = find_unfinished_run(con)
+        if run_id is None:
+            print("[INFO] No unfinished run to resume, starting a new one.")
+        else:
+            # page offsets are only meaningful with the original run's paging options
+            countries = options.get('countries') or options.get('country') or countries
+            per_page = options.get('per_page', per_page)
+            incremental = options.get('incremental', incremental)
+            # date shards are cut relative to the run start, so resumed shards keep their keys
+            until = options.get('until')
+            progress = load_progress(con, run_id)
+            con.execute("UPDATE pipeline_runs SET status = 'running' WHERE run_id = ?;", (run_id,))
+            con.commit()
+            done_count = sum(1 for (_, _, key), (_, done) in progress.items() if done and not key)
+            print(f"[INFO] Resuming run {run_id} ({done_count} keyword/country crawls already done)")
+
+    countries = parse_countries(countries)
+
+    keywords = keywords_from_data_dir(data_dir)
+    if not keywords:
+        print("[ERROR] No keywords found. Put filenames like 'Data Analyst.csv' in hhData/ or create hhData/keywords.txt", file=sys.stderr)
+        return
+
+    if until is None:
+        until = int(time.time())
+    if run_id is None:
+        run_id = start_run(con, {'countries': countries, 'per_page': per_page, 'incremental': incremental,
+                                 'until': until})
+
+    workers = max(1, workers)
+    print(f"[INFO] Found {len(keywords)} keywords x {len(countries)} countries ({', '.join(countries)}). "
+          f"Inserting into DB at {db_path} (run {run_id})")
+    if bulk:
+        print(f"[INFO] Fetching with {workers} workers at {rps} requests/sec, staging for one bulk merge")
+    else:
+        print(f"[INFO] Fetching with {workers} workers at {rps} requests/sec, writing in batches of {batch_size}")
+    client = HHClient(workers=workers, rps=rps, max_retries=max_retries, base_url=api_url, metrics=metrics)
+    if refresh_rates:
+        refresh_currency_rates(con, client)
+    if refresh_areas_tree:
+        refresh_areas(con, client)
+    rates = load_currency_rates(con)
+    children_cache = load_area_children(con)
+    # a few pages per worker is enough to keep the writer busy without buffering a whole keyword
+    row_queue = queue.Queue(maxsize=workers * 4)
+    writer = VacancyWriter(db_path, row_queue, run_id, batch_size=batch_size, bulk=bulk, metrics=metrics)
+    writer.start()
+    incomplete = 0
+    queued_by_country = dict.fromkeys(countries, 0)
+    # per (keyword, country): shards in flight, whether all finished, rows queued, newest publication
+    jobs = {}
+    crawl_started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+
+            def submit(kw, country, shard, since, start_page):
+                fut = pool.submit(fetch_shard, client, kw, country, shard, row_queue, per_page, since, start_page,
+                                  rates, children_cache, until, metrics, writer)
+                futures[fut] = (kw, country, shard, since)
+                jobs[(kw, country)]['pending'] += 1
+                return fut
+
+            # keyword-major order, so every country is in flight at once and they share the rate budget
+            for kw in keywords:
+                for country in countries:
+                    start_page, done = progress.get((kw, country, ''), (0, False))
+                    if done:
+                        continue
+                    since = None
+                    if incremental:
+                        since = get_crawl_state(con, kw, country)
+                        if since[0] is None:
+                            since = None
+                    if since:
+                        print(f"[INFO] Fetching for keyword: '{kw}' [{country}] (new since {since[0]})")
+                    elif start_page:
+                        print(f"[INFO] Fetching for keyword: '{kw}' [{country}] (resuming at page {start_page})")
+                    else:
+                        print(f"[INFO] Fetching for keyword: '{kw}' [{country}]")
+                    jobs[(kw, country)] = {'pending': 0, 'complete': True, 'queued': 0, 'shards': 0,
+                                           'newest': (None, None)}
+                    submit(kw, country, ROOT_SHARD, since, start_page)
+
+            pending = set(futures)
+            # a dead writer fails every producer's next put, so wait() still returns promptly
+            while pending and writer.is_alive():
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    kw, country, shard, since = futures.pop(fut)
+                    job = jobs[(kw, country)]
+                    job['pending'] -= 1
+                    try:
+                        queued, complete, newest_at, newest_ts, sub_shards = fut.result()
+                    except WriterFailed:
+                        queued, complete, newest_at, newest_ts, sub_shards = 0, False, None, None, []
+                    except Exception as e:
+                        queued, complete, newest_at, newest_ts, sub_shards = 0, False, None, None, []
+                        print(f"[ERROR] Fetch failed for '{kw}' [{country}] shard {shard_key(shard) or '-'}: {e}",
+                              file=sys.stderr)
+                    job['queued'] += queued
+                    job['complete'] = job['complete'] and complete
+                    if newest_ts is not None and (job['newest'][1] is None or newest_ts > job['newest'][1]):
+                        job['newest'] = (newest_at, newest_ts)
+                    if sub_shards:
+                        print(f"[INFO] '{kw}' [{country}] has more results than HH pages through; "
+                              f"split shard {shard_key(shard) or '-'} into {len(sub_shards)}")
+                    else:
+                        job['shards'] += 1
+                    for sub in sub_shards:
+                        start_page, done = progress.get((kw, country, shard_key(sub)), (0, False))
+                        if not done:
+                            pending.add(submit(kw, country, sub, since, start_page))
+                    if job['pending']:
+                        continue
+                    queued_by_country[country] += job['queued']
+                    shards = f" from {job['shards']} shards" if job['shards'] > 1 else ""
+                    print(f"[OK] Queued {job['queued']} rows for '{kw}' [{country}]{shards}")
+                    if job['complete']:
+                        newest_at, newest_ts = job['newest']
+                        since_ts = since[1] if since else None
+                        if newest_ts is not None and since_ts is not None and newest_ts <= since_ts:
+                            newest_at, newest_ts = None, None
+                        # after every shard's rows, so the writer records it last
+                        try:
+                            queue_put(row_queue, ('done', kw, country, newest_at, newest_ts), writer)
+                        except WriterFailed:
+                            incomplete += 1
+                    else:
+                        incomplete += 1
+            if pending:
+                # the writer died: nothing more can be stored, so stop crawling and leave the rest to --resume
+                print(f"[ERROR] Stopping the crawl, rows can no longer be written: {writer.error}", file=sys.stderr)
+                for fut in pending:
+                    fut.cancel()
+    finally:
+        try:
+            queue_put(row_queue, _WRITER_STOP, writer)
+        except WriterFailed:
+            pass
+        writer.join()
+    if writer.error is not None:
+        # rows still queued when it died are lost; crawl_progress only holds what was committed
+        incomplete = len(jobs)
+    elif writer.failed:
+        # crawls that finished fetching but lost a batch: resume refetches from their last checkpoint
+        incomplete += sum(1 for key in writer.failed if jobs.get(key, {}).get('complete'))
+    crawl_seconds = time.perf_counter() - crawl_started
+    metrics.observe('stage_seconds', crawl_seconds, stage='crawl')
+    print(f"[OK] Processed {writer.rows_written} rows in {writer.batches} batches: "
+          f"{writer.inserted} new, {writer.updated} changed, {writer.unchanged} unchanged")
+    if len(countries) > 1:
+        print("[OK] Rows per country: " + ", ".join(f"{c}: {n}" for c, n in queued_by_country.items()))
+
+    # the writer has finished, so this connection is the only one writing again
+    try:
+        if enrich:
+            with metrics.timer('stage_seconds', stage='enrich'):
+                enrich_details(con, client, workers=workers, limit=enrich_limit, max_age_days=enrich_max_age,
+                               metrics=metrics)
+    except Exception as e:
+        print(f"[WARN] Vacancy detail enrichment stopped: {e}", file=sys.stderr)
+    finally:
+        client.close()
+    print(f"[HTTP] {client.stats_line()}")
+
+    # once per run, after every country is in
+    try:
+        with metrics.timer('stage_seconds', stage='classify'):
+            metrics.inc('rows_reclassified_total', mark_student_friendly(con))
         if student_only:
-            prune_non_student_vacancies(con)
+            with metrics.timer('stage_seconds', stage='prune'):
+                prune_non_student_vacancies(con)
     except Exception as e:
         print(f"[WARN] Could not mark/prune student-friendly rows: {e}", file=sys.stderr)
 
+    status = 'incomplete' if incomplete else 'finished'
+    if retain_days or retain_runs:
+        if status != 'finished':
+            print("[WARN] Skipping retention: this run did not finish, so unseen vacancies may still be live",
+                  file=sys.stderr)
+        else:
+            try:
+                with metrics.timer('stage_seconds', stage='retention'):
+                    metrics.inc('rows_expired_total', expire_vacancies(con, retain_days, retain_runs, current_run=run_id))
+            except Exception as e:
+                print(f"[WARN] Retention failed: {e}", file=sys.stderr)
+    if dedupe:
+        try:
+            with metrics.timer('stage_seconds', stage='dedupe'):
+                update_clusters(con, metrics=metrics)
+        except Exception as e:
+            print(f"[WARN] Near-duplicate clustering failed: {e}", file=sys.stderr)
+    if recommend:
+        try:
+            with metrics.timer('stage_seconds', stage='recommend'):
+                update_index(con, recommend_dir, metrics=metrics)
+        except Exception as e:
+            print(f"[WARN] Could not update the recommendation index: {e}", file=sys.stderr)
+    if publish:
+        # an incomplete crawl still only adds and updates rows, so its snapshot is never worse than the last one
+        try:
+            with metrics.timer('stage_seconds', stage='publish'):
+                publish_snapshot(con, publish_dir, prune=publish_prune, keep=publish_keep, run_id=run_id)
+        except Exception as e:
+            print(f"[WARN] Could not publish a snapshot, the previous one stays current: {e}", file=sys.stderr)
+    seconds = time.perf_counter() - started
+    rates_summary = {
+        'pages_per_second': round(metrics.counter('pages_total') / crawl_seconds, 2) if crawl_seconds else None,
+        'items_per_second': round(metrics.counter('items_total') / crawl_seconds, 2) if crawl_seconds else None,
+        'rows_written_per_second': round(writer.rows_written / crawl_seconds, 2) if crawl_seconds else None,
+    }
+    summary = metrics.summary(run_id=run_id, status=status, rates=rates_summary)
+    finish_run(con, run_id, status, summary)
+    try:
+        metrics.write_json(metrics_dir / f"run_{run_id}.json", run_id=run_id, status=status, rates=rates_summary)
+        metrics.write_prometheus(metrics_dir / "hh_pipeline.prom", gauges={
+            'last_run_id': run_id,
+            'last_run_success': int(status == 'finished'),
+            'last_run_timestamp_seconds': int(time.time()),
+            'last_run_duration_seconds': round(seconds, 3),
+            'last_run_items_per_second': rates_summary['items_per_second'] or 0,
+        })
+        print(f"[METRICS] Wrote {metrics_dir / f'run_{run_id}.json'} and {metrics_dir / 'hh_pipeline.prom'}")
+    except OSError as e:
+        print(f"[WARN] Could not write metrics files to {metrics_dir}: {e}", file=sys.stderr)
+    if incomplete:
+        print(f"[WARN] {incomplete} keyword/country crawls did not finish; run with --resume to continue run {run_id}", file=sys.stderr)
     con.close()
     print("[DONE] All keywords processed. DB closed.")
+    return {'run_id': run_id, 'status': status, 'rows': writer.rows_written, 'inserted': writer.inserted,
+            'updated': writer.updated, 'unchanged': writer.unchanged, 'seconds': seconds}
 
 def main():
     parser = argparse.ArgumentParser(description="HH parser -> SQLite pipeline")
     parser.add_argument('--hhData-dir', default=None, help='Directory with keywords or CSV filenames (default: hhData relative to script)')
-    parser.add_argument('--country', default='KZ', help='Country code for HH API (default KZ)')
+    parser.add_argument('--country', default='KZ',
+                        help=f"Country code(s) for HH API: one code, a comma-separated list or 'all' "
+                             f"({', '.join(COUNTRY_CODES)}; default KZ)")
     parser.add_argument('--per-page', type=int, default=100, help='Results per page (max 100)')
-    parser.add_argument('--sleep', type=float, default=0.5, help='Seconds to sleep between page requests')
+    parser.add_argument('--rps', type=float, default=2.0, help='Max HH API requests per second shared by all workers (0 = unlimited)')
+    parser.add_argument('--workers', type=int, default=4, help='Number of concurrent fetch workers')
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows per SQLite write transaction')
+    parser.add_argument('--incremental', action='store_true', help='Only fetch vacancies published since the last crawl of each keyword')
+    parser.add_argument('--resume', action='store_true', help='Continue the last unfinished run from its checkpoints')
+    parser.add_argument('--max-retries', type=int, default=5, help='Retries per HH request on 429/5xx/network errors (exponential backoff)')
+    parser.add_argument('--refresh-rates', action='store_true', help='Update currency_rates from HH before crawling and re-normalise salary_kzt')
+    parser.add_argument('--refresh-areas', action='store_true', help='Load the full HH /areas tree (names, parents, aliases) before crawling')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Full reload: stage rows in a TEMP table and merge them in one transaction at the end, '
+                             'rebuilding indexes and running ANALYZE (needs SQLite >= 3.24)')
+    parser.add_argument('--db-path', default=None, help=f'SQLite database file (default {DB_PATH})')
+    parser.add_argument('--metrics-dir', default=None,
+                        help='Where to write run_<id>.json and the hh_pipeline.prom textfile (default: metrics/ next to the DB)')
+    parser.add_argument('--api-url', default=API_URL, help='HH API base URL (e.g. a local benchmarks/hh_api_stub.py)')
+    parser.add_argument('--enrich', action='store_true',
+                        help='After crawling, fetch full details (/vacancies/{id}) for new and changed vacancies '
+                             'using conditional requests')
+    parser.add_argument('--enrich-limit', type=int, default=ENRICH_LIMIT,
+                        help=f'Max detail requests per run, vacancies without details first (default {ENRICH_LIMIT}; 0 = no limit)')
+    parser.add_argument('--enrich-max-age', type=float, default=None,
+                        help='Also revalidate details last checked more than this many days ago')
+    parser.add_argument('--retain-days', type=float, default=None,
+                        help='After a finished run, delete vacancies not seen for this many days (needs regular full crawls)')
+    parser.add_argument('--retain-runs', type=int, default=None,
+                        help='After a finished run, delete vacancies missing from the last N full (non-incremental) crawls '
+                             'of their country; a keyword dropped from hhData stops re-seeing its vacancies')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='After the run, cluster new and changed vacancies with their near-duplicates (reposts)')
+    parser.add_argument('--recommend', action='store_true',
+                        help='After the run, update the student recommendation index with new and changed vacancies '
+                             '(needs numpy)')
+    parser.add_argument('--recommend-dir', default=None, help=f'Recommendation index directory (default {INDEX_DIR})')
+    parser.add_argument('--publish', action='store_true',
+                        help='After the run, publish a compacted read-only snapshot for the API (see --publish-dir)')
+    parser.add_argument('--publish-dir', default=None, help=f'Where snapshots and the CURRENT pointer live (default {PUBLISH_DIR})')
+    parser.add_argument('--publish-prune', action='store_true', help='Keep only student-friendly vacancies in the snapshot')
+    parser.add_argument('--publish-keep', type=int, default=3, help='Snapshots to keep, including the current one')
+    parser.add_argument('--sleep', type=float, default=None, help='Deprecated: same as --rps 1/SLEEP')
     parser.add_argument('--student-only', action='store_true', help='After parsing mark and prune non-student vacancies (keep only student-friendly)')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND',
+                                     help='Optional: import-csv, publish, dedupe or recommend (without a command the pipeline crawls HH)')
+    import_parser = commands.add_parser('import-csv', help='Seed the DB from hhData/*.csv exports, no API calls')
+    import_parser.add_argument('files', nargs='*', help='CSV files to import (default: every *.csv in the data dir)')
+    # SUPPRESS: when not given here, the value given before the command (or its default) stands
+    import_parser.add_argument('--hhData-dir', default=argparse.SUPPRESS, help='Directory with the CSV exports')
+    import_parser.add_argument('--db-path', default=argparse.SUPPRESS, help=f'SQLite database file (default {DB_PATH})')
+    # the crawl's 500 interleaves writes with fetches; a local import wants big transactions
+    import_parser.add_argument('--batch-size', dest='import_batch_size', metavar='BATCH_SIZE', type=int, default=5000,
+                               help='Rows per SQLite write transaction')
+    publish_parser = commands.add_parser('publish', help='Publish a read-only snapshot of the DB for the API, no API calls')
+    publish_parser.add_argument('--db-path', default=argparse.SUPPRESS, help=f'SQLite database file (default {DB_PATH})')
+    publish_parser.add_argument('--publish-dir', default=argparse.SUPPRESS, help=f'Snapshot directory (default {PUBLISH_DIR})')
+    publish_parser.add_argument('--publish-prune', action='store_true', default=argparse.SUPPRESS,
+                                help='Keep only student-friendly vacancies in the snapshot')
+    publish_parser.add_argument('--publish-keep', type=int, default=argparse.SUPPRESS, help='Snapshots to keep (default 3)')
+    dedupe_parser = commands.add_parser('dedupe', help='Cluster near-duplicate vacancies already in the DB, no API calls')
+    dedupe_parser.add_argument('--db-path', default=argparse.SUPPRESS, help=f'SQLite database file (default {DB_PATH})')
+    dedupe_parser.add_argument('--rebuild', action='store_true', help='Forget previous clusters and re-cluster every vacancy')
+    recommend_parser = commands.add_parser('recommend', help='Update the student recommendation index, no API calls')
+    recommend_parser.add_argument('--db-path', default=argparse.SUPPRESS, help=f'SQLite database file (default {DB_PATH})')
+    recommend_parser.add_argument('--recommend-dir', default=argparse.SUPPRESS, help=f'Index directory (default {INDEX_DIR})')
+    recommend_parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from scratch')
     args = parser.parse_args()
 
     if args.hhData_dir is None:
@@ -382,8 +2830,53 @@ def main():
         data_dir = Path(args.hhData_dir)
         if not data_dir.is_absolute():
             data_dir = SCRIPT_DIR / data_dir
+
+    if args.command == 'import-csv':
+        files = [Path(f) for f in args.files] or csv_files(data_dir)
+        if not files:
+            parser.error(f"no CSV files found in {data_dir}")
+        import_csv(files, db_path=args.db_path, batch_size=args.import_batch_size)
+        return
+    if args.command == 'publish':
+        con = init_db(Path(args.db_path) if args.db_path else DB_PATH)
+        try:
+            publish_snapshot(con, args.publish_dir, prune=args.publish_prune, keep=args.publish_keep)
+        finally:
+            con.close()
+        return
+    if args.command == 'dedupe':
+        con = init_db(Path(args.db_path) if args.db_path else DB_PATH)
+        try:
+            update_clusters(con, rebuild=args.rebuild)
+        finally:
+            con.close()
+        return
+    if args.command == 'recommend':
+        con = init_db(Path(args.db_path) if args.db_path else DB_PATH)
+        try:
+            update_index(con, args.recommend_dir, rebuild=args.rebuild)
+        finally:
+            con.close()
+        return
     
-    fetch_and_store_all(data_dir, args.country, per_page=args.per_page, sleep_sec=args.sleep, student_only=args.student_only)
+    rps = args.rps
+    if args.sleep:
+        rps = 1.0 / args.sleep
+
+    try:
+        countries = parse_countries(args.country)
+    except ValueError as e:
+        parser.error(str(e))
+
+    fetch_and_store_all(data_dir, countries, per_page=args.per_page, rps=rps, workers=args.workers, batch_size=args.batch_size,
+                        incremental=args.incremental, resume=args.resume,
+                        max_retries=args.max_retries, refresh_rates=args.refresh_rates,
+                        refresh_areas_tree=args.refresh_areas, student_only=args.student_only, bulk=args.bulk,
+                        db_path=args.db_path, api_url=args.api_url, metrics_dir=args.metrics_dir,
+                        enrich=args.enrich, enrich_limit=args.enrich_limit or None, enrich_max_age=args.enrich_max_age,
+                        publish=args.publish, publish_dir=args.publish_dir, publish_prune=args.publish_prune,
+                        publish_keep=args.publish_keep, retain_days=args.retain_days, retain_runs=args.retain_runs,
+                        dedupe=args.dedupe, recommend=args.recommend, recommend_dir=args.recommend_dir)
 
 if __name__ == "__main__":
     main()
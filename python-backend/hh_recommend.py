@@ -0,0 +1,454 @@
+"""
+hh_recommend.py
+
+Student -> vacancy recommendations over the student-friendly vacancies of the pipeline DB:
+
+ - every vacancy becomes a hashed TF-IDF vector (title, key skills, requirements,
+   responsibilities, description): words are folded to a 6-letter stem and hashed into
+   2**TERM_BITS buckets, and the row keeps its TERMS_PER_ROW heaviest terms, L2-normalised
+ - the rows live in memory-mapped .npy files under hhData/recommend (term ids, weights,
+   vacancy ids, change keys, document frequencies); every update also writes them out as posting
+   lists (term -> rows, weights), which is all a reader maps besides the frequencies
+ - update_index() (pipeline --recommend or the `recommend` command) only vectorises vacancies
+   that are new or changed since the last update, frees the rows of vacancies that are gone or
+   no longer student-friendly, and rebuilds from scratch once churn has skewed the frequencies
+ - profile_query() turns an SDUClient.gather_profile_payload() dict (program, schedule,
+   transcript) into a query vector; top_k() takes the sparse dot product with every row through
+   the posting lists of the query's terms, so a query costs what its terms match, not the index size
+
+numpy is optional for the pipeline (the stage is skipped without it) but required here.
+
+Usage: python hh_recommend.py profile.json [-k 20] [--db-path ...] [--index-dir ...]
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+
+from hh_metrics import Metrics
+
+# optional: without numpy the pipeline skips the index and recommendations are unavailable
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+INDEX_DIR = SCRIPT_DIR / "hhData" / "recommend"
+INDEX_VERSION = 1
+
+TERM_BITS = 20
+TERMS_PER_ROW = 48
+STEM_LENGTH = 6
+# vacancy fields and how much a word in each counts
+FIELD_WEIGHTS = (('title', 3.0), ('key_skills', 2.0), ('requirements', 1.0), ('responsibilities', 1.0),
+                 ('description', 1.0))
+# rebuild once replaced or removed rows exceed this share of the index: document frequencies
+# only ever grow in between (a replaced vacancy's old terms are not subtracted)
+REBUILD_CHURN = 0.5
+
+_WORD_RE = re.compile(r"[^\W\d_]{2,}")
+_TAG_RE = re.compile(r"<[^>]+>")
+_SCRIPT_RE = re.compile(r"<(script|style)\b.*?</\1>", re.S | re.I)
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is not installed: pip install numpy to build or query the recommendation index")
+
+
+def terms(text):
+    """
+    Hashed term ids of a text: lowercase words of 2+ letters, ё folded to е, cut to STEM_LENGTH
+    letters so "разработчик"/"разработка" and "programming"/"programmer" share a term.
+    """
+    mask = (1 << TERM_BITS) - 1
+    return [zlib.crc32(w[:STEM_LENGTH].encode("utf-8")) & mask
+            for w in _WORD_RE.findall((text or "").lower().replace("ё", "е"))]
+
+
+def html_text(value):
+    """
+    Visible text of an HTML page (the SDU transcript print view), tags and scripts dropped.
+    """
+    return html.unescape(_TAG_RE.sub(" ", _SCRIPT_RE.sub(" ", value or "")))
+
+
+def idf(df, docs):
+    return np.log((1.0 + docs) / (1.0 + df)).astype(np.float32) + 1.0
+
+
+def weigh(counts, df, docs, limit=None):
+    """
+    {term: weighted count} -> (term ids, L2-normalised (1 + log tf) * idf weights), heaviest
+    first, at most limit terms.
+    """
+    if not counts:
+        return np.zeros(0, np.int32), np.zeros(0, np.float32)
+    ids = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    weights = (1.0 + np.log(tf)) * idf(df[ids], docs)
+    order = np.argsort(-weights, kind="stable")[:limit]
+    ids, weights = ids[order], weights[order]
+    norm = float(np.sqrt(np.dot(weights, weights)))
+    return ids, weights / norm if norm else weights
+
+
+def _allocate(path, dtype, shape, data=None):
+    """
+    New zeroed .npy file at path (with data copied to its start), swapped in with os.replace:
+    a reader that mapped the old file keeps a valid mapping instead of a truncated one.
+    """
+    tmp = path.with_name(f".{path.stem}.{os.getpid()}.npy")
+    array = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+    if data is not None:
+        array[:len(data)] = data
+    array.flush()
+    del array
+    os.replace(tmp, path)
+
+
+def _change_key(vacancy_hash, details_hash):
+    digest = hashlib.blake2b(f"{vacancy_hash}|{details_hash}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True) or 1
+
+
+class RecommendIndex:
+    """
+    The memory-mapped index: row i of terms/weights is the vector of vacancy ids[i]
+    (0 = free row), keys[i] the change key it was built from; df and the counts in
+    meta.json cover every vector added since the last full build.
+
+    The row arrays are the writer's and are changed in place; save() publishes them as
+    posting lists: the entries of term t are postings_ptr[t]:postings_ptr[t + 1] of
+    postings_rows/postings_weights, and postings_ids maps a row to its vacancy.
+    """
+    ARRAYS = {
+        'ids': ('<i8', ()),
+        'keys': ('<i8', ()),
+        'terms': ('<i4', (TERMS_PER_ROW,)),
+        'weights': ('<f4', (TERMS_PER_ROW,)),
+    }
+    POSTINGS = ('postings_ptr', 'postings_rows', 'postings_weights', 'postings_ids')
+
+    def __init__(self, index_dir, meta, writable=False):
+        self.dir = Path(index_dir)
+        self.meta = meta
+        if writable:
+            for name in self.ARRAYS:
+                setattr(self, name, np.load(self.dir / f"{name}.npy", mmap_mode='r+'))
+        self.df = np.load(self.dir / "df.npy", mmap_mode='r+' if writable else 'r')
+        if not writable:
+            # a writer maps the posting lists once save() has written them
+            self._load_postings()
+
+    def _load_postings(self):
+        for name in self.POSTINGS:
+            setattr(self, name, np.load(self.dir / f"{name}.npy", mmap_mode='r'))
+
+    @classmethod
+    def open(cls, index_dir=None, writable=False):
+        """
+        The index in index_dir (default INDEX_DIR), or None when there is none (or it was
+        built with other settings).
+        """
+        _require_numpy()
+        index_dir = Path(index_dir) if index_dir else INDEX_DIR
+        try:
+            meta = json.loads((index_dir / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if (meta.get('version'), meta.get('term_bits'), meta.get('terms_per_row')) != \
+                (INDEX_VERSION, TERM_BITS, TERMS_PER_ROW):
+            return None
+        return cls(index_dir, meta, writable)
+
+    @classmethod
+    def create(cls, index_dir=None, capacity=1024):
+        _require_numpy()
+        index_dir = Path(index_dir) if index_dir else INDEX_DIR
+        index_dir.mkdir(parents=True, exist_ok=True)
+        # readers see no index while it is rebuilt, never the old row count over new arrays
+        (index_dir / "meta.json").unlink(missing_ok=True)
+        for name, (dtype, shape) in cls.ARRAYS.items():
+            _allocate(index_dir / f"{name}.npy", dtype, (capacity, *shape))
+        _allocate(index_dir / "df.npy", '<i4', (1 << TERM_BITS,))
+        meta = {'version': INDEX_VERSION, 'term_bits': TERM_BITS, 'terms_per_row': TERMS_PER_ROW,
+                'rows': 0, 'docs': 0, 'churn': 0, 'built_at': time.time(), 'updated_at': time.time()}
+        index = cls(index_dir, meta, writable=True)
+        index.save()
+        return index
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def grow(self, capacity):
+        """
+        Reallocate the row arrays with room for capacity rows; a reader keeps its mapping of
+        the old files until it reopens.
+        """
+        for name, (dtype, shape) in self.ARRAYS.items():
+            _allocate(self.dir / f"{name}.npy", dtype, (capacity, *shape), getattr(self, name))
+            setattr(self, name, np.load(self.dir / f"{name}.npy", mmap_mode='r+'))
+
+    def _write_postings(self):
+        """
+        Regroup the live entries of the row arrays by term, each file swapped in whole: a
+        reader never sees a row the writer is halfway through.
+        """
+        rows = self.rows
+        terms_, weights = self.terms[:rows].reshape(-1), self.weights[:rows].reshape(-1)
+        # padding and freed rows have weight 0
+        live = np.flatnonzero(weights)
+        live = live[np.argsort(terms_[live], kind='stable')]
+        ptr = np.zeros((1 << TERM_BITS) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms_[live], minlength=1 << TERM_BITS), out=ptr[1:])
+        postings = {
+            'postings_ptr': ptr,
+            'postings_rows': (live // TERMS_PER_ROW).astype(np.int32),
+            'postings_weights': weights[live],
+            'postings_ids': np.asarray(self.ids[:rows]),
+        }
+        for name, data in postings.items():
+            # a zero-length .npy cannot be mapped
+            _allocate(self.dir / f"{name}.npy", data.dtype.str, (max(1, len(data)),), data)
+        self._load_postings()
+
+    def save(self):
+        for name in (*self.ARRAYS, 'df'):
+            getattr(self, name).flush()
+        self._write_postings()
+        self.meta['updated_at'] = time.time()
+        tmp = self.dir / f".meta.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(self.meta), encoding="utf-8")
+        os.replace(tmp, self.dir / "meta.json")
+
+
+def _documents(conn: sqlite3.Connection, ids, chunk_size):
+    """
+    (vacancy_id, {term: weighted count}) for ids, chunk_size vacancies per query.
+    """
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        cur = conn.execute(f"""
+            SELECT v.id, v.title, d.key_skills, v.requirements, v.responsibilities, d.description
+            FROM vacancies v LEFT JOIN vacancy_details d ON d.vacancy_id = v.id
+            WHERE v.id IN ({",".join("?" for _ in chunk)});
+        """, chunk)
+        for vid, *fields in cur:
+            counts = Counter()
+            for (_, weight), text in zip(FIELD_WEIGHTS, fields):
+                for term in terms(text):
+                    counts[term] += weight
+            yield vid, counts
+
+
+def update_index(conn: sqlite3.Connection, index_dir=None, rebuild=False, chunk_size=2000, metrics=None):
+    """
+    Bring the index in index_dir (default INDEX_DIR) in line with the student-friendly
+    vacancies in conn: vectorise new and changed ones (vacancy or details content_hash),
+    free the rows of the rest. Rebuilds from scratch with rebuild=True, when there is no
+    index yet, or when churn passed REBUILD_CHURN. Returns counts: added, updated, removed, rows.
+    """
+    _require_numpy()
+    metrics = metrics if metrics is not None else Metrics()
+    started = time.perf_counter()
+    index = None if rebuild else RecommendIndex.open(index_dir, writable=True)
+    if index is not None and index.meta['churn'] > REBUILD_CHURN * max(1, index.meta['docs']):
+        print(f"[RECOMMEND] {index.meta['churn']} rows replaced since the last full build, rebuilding.")
+        index = None
+    if index is None:
+        index = RecommendIndex.create(index_dir)
+
+    current = {vid: _change_key(vhash, dhash) for vid, vhash, dhash in conn.execute("""
+        SELECT v.id, v.content_hash, d.content_hash FROM vacancies v
+        LEFT JOIN vacancy_details d ON d.vacancy_id = v.id
+        WHERE v.student_friendly = 1;
+    """)}
+    used = np.flatnonzero(index.ids[:index.rows])
+    indexed = dict(zip(index.ids[used].tolist(), zip(used.tolist(), index.keys[used].tolist())))
+
+    gone = [row for vid, (row, _) in indexed.items() if vid not in current]
+    index.ids[gone] = 0
+    index.weights[gone] = 0
+    stale = [vid for vid, key in current.items() if vid not in indexed or indexed[vid][1] != key]
+    counts = {'added': sum(vid not in indexed for vid in stale), 'updated': 0, 'removed': len(gone)}
+    counts['updated'] = len(stale) - counts['added']
+
+    # two passes over the text: every vector is weighed with the frequencies of this update
+    # included, instead of whatever the chunks before it had added
+    with metrics.timer('recommend_seconds', phase='df'):
+        for _, doc in _documents(conn, stale, chunk_size):
+            index.df[np.fromiter(doc.keys(), dtype=np.int64, count=len(doc))] += 1
+            index.meta['docs'] += 1
+    # lowest free row last: pop() fills the holes from the front
+    free = np.flatnonzero(index.ids[:index.rows] == 0).tolist()[::-1]
+    with metrics.timer('recommend_seconds', phase='vectors'):
+        for vid, doc in _documents(conn, stale, chunk_size):
+            if vid in indexed:
+                row = indexed[vid][0]
+                index.meta['churn'] += 1
+            elif free:
+                row = free.pop()
+            else:
+                row = index.rows
+                if row >= len(index.ids):
+                    index.grow(max(1024, 2 * len(index.ids)))
+                index.meta['rows'] += 1
+            ids, weights = weigh(doc, index.df, index.meta['docs'], TERMS_PER_ROW)
+            index.terms[row] = 0
+            index.weights[row] = 0
+            index.terms[row, :len(ids)] = ids
+            index.weights[row, :len(ids)] = weights
+            index.ids[row] = vid
+            index.keys[row] = current[vid]
+    index.meta['churn'] += len(gone)
+    index.save()
+    counts['rows'] = len(current)
+    for key in ('added', 'updated', 'removed'):
+        metrics.inc(f'recommend_{key}_total', counts[key])
+    print(f"[RECOMMEND] Index {index.dir}: {counts['added']} added, {counts['updated']} updated, "
+          f"{counts['removed']} removed, {counts['rows']} vacancies ({time.perf_counter() - started:.1f}s)")
+    return counts
+
+
+_cached = {}
+
+
+def cached_index(index_dir=None):
+    """
+    RecommendIndex.open() for long-running readers (the Flask app): the mapping is reused
+    until meta.json changes, i.e. until the pipeline updates the index. None without an
+    index or without numpy.
+    """
+    if np is None:
+        return None
+    meta = (Path(index_dir) if index_dir else INDEX_DIR) / "meta.json"
+    try:
+        stamp = meta.stat().st_mtime_ns
+    except OSError:
+        return None
+    hit = _cached.get(meta)
+    if hit is None or hit[0] != stamp:
+        hit = _cached[meta] = (stamp, RecommendIndex.open(index_dir))
+    return hit[1]
+
+
+def profile_texts(profile):
+    """
+    (text, weight) pairs of an SDUClient.gather_profile_payload() dict: the program counts
+    most, then this term's courses, then everything on the transcript.
+    """
+    courses = {lesson.get("course_title") for lessons in (profile.get("schedule") or {}).values()
+               for lesson in lessons or [] if lesson.get("course_title")}
+    return [(profile.get("program_class"), 3.0),
+            (" ".join(sorted(courses)), 2.0),
+            (html_text(profile.get("transcript_print_html")), 1.0)]
+
+
+def profile_query(index: RecommendIndex, profile):
+    """
+    Query vector (term ids, weights) of a student profile, weighted by the index's IDF.
+    """
+    counts = Counter()
+    for text, weight in profile_texts(profile):
+        for term in terms(text):
+            counts[term] += weight
+    return weigh(counts, index.df, index.meta['docs'])
+
+
+def top_k(index: RecommendIndex, query, k=20):
+    """
+    [(vacancy_id, score)] of the k rows with the highest cosine score for query (from
+    profile_query), best first; rows sharing no term with the query are left out. Every
+    query term adds its weight times the posting weights to the rows in its posting list.
+    """
+    ids, weights = query
+    if not len(ids):
+        return []
+    starts = index.postings_ptr[ids].tolist()
+    stops = index.postings_ptr[ids.astype(np.int64) + 1].tolist()
+    rows = np.concatenate([index.postings_rows[a:b] for a, b in zip(starts, stops)])
+    if not len(rows):
+        return []
+    products = np.concatenate([index.postings_weights[a:b] * w
+                               for a, b, w in zip(starts, stops, weights.tolist())])
+    scores = np.bincount(rows, products)
+    hits = np.flatnonzero(scores > 0)
+    if len(hits) > k:
+        hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+    hits = hits[np.argsort(-scores[hits], kind="stable")]
+    return [(int(index.postings_ids[i]), float(scores[i])) for i in hits]
+
+
+def recommend(conn: sqlite3.Connection, profile, k=20, index=None, index_dir=None):
+    """
+    Top k vacancies for a student profile as dicts (id, url, title, employer, city, publish_date,
+    salary, score), best first, one per cluster of reposts (vacancies.cluster_id, see hh_dedupe.py).
+    [] when there is no index yet.
+    """
+    index = index if index is not None else RecommendIndex.open(index_dir)
+    if index is None:
+        return []
+    # headroom for reposts of the same vacancy, which score alike
+    ranked = top_k(index, profile_query(index, profile), 4 * k)
+    if not ranked:
+        return []
+    cur = conn.execute(f"""
+        SELECT id, url, title, employer, city, publish_date, salary, cluster_id FROM vacancies
+        WHERE id IN ({",".join("?" for _ in ranked)});
+    """, [vid for vid, _ in ranked])
+    columns = [c[0] for c in cur.description]
+    found = {row[0]: dict(zip(columns, row)) for row in cur}
+    results, clusters = [], set()
+    for vid, score in ranked:
+        # a vacancy deleted since the last index update is simply skipped
+        item = found.get(vid)
+        if item is None:
+            continue
+        cluster = item.pop('cluster_id')
+        if cluster in clusters:
+            continue
+        clusters.add(cluster)
+        results.append(dict(item, score=round(score, 4)))
+        if len(results) == k:
+            break
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Top vacancies for a saved SDU profile payload")
+    parser.add_argument('profile', help='JSON file from SDUClient.gather_profile_payload()')
+    parser.add_argument('-k', type=int, default=20, help='Number of vacancies')
+    parser.add_argument('--db-path', default=str(SCRIPT_DIR / "hhData" / "vacancies.db"), help='SQLite database file')
+    parser.add_argument('--index-dir', default=None, help=f'Recommendation index (default {INDEX_DIR})')
+    args = parser.parse_args()
+
+    profile = json.loads(Path(args.profile).read_text(encoding="utf-8"))
+    index = RecommendIndex.open(args.index_dir)
+    if index is None:
+        parser.error("no recommendation index yet: run hh_pipeline_sqlite.py recommend first")
+    conn = sqlite3.connect(f"file:{args.db_path}?mode=ro", uri=True)
+    try:
+        started = time.perf_counter()
+        results = recommend(conn, profile, k=args.k, index=index)
+        print(f"[RECOMMEND] {len(results)} vacancies in {1000 * (time.perf_counter() - started):.1f} ms",
+              file=sys.stderr)
+        for item in results:
+            print(f"{item['score']:.3f}  {item['title']} — {item['employer']} ({item['city']})  {item['url']}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
-from flask import Flask, request, Response
+import sqlite3
+
+from flask import Flask, request, Response, jsonify
 from sdu_client import SDUClient
+from hh_recommend import SCRIPT_DIR, cached_index, recommend
+
+DB_PATH = SCRIPT_DIR / "hhData" / "vacancies.db"
 
 app = Flask(__name__)
 
@@ -42,5 +47,30 @@ def get_user_data():
     return user_data
 
 
+@app.route("/recommend-jobs", methods=["POST"])
+def recommend_jobs():
+    student_id = request.form.get("student_id")
+    password = request.form.get("password")
+    k = request.form.get("k", default=20, type=int)
+
+    if not student_id or not password:
+        return Response("Missing student_id or password", status=400)
+
+    index = cached_index()
+    if index is None:
+        return Response("Recommendations are not built yet", status=503)
+
+    client = SDUClient()
+    user_data = client.gather_profile_payload(student_id, password, normalize_phone=True)
+
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        vacancies = recommend(conn, user_data, k=max(1, min(k, 100)), index=index)
+    finally:
+        conn.close()
+
+    return jsonify(vacancies)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
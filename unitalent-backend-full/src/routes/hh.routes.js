@@ -7,13 +7,41 @@ import fs from "fs";
 const router = Router();
 const __dirname = path.dirname(url.fileURLToPath(import.meta.url));
 
+// Snapshots published by hh_pipeline_sqlite.py --publish: compacted, read-only copies the
+// pipeline never writes to. CURRENT names the live one and is swapped atomically; it may
+// only appear after the API started, so it is looked for again on every check.
+const snapshotDirs = [
+  process.env.HH_SNAPSHOT_DIR,
+  path.resolve(process.cwd(), "../python-backend/hhData/published"),
+  path.resolve(__dirname, "../../../python-backend/hhData/published"),
+].filter(Boolean);
+// how often a request may look at CURRENT for a newer snapshot
+const SNAPSHOT_CHECK_MS = 5000;
+
+// The pipeline's working DB, used when nothing has been published yet.
 const candidates = [
   process.env.HH_SQLITE_PATH,
   path.resolve(process.cwd(), "../python-backend/hhData/vacancies.db"),
   path.resolve(__dirname, "../../../python-backend/hhData/vacancies.db"),
 ].filter(Boolean);
 
-const dbPath = candidates.find((p) => fs.existsSync(p));
+const currentSnapshotPath = () => {
+  const snapshotDir = snapshotDirs.find((dir) => fs.existsSync(path.join(dir, "CURRENT")));
+  if (!snapshotDir) return null;
+  try {
+    const name = fs.readFileSync(path.join(snapshotDir, "CURRENT"), "utf8").trim();
+    const file = name && path.join(snapshotDir, name);
+    return file && fs.existsSync(file) ? file : null;
+  } catch {
+    return null;
+  }
+};
+
+// HH_SQLITE_PATH pins one file; otherwise the current snapshot wins over the working DB.
+const followSnapshots = !process.env.HH_SQLITE_PATH;
+const dbPath =
+  (followSnapshots && currentSnapshotPath()) ||
+  candidates.find((p) => fs.existsSync(p));
 
 if (!dbPath) {
   throw new Error(
@@ -21,86 +49,277 @@ if (!dbPath) {
   );
 }
 
-const db = new Database(dbPath, { readonly: true, fileMustExist: true });
+// Open a DB and detect what the pipeline version that built it maintains (older DBs may lack tables).
+const openHhDb = (file) => {
+  const db = new Database(file, { readonly: true, fileMustExist: true });
+  const hasTable = (name) =>
+    !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = ?").get(name);
+  const vacancyColumns = new Set(
+    db.prepare("PRAGMA table_info(vacancies)").all().map((c) => c.name)
+  );
+  // epoch column + (student_friendly, published_ts DESC, id DESC) index; datetime(publish_date) can't use an index
+  const hasPublishedTs = vacancyColumns.has("published_ts");
+  // City -> HH area ids through the pipeline's alias table (Latin/Cyrillic/old names).
+  const hasAreas = hasTable("area_aliases") && vacancyColumns.has("area_id");
+  return {
+    file,
+    db,
+    hasFts: hasTable("vacancies_fts"),
+    hasKeywordMap: hasTable("vacancy_keywords"),
+    hasSalaryColumns: vacancyColumns.has("salary_kzt"),
+    hasPublishedTs,
+    // near-duplicate clusters (pipeline --dedupe): reposts share cluster_id, every vacancy has one
+    hasClusters: hasPublishedTs && vacancyColumns.has("cluster_id"),
+    // cluster_head = 1 on the member of each cluster a collapsed listing shows
+    hasClusterHeads: vacancyColumns.has("cluster_head"),
+    byDateDesc: hasPublishedTs
+      ? "vacancies.published_ts DESC, vacancies.id DESC"
+      : "datetime(publish_date) DESC",
+    lookupAreaIds: hasAreas
+      ? db.prepare("SELECT DISTINCT area_id FROM area_aliases WHERE alias = ?")
+      : null,
+  };
+};
+
+let hh = openHhDb(dbPath);
+let snapshotCheckedAt = Date.now();
+
+// Switch to a newly published snapshot. better-sqlite3 is synchronous, so no query is
+// running on the old handle when it is closed here.
+const currentDb = () => {
+  if (!followSnapshots || Date.now() - snapshotCheckedAt < SNAPSHOT_CHECK_MS) {
+    return hh;
+  }
+  snapshotCheckedAt = Date.now();
+  const file = currentSnapshotPath();
+  if (file && file !== hh.file) {
+    try {
+      const previous = hh;
+      hh = openHhDb(file);
+      previous.db.close();
+      console.log(`HH jobs: switched to snapshot ${path.basename(file)}`);
+    } catch (e) {
+      console.error("HH jobs: could not open new snapshot, keeping the current one", e);
+    }
+  }
+  return hh;
+};
+
+// must match normalize_alias() in hh_pipeline_sqlite.py
+const normalizeAlias = (text) =>
+  String(text)
+    .toLocaleLowerCase("ru-RU")
+    .replace(/ё/g, "е")
+    .split(/\s+/)
+    .filter(Boolean)
+    .join(" ");
+
+// Keyset cursor for the date-ordered listing: "<published_ts>:<id>" of the last item returned.
+const parseCursor = (value) => {
+  const m = /^(-?\d+):(\d+)$/.exec(String(value || ""));
+  return m ? { ts: Number(m[1]), id: Number(m[2]) } : null;
+};
+
+// User text -> FTS5 query: every word must match as a prefix ("разраб" finds "разработчик").
+// The index stores ё as е, so the query has to fold it the same way.
+const toFtsQuery = (text) => {
+  const words =
+    String(text)
+      .toLocaleLowerCase("ru-RU")
+      .replace(/ё/g, "е")
+      .match(/[\p{L}\p{N}]+/gu) || [];
+  return words
+    .slice(0, 8)
+    .map((w) => `"${w}"*`)
+    .join(" ");
+};
 
 router.get("/hh-jobs", (req, res) => {
   try {
-    const { q, city } = req.query;
+    const {
+      db,
+      hasFts,
+      hasKeywordMap,
+      hasSalaryColumns,
+      hasPublishedTs,
+      hasClusters,
+      hasClusterHeads,
+      byDateDesc,
+      lookupAreaIds,
+    } = currentDb();
+    const { q, city, keyword, sort } = req.query;
+    // one item per cluster of reposts (its newest matching member) unless ?duplicates=1
+    const collapse = hasClusters && req.query.duplicates !== "1";
+    const cursor = hasPublishedTs ? parseCursor(req.query.cursor) : null;
+    const minSalary = Number(req.query.minSalary) || 0;
     const limit = Math.max(1, Math.min(Number(req.query.limit) || 20, 100));
     const page = Math.max(1, Number(req.query.page) || 1);
     const offset = (page - 1) * limit;
 
     const where = [];
     const params = [];
+    let from = "vacancies";
+    let orderBy = byDateDesc;
 
     where.push("student_friendly = 1");
 
-    if (q) {
+    const ftsQuery = q && hasFts ? toFtsQuery(q) : "";
+    if (ftsQuery) {
+      // indexed search over title/requirements/responsibilities/employer, best bm25 match first
+      from = "vacancies_fts JOIN vacancies ON vacancies.id = vacancies_fts.rowid";
+      where.push("vacancies_fts MATCH ?");
+      params.push(ftsQuery);
+      orderBy = `vacancies_fts.rank, ${byDateDesc}`;
+    } else if (q) {
       where.push("(lower(title) LIKE ? OR lower(requirements) LIKE ?)");
       params.push(`%${q.toLowerCase()}%`, `%${q.toLowerCase()}%`);
     }
+    if (keyword) {
+      if (hasKeywordMap) {
+        where.push(`vacancies.id IN (
+          SELECT vk.vacancy_id FROM vacancy_keywords vk
+          JOIN keywords k ON k.id = vk.keyword_id
+          WHERE k.keyword = ?
+        )`);
+        params.push(String(keyword).trim());
+      } else {
+        where.push("(';' || job_keyword || ';') LIKE ?");
+        params.push(`%;${String(keyword).trim()};%`);
+      }
+    }
+    if (hasSalaryColumns && minSalary > 0) {
+      // salary_kzt: lower bound of the offer normalised to KZT by the pipeline
+      where.push("salary_kzt >= ?");
+      params.push(minSalary);
+    }
+    if (hasSalaryColumns && sort === "salary") {
+      orderBy = `salary_kzt DESC, ${byDateDesc}`;
+    }
     if (city) {
-      const cityInputRaw = String(city).trim();
-      const cityInput = cityInputRaw.toLocaleLowerCase("ru-RU");
-
-      const cityAliases = {
-        almaty: ["алматы"],
-        almaata: ["алматы"], // common typo
-        astana: ["астана", "нур-султан"],
-        nursultan: ["нур-султан"],
-        shymkent: ["шымкент"],
-        karaganda: ["караганда"],
-        karagandy: ["караганда"],
-        kostanay: ["костанай"],
-        kostanai: ["костанай"],
-        aktobe: ["актобе"],
-        aktobe: ["актобе"],
-        kyzylorda: ["кызылорда"],
-        turkestan: ["туркестан"],
-        turkistan: ["туркестан"],
-        ekibastuz: ["экибастуз"],
-        ekibastus: ["экибастуз"],
-        kokshetau: ["кокшетау"],
-        kokshetav: ["кокшетау"],
-        pavlodar: ["павлодар"],
-        petropavlovsk: ["петропавловск"],
-        aktau: ["актау"],
-        semey: ["семей"],
-        semei: ["семей"],
-        zhezkazgan: ["жезказган"],
-        zhezqazgan: ["жезказган"],
-        taraz: ["тараз"]
-      };
-
-      const variants = new Set([cityInput]);
-      cityAliases[cityInput]?.forEach((v) => variants.add(v));
-      const capitalize = (s) =>
-        s ? s.charAt(0).toLocaleUpperCase("ru-RU") + s.slice(1) : s;
-      Array.from([...variants]).forEach((v) => variants.add(capitalize(v)));
-      variants.add(cityInputRaw);
-
-      const cityWhere = Array.from(variants)
-        .map(() => "city LIKE ?")
-        .join(" OR ");
-
-      where.push(`(${cityWhere})`);
-      Array.from(variants).forEach((v) => params.push(`%${v}%`));
+      const areaIds = lookupAreaIds
+        ? lookupAreaIds.all(normalizeAlias(city)).map((r) => r.area_id)
+        : [];
+      if (areaIds.length) {
+        // known city: indexed equality on area_id
+        where.push(`vacancies.area_id IN (${areaIds.map(() => "?").join(", ")})`);
+        params.push(...areaIds);
+      } else {
+        const cityInputRaw = String(city).trim();
+        const cityInput = cityInputRaw.toLocaleLowerCase("ru-RU");
+
+        const cityAliases = {
+          almaty: ["алматы"],
+          almaata: ["алматы"], // common typo
+          astana: ["астана", "нур-султан"],
+          nursultan: ["нур-султан"],
+          shymkent: ["шымкент"],
+          karaganda: ["караганда"],
+          karagandy: ["караганда"],
+          kostanay: ["костанай"],
+          kostanai: ["костанай"],
+          aktobe: ["актобе"],
+          aktobe: ["актобе"],
+          kyzylorda: ["кызылорда"],
+          turkestan: ["туркестан"],
+          turkistan: ["туркестан"],
+          ekibastuz: ["экибастуз"],
+          ekibastus: ["экибастуз"],
+          kokshetau: ["кокшетау"],
+          kokshetav: ["кокшетау"],
+          pavlodar: ["павлодар"],
+          petropavlovsk: ["петропавловск"],
+          aktau: ["актау"],
+          semey: ["семей"],
+          semei: ["семей"],
+          zhezkazgan: ["жезказган"],
+          zhezqazgan: ["жезказган"],
+          taraz: ["тараз"]
+        };
+
+        const variants = new Set([cityInput]);
+        cityAliases[cityInput]?.forEach((v) => variants.add(v));
+        const capitalize = (s) =>
+          s ? s.charAt(0).toLocaleUpperCase("ru-RU") + s.slice(1) : s;
+        Array.from([...variants]).forEach((v) => variants.add(capitalize(v)));
+        variants.add(cityInputRaw);
+
+        const cityWhere = Array.from(variants)
+          .map(() => "city LIKE ?")
+          .join(" OR ");
+
+        where.push(`(${cityWhere})`);
+        Array.from(variants).forEach((v) => params.push(`%${v}%`));
+      }
     }
 
+    // Unfiltered, the cluster heads are exactly the collapsed listing: a range scan of the
+    // partial idx_student_head index instead of grouping every student vacancy per page.
+    // A filter may match another member than the head, so filtered queries still GROUP BY.
+    const heads = collapse && hasClusterHeads && where.length === 1;
+    const group = collapse && !heads;
+    if (heads) where.push("vacancies.cluster_head = 1");
+
     const whereSql = where.length ? `WHERE ${where.join(" AND ")}` : "";
 
+    // Deep pages: seek past the cursor instead of OFFSET-skipping rows (date order only).
+    // Collapsed, the cursor applies to each cluster's newest member: SQLite takes the bare
+    // columns of a group (id, title, ...) from the row that holds max(published_ts).
+    const useCursor = cursor && orderBy === byDateDesc;
+    const pageWhereSql =
+      useCursor && !group
+        ? `${whereSql ? `${whereSql} AND` : "WHERE"} (vacancies.published_ts, vacancies.id) < (?, ?)`
+        : whereSql;
+    // (student_friendly, cluster_id, published_ts) index: groups come straight off the index
+    const groupSql = group
+      ? `GROUP BY vacancies.cluster_id${
+          useCursor
+            ? ` HAVING (max(vacancies.published_ts), vacancies.id) < (?, ?)`
+            : ""
+        }`
+      : "";
+    const pageParams = useCursor
+      ? [...params, cursor.ts, cursor.id, limit, 0]
+      : [...params, limit, offset];
+
     const baseSelect = `
-      SELECT id, url, title, employer, city, publish_date, salary, requirements, responsibilities, job_keyword
-      FROM vacancies
-      ${whereSql}
-      ORDER BY datetime(publish_date) DESC
+      SELECT vacancies.id, vacancies.url, vacancies.title, vacancies.employer, vacancies.city,
+             vacancies.publish_date, vacancies.salary, vacancies.requirements,
+             vacancies.responsibilities, vacancies.job_keyword${
+               group
+                 ? ", max(vacancies.published_ts) AS published_ts, count(*) - 1 AS duplicates"
+                 : heads
+                 ? `, vacancies.published_ts, (
+                     SELECT count(*) - 1 FROM vacancies AS member
+                     WHERE member.student_friendly = 1 AND member.cluster_id = vacancies.cluster_id
+                   ) AS duplicates`
+                 : hasPublishedTs
+                 ? ", vacancies.published_ts"
+                 : ""
+             }${
+               hasSalaryColumns
+                 ? ", vacancies.salary_from, vacancies.salary_to, vacancies.salary_currency, vacancies.salary_kzt"
+                 : ""
+             }
+      FROM ${from}
+      ${pageWhereSql}
+      ${groupSql}
+      ORDER BY ${orderBy}
       LIMIT ? OFFSET ?
     `;
 
-    const list = db.prepare(baseSelect).all(...params, limit, offset);
+    const list = db.prepare(baseSelect).all(...pageParams);
+    const last = list[list.length - 1];
+    const nextCursor =
+      hasPublishedTs && orderBy === byDateDesc && last && list.length === limit
+        ? `${last.published_ts}:${last.id}`
+        : null;
 
     const totalRow = db
-      .prepare(`SELECT COUNT(*) as cnt FROM vacancies ${whereSql}`)
+      .prepare(
+        `SELECT ${
+          group ? "COUNT(DISTINCT vacancies.cluster_id)" : "COUNT(*)"
+        } as cnt FROM ${from} ${whereSql}`
+      )
       .get(...params);
     const total = totalRow?.cnt || 0;
     const totalPages = Math.max(1, Math.ceil(total / limit));
@@ -111,6 +330,7 @@ router.get("/hh-jobs", (req, res) => {
       page,
       totalPages,
       limit,
+      nextCursor,
     });
   } catch (e) {
     console.error("GET /api/hh-jobs error", e);